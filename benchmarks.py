@@ -0,0 +1,491 @@
+"""El archivo benchmarks.py agrupa mediciones de rendimiento de la capa de datos.
+    Cada benchmark trabaja sobre una carpeta temporal (ver db.set_db_dir), nunca sobre ./data.
+    Uso: python benchmarks.py [nombre del benchmark]
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import db
+import ledger
+import importer
+import service
+import numpy_backend
+
+
+def _fresh_db(tmp_dir):
+    '''
+    Apunta db.py a tmp_dir, crea las colecciones vacías y un usuario "bench" para cargar movimientos.
+    '''
+    db.set_db_dir(tmp_dir)
+    db.ensure_db_files()
+    db.users_insert({
+        "name": "bench",
+        "password": "123456",
+        "age": 30,
+        "genre": "X",
+        "role": "user"
+    })
+
+
+def bench_writes(n=500, window_ms=5):
+    '''
+    Mide inserciones por segundo de incomes_insert con escrituras inmediatas
+    y con group commit de window_ms milisegundos.
+    '''
+    original_dir = db.DB_DIR
+    print(f"\nEscrituras: {n} incomes_insert por corrida")
+    for label, window in (("sin batching", 0), (f"group commit {window_ms} ms", window_ms)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _fresh_db(tmp_dir)
+            db.GROUP_COMMIT_MS = window
+            start = time.perf_counter()
+            for i in range(n):
+                db.incomes_insert({
+                    "amount": float(i + 1),
+                    "category": "Salario",
+                    "date": "01/01/2024",
+                    "user": "bench"
+                })
+            db.flush_pending_writes()
+            elapsed = time.perf_counter() - start
+            db.GROUP_COMMIT_MS = 0
+        print(f"- {label:<22} {n / elapsed:10.1f} escrituras/s")
+    db.set_db_dir(original_dir)
+
+
+def _sample_movements(n, users=50):
+    '''
+    Devuelve n egresos de prueba repartidos entre users usuarios y las categorías de db.expense_categories.
+    '''
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": str(i + 1),
+            "amount": float(i % 1000) + 0.5,
+            "category": db.expense_categories[i % len(db.expense_categories)],
+            "date": f"{(i % 28) + 1:02d}/{(i % 12) + 1:02d}/{2015 + (i % 10)}",
+            "user": f"user{i % users}"
+        })
+    return rows
+
+
+def bench_binary(n=200000):
+    '''
+    Compara el tiempo de un arranque en frío (abrir y sumar todos los montos) entre
+    json.load sobre el archivo JSON y el ledger binario leído con mmap.
+    '''
+    print(f"\nLedger binario: {n} egresos")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rows = _sample_movements(n)
+        json_path = os.path.join(tmp_dir, "expenses.json")
+        bin_path = os.path.join(tmp_dir, "expenses.bin")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+        ledger.write_binary_ledger(bin_path, rows, db.expense_categories)
+        del rows
+
+        start = time.perf_counter()
+        with open(json_path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+        total_json = 0.0
+        for row in loaded:
+            total_json += row["amount"]
+        json_elapsed = time.perf_counter() - start
+        del loaded
+
+        start = time.perf_counter()
+        binary = ledger.open_binary_ledger(bin_path)
+        total_bin = ledger.binary_sum_amounts(binary)
+        ledger.close_binary_ledger(binary)
+        bin_elapsed = time.perf_counter() - start
+
+        print(f"- {'json.load + suma':<22} {json_elapsed * 1000:10.1f} ms  ({os.path.getsize(json_path) / 1e6:.1f} MB)")
+        print(f"- {'mmap binario + suma':<22} {bin_elapsed * 1000:10.1f} ms  ({os.path.getsize(bin_path) / 1e6:.1f} MB)")
+        print(f"- mismos totales: {abs(total_json - total_bin) < 0.01}")
+
+
+def bench_stream(n=100000):
+    '''
+    Compara el pico de memoria de sumar los egresos de un usuario cargando la colección entera
+    (read_collection sin caché) y recorriéndola en streaming (expenses_iter_by_user).
+    '''
+    original_dir = db.DB_DIR
+    original_limit = db.CACHE_MAX_BYTES
+    print(f"\nLectura en streaming: {n} egresos")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _fresh_db(tmp_dir)
+        with open(db.EXPENSES_FILE, "w", encoding="utf-8") as f:
+            json.dump(_sample_movements(n), f, ensure_ascii=False, indent=2)
+        db.CACHE_MAX_BYTES = 0
+
+        for label, read in (
+            ("read_collection", lambda: [row for row in db.read_collection(db.EXPENSES_FILE) if row["user"] == "user7"]),
+            ("expenses_iter_by_user", lambda: db.expenses_iter_by_user("user7")),
+        ):
+            db.cache_clear()
+            tracemalloc.start()
+            start = time.perf_counter()
+            total = 0.0
+            for row in read():
+                total += row["amount"]
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"- {label:<22} {elapsed * 1000:10.1f} ms  pico {peak / 1e6:7.1f} MB  total {total:.2f}")
+
+    db.CACHE_MAX_BYTES = original_limit
+    db.set_db_dir(original_dir)
+
+
+def bench_delete(n=200000, deletes=20):
+    '''
+    Mide el tiempo medio de expenses_delete sobre una colección de n egresos ya cacheada (con su índice por id),
+    reescribiendo el archivo y agregando tombstones al journal.
+    '''
+    original_dir = db.DB_DIR
+    original_tombstones = db.TOMBSTONE_DELETES
+    print(f"\nDeletes: {deletes} expenses_delete sobre {n} egresos")
+    for label, tombstones in (("reescritura", False), ("tombstones", True)):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            _fresh_db(tmp_dir)
+            with open(db.EXPENSES_FILE, "w", encoding="utf-8") as f:
+                json.dump(_sample_movements(n), f, ensure_ascii=False, indent=2)
+            db.TOMBSTONE_DELETES = tombstones
+            db.get_by_id("expenses", "1")
+            start = time.perf_counter()
+            for i in range(deletes):
+                db.expenses_delete(str(n - i * 1000))
+            elapsed = time.perf_counter() - start
+            db.TOMBSTONE_DELETES = original_tombstones
+        print(f"- {label:<22} {elapsed / deletes * 1000:10.2f} ms por delete")
+    db.set_db_dir(original_dir)
+
+
+def _time_to_prompt(args, prompt, cwd):
+    '''
+    Lanza el proceso args en la carpeta cwd y devuelve los segundos hasta que escribe prompt en stdout
+    (o hasta que termina).
+    '''
+    start = time.perf_counter()
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               cwd=cwd)
+    output = b""
+    while prompt not in output:
+        chunk = process.stdout.read1(4096)
+        if not chunk:
+            break
+        output += chunk
+    elapsed = time.perf_counter() - start
+    process.kill()
+    process.wait()
+    return elapsed
+
+
+def bench_startup(runs=20, baseline=None):
+    '''
+    Mide el tiempo hasta la primera pregunta de python index.py (mediana de runs arranques),
+    comparado con el de un intérprete que no importa nada y con el del mismo programa en baseline
+    (un commit de git; por defecto el primero del repo, antes de estas optimizaciones), extraído con git archive.
+    Los dos árboles se compilan antes (compileall) y se miden alternados, para compararlos en las mismas condiciones.
+    El proceso se corta en esa pregunta, antes del login, así que no llega a leer ni escribir las colecciones.
+    '''
+    here = os.path.dirname(os.path.abspath(__file__))
+    if baseline is None:
+        baseline = subprocess.run(["git", "rev-list", "--max-parents=0", "HEAD"], cwd=here,
+                                  capture_output=True, text=True).stdout.split()[0]
+    print(f"\nArranque: mediana de {runs} corridas (baseline {baseline[:7]})")
+    prompt = "Seleccione una opción: ".encode("utf-8")
+    with tempfile.TemporaryDirectory() as base_dir:
+        archive = subprocess.run(["git", "archive", baseline], cwd=here, capture_output=True, check=True).stdout
+        subprocess.run(["tar", "-x", "-C", base_dir], input=archive, check=True)
+        for tree in (here, base_dir):
+            subprocess.run([sys.executable, "-m", "compileall", "-q", tree], check=True)
+
+        cases = (
+            ("python vacío", [sys.executable, "-c", f"input({prompt.decode('utf-8')!r})"], here),
+            ("index.py baseline", [sys.executable, "index.py"], base_dir),
+            ("index.py actual", [sys.executable, "index.py"], here),
+        )
+        times = {label: [] for label, _, _ in cases}
+        for _ in range(runs):
+            for label, args, cwd in cases:
+                times[label].append(_time_to_prompt(args, prompt, cwd))
+    for label, _, _ in cases:
+        print(f"- {label:<22} {sorted(times[label])[runs // 2] * 1000:10.1f} ms hasta la primera pregunta")
+
+
+def bench_import(n=1000000, workers=(1, 4)):
+    '''
+    Mide importer.import_csv sobre un extracto de n líneas (un tercio ingresos, el resto egresos,
+    una de cada mil con una fecha inválida) validando en este proceso y con un pool de procesos.
+    Usa el backend sqlite: con json un extracto de este tamaño pasa de importer.JSON_IMPORT_MAX_BYTES.
+    '''
+    original_dir = db.DB_DIR
+    print(f"\nImportación CSV: {n} líneas")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "extracto.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write("date,amount,category,description\n")
+            for i in range(n):
+                day = 30 if i % 1000 == 999 else (i % 28) + 1
+                amount = (i % 900) + 1 if i % 3 == 0 else -((i % 500) + 1)
+                f.write(f"{day:02d}/02/2024,{amount}.25,Otros,movimiento {i}\n")
+
+        for count in workers:
+            db.set_storage_backend("sqlite")
+            _fresh_db(os.path.join(tmp_dir, f"db{count}"))
+            start = time.perf_counter()
+            ok, report = importer.import_csv(csv_path, "bench", workers=count)
+            elapsed = time.perf_counter() - start
+            db.set_storage_backend("json")
+            print(f"- {count} proceso(s){'':<12} {elapsed:10.1f} s  {n / elapsed:10.0f} líneas/s  rechazadas {report['rejected']}")
+    db.set_db_dir(original_dir)
+
+
+def _dashboard_by_functions(username):
+    '''
+    Calcula los números del dashboard como se hacía antes de service.aggregate_movements:
+    una función de service por métrica, cada una con su propia lectura de la colección.
+    '''
+    today = datetime.today()
+    previous = (today.month - 1, today.year) if today.month > 1 else (12, today.year - 1)
+    return (
+        service.total_incomes_all_time(username),
+        service.total_expenses_all_time(username),
+        service.total_incomes_for_month(username, today.month, today.year),
+        service.total_expenses_for_month(username, today.month, today.year),
+        service.calculate_monthly_savings(username, previous[0], previous[1]),
+        service.average_expense_by_category(username, today.month, today.year)
+    )
+
+
+def bench_dashboard(n=1000000, users=100):
+    '''
+    Compara build_dashboard_metrics (una pasada por colección) con las funciones de service por separado
+    sobre n movimientos (mitad ingresos, mitad egresos) de los últimos dos años, repartidos entre users usuarios.
+    Se mide con la caché por defecto (colecciones más grandes que CACHE_MAX_BYTES se leen en streaming)
+    y con la colección entera en la caché (índice por usuario).
+    '''
+    original_dir = db.DB_DIR
+    original_limit = db.CACHE_MAX_BYTES
+    today = datetime.today().toordinal()
+    print(f"\nDashboard: {n} movimientos, {users} usuarios")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _fresh_db(tmp_dir)
+        for path, categories in ((db.INCOMES_FILE, db.income_categories), (db.EXPENSES_FILE, db.expense_categories)):
+            rows = []
+            for i in range(n // 2):
+                day = datetime.fromordinal(today - (i * 7919) % 730)
+                rows.append({
+                    "id": str(i + 1),
+                    "amount": float(i % 1000) + 0.5,
+                    "category": categories[i % len(categories)],
+                    "date": day.strftime("%d/%m/%Y"),
+                    "date_ordinal": day.toordinal(),
+                    "user": f"user{i % users}"
+                })
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False, indent=2)
+            del rows
+
+        for label, limit in (("streaming", original_limit), ("en caché", 1 << 40)):
+            db.CACHE_MAX_BYTES = limit
+            db.cache_clear()
+            if limit != original_limit:
+                service.build_dashboard_metrics("user0")
+            for name, run in (("funciones separadas", _dashboard_by_functions),
+                              ("build_dashboard_metrics", service.build_dashboard_metrics)):
+                service.invalidate()
+                start = time.perf_counter()
+                run("user7")
+                elapsed = time.perf_counter() - start
+                print(f"- {label:<10} {name:<24} {elapsed * 1000:10.1f} ms")
+
+    db.CACHE_MAX_BYTES = original_limit
+    db.set_db_dir(original_dir)
+
+
+def bench_rollup(n=200000, users=50, queries=200):
+    '''
+    Compara calculate_monthly_savings sumando los movimientos del mes (incomes/expenses_iter_by_user_month)
+    con la misma cuenta sacada del rollup mensual, y mide cuánto tarda reconstruir el rollup.
+    '''
+    original_dir = db.DB_DIR
+    print(f"\nRollup mensual: {n} egresos, {queries} consultas")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _fresh_db(tmp_dir)
+        with open(db.EXPENSES_FILE, "w", encoding="utf-8") as f:
+            json.dump(_sample_movements(n, users), f, ensure_ascii=False, indent=2)
+        db.read_collection(db.EXPENSES_FILE)
+
+        start = time.perf_counter()
+        db.rebuild_rollup()
+        print(f"- {'rebuild_rollup':<28} {(time.perf_counter() - start) * 1000:10.1f} ms")
+
+        def by_rows(username, month, year):
+            total = 0.0
+            for row in db.incomes_iter_by_user_month(username, month, year):
+                total += float(row.get("amount", 0.0))
+            for row in db.expenses_iter_by_user_month(username, month, year):
+                total -= float(row.get("amount", 0.0))
+            return total
+
+        for label, run in (("recorriendo movimientos", by_rows), ("rollup", service.calculate_monthly_savings)):
+            start = time.perf_counter()
+            for i in range(queries):
+                run(f"user{i % users}", (i % 12) + 1, 2015 + (i % 10))
+            elapsed = time.perf_counter() - start
+            print(f"- {label:<28} {elapsed / queries * 1000:10.3f} ms por consulta")
+    db.set_db_dir(original_dir)
+
+
+
+def bench_range(n=200000, users=50, queries=200):
+    '''
+    Compara el balance neto de un rango de fechas sumando los movimientos del usuario
+    contra net_between, que sale del índice diario del rollup.
+    '''
+    original_dir = db.DB_DIR
+    print(f"\nBalance por rango de fechas: {n} egresos, {queries} consultas")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _fresh_db(tmp_dir)
+        with open(db.EXPENSES_FILE, "w", encoding="utf-8") as f:
+            json.dump(_sample_movements(n, users), f, ensure_ascii=False, indent=2)
+        db.read_collection(db.EXPENSES_FILE)
+        db.rebuild_rollup()
+
+        def by_rows(username, start_date, end_date):
+            first = db._date_ordinal(start_date)
+            last = db._date_ordinal(end_date)
+            total = 0.0
+            for row in db.incomes_iter_by_user(username):
+                if first <= (db.row_date_ordinal(row) or 0) <= last:
+                    total += float(row.get("amount", 0.0))
+            for row in db.expenses_iter_by_user(username):
+                if first <= (db.row_date_ordinal(row) or 0) <= last:
+                    total -= float(row.get("amount", 0.0))
+            return total
+
+        for label, run in (("recorriendo movimientos", by_rows), ("net_between", service.net_between)):
+            start = time.perf_counter()
+            for i in range(queries):
+                run(f"user{i % users}", f"01/{(i % 12) + 1:02d}/{2015 + (i % 5)}", f"15/{(i % 12) + 1:02d}/{2019 + (i % 5)}")
+            elapsed = time.perf_counter() - start
+            print(f"- {label:<28} {elapsed / queries * 1000:10.3f} ms por consulta")
+    db.set_db_dir(original_dir)
+
+
+def bench_memo(n=200000, users=50, repeats=1000):
+    '''
+    Mide build_dashboard_metrics sin memo, con el resultado guardado en el memo (ninguna colección cambió)
+    y después de un insert, que sube la versión de expenses y obliga a recalcular.
+    '''
+    original_dir = db.DB_DIR
+    today = datetime.today().strftime("%d/%m/%Y")
+    print(f"\nMemo de métricas: {n} egresos, {repeats} repeticiones")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _fresh_db(tmp_dir)
+        with open(db.EXPENSES_FILE, "w", encoding="utf-8") as f:
+            json.dump(_sample_movements(n, users), f, ensure_ascii=False, indent=2)
+        db.users_insert({"name": "user0", "password": "x", "age": 30, "genre": "X", "role": "user"})
+        db.read_collection(db.EXPENSES_FILE)
+
+        service.invalidate()
+        start = time.perf_counter()
+        service.build_dashboard_metrics("user0")
+        print(f"- {'sin memo':<28} {(time.perf_counter() - start) * 1000:10.3f} ms")
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            service.build_dashboard_metrics("user0")
+        print(f"- {'memo':<28} {(time.perf_counter() - start) / repeats * 1e6:10.1f} µs por llamada")
+
+        db.expenses_insert({"amount": 10.0, "category": db.expense_categories[0], "date": today, "user": "user0"})
+        start = time.perf_counter()
+        service.build_dashboard_metrics("user0")
+        print(f"- {'después de un insert':<28} {(time.perf_counter() - start) * 1000:10.3f} ms")
+    db.set_db_dir(original_dir)
+
+
+def bench_numpy(n=400000, users=2, queries=20):
+    '''
+    Compara aggregate_movements en Python puro con numpy_backend sobre n movimientos (mitad ingresos,
+    mitad egresos) de pocos usuarios, mide cuánto cuesta armar los ledgers la primera vez y compara
+    las dos rutas de service.aggregate_movements cuando cada consulta viene después de un alta.
+    '''
+    if not numpy_backend.available():
+        print("\nNumPy no está instalado: se omite el benchmark numpy")
+        return
+    original_dir = db.DB_DIR
+    periods = [(month, 2024) for month in range(1, 13)]
+    print(f"\nAgregación con NumPy: {n} movimientos, {users} usuarios, {queries} consultas")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _fresh_db(tmp_dir)
+        for path, categories in ((db.INCOMES_FILE, db.income_categories), (db.EXPENSES_FILE, db.expense_categories)):
+            rows = _sample_movements(n // 2, users)
+            for row in rows:
+                row["category"] = categories[int(row["id"]) % len(categories)]
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False)
+        db.read_collection(db.INCOMES_FILE)
+        db.read_collection(db.EXPENSES_FILE)
+
+        start = time.perf_counter()
+        incomes, expenses = db.movements_ledger("incomes"), db.movements_ledger("expenses")
+        print(f"- {'armar ledgers':<28} {(time.perf_counter() - start) * 1000:10.1f} ms")
+
+        for label, run in (
+            ("Python puro", lambda username: service._aggregate_movements_python(username, periods)),
+            ("numpy_backend", lambda username: numpy_backend.aggregate_movements(incomes, expenses, username, periods)),
+        ):
+            start = time.perf_counter()
+            for i in range(queries):
+                run(f"user{i % users}")
+            elapsed = time.perf_counter() - start
+            print(f"- {label:<28} {elapsed / queries * 1000:10.1f} ms por consulta")
+
+        # Flujo real: cada consulta después de un alta (los ledgers reciben el delta, no se rearman)
+        for i in range(users):
+            db.users_insert({"name": f"user{i}", "password": "x", "age": 30, "genre": "X", "role": "user"})
+        original_min_rows = service.NUMPY_MIN_ROWS
+        for label, min_rows in (("alta + consulta (Python)", n + queries + 1), ("alta + consulta (NumPy)", 0)):
+            service.NUMPY_MIN_ROWS = min_rows
+            start = time.perf_counter()
+            for i in range(queries):
+                username = f"user{i % users}"
+                db.expenses_insert({"amount": 1.0, "category": db.expense_categories[0], "date": "01/01/2024", "user": username})
+                service.aggregate_movements(username, periods)
+            elapsed = time.perf_counter() - start
+            print(f"- {label:<28} {elapsed / queries * 1000:10.1f} ms por consulta")
+        service.NUMPY_MIN_ROWS = original_min_rows
+    db.set_db_dir(original_dir)
+
+BENCHMARKS = {
+    "writes": bench_writes,
+    "binary": bench_binary,
+    "stream": bench_stream,
+    "delete": bench_delete,
+    "startup": bench_startup,
+    "import": bench_import,
+    "dashboard": bench_dashboard,
+    "rollup": bench_rollup,
+    "range": bench_range,
+    "memo": bench_memo,
+    "numpy": bench_numpy,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Benchmark desconocido '{name}'. Opciones: {', '.join(BENCHMARKS)}")
+        else:
+            BENCHMARKS[name]()
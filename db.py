@@ -1,6 +1,16 @@
 from datetime import datetime
+from bisect import insort, bisect_left, bisect_right
+from contextlib import contextmanager
+from functools import wraps
+from itertools import islice
 import os
+import re
 import json
+import atexit
+import threading
+import zlib
+# db_sqlite (y sqlite3), ledger (mmap, struct y array), copy, shutil y concurrent.futures se importan recién
+# en las funciones que los usan: con el backend json no hacen falta para leer ni escribir (ver bench_startup).
 
 
 #utils
@@ -19,71 +29,2259 @@ USERS_FILE = os.path.join(DB_DIR, "users.json")
 INCOMES_FILE = os.path.join(DB_DIR, "incomes.json")
 EXPENSES_FILE = os.path.join(DB_DIR, "expenses.json")
 GOALS_FILE = os.path.join(DB_DIR, "goals.json")
+COUNTERS_FILE = os.path.join(DB_DIR, "counters.json")
+ROLLUP_FILE = os.path.join(DB_DIR, "rollup.json")
+SQLITE_FILE = os.path.join(DB_DIR, "finanzas.sqlite3")
+
+# Backend de almacenamiento: "json" (un archivo por colección) o "sqlite" (ver db_sqlite.py)
+STORAGE_BACKENDS = ["json", "sqlite"]
+STORAGE_BACKEND = os.environ.get("FINANZAS_STORAGE", "json")
 
 income_categories = ["Salario", "Regalo", "Otros"]
 expense_categories = ["Supermercado", "Vivienda", "Transporte", "Otros"]
 goal_categories = ["Viaje", "Vivienda", "Electrodomesticos", "Educacion", "Otros"]
 goals_status = ["Iniciado", "En proceso", "Completado"]
+# Campos que incomes_update_where / expenses_update_where pueden modificar
+MOVEMENT_UPDATE_FIELDS = ("amount", "category", "date")
+
+# ----- Journal -----
+# Con JOURNAL_MODE activo, los inserts de incomes/expenses se agregan como una línea a incomes.jsonl / expenses.jsonl
+# en lugar de reescribir todo el archivo. Las lecturas aplican el journal sobre el snapshot (.json).
+JOURNAL_MODE = False
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+# Con TOMBSTONE_DELETES activo, los deletes de cualquier colección se agregan al journal como {"op": "delete", "id": ...}
+# en lugar de reescribir el archivo. Las lecturas descartan esas filas y la compactación las borra del snapshot.
+# Está apagado por defecto porque cambia el formato en disco: una versión anterior que solo lea el .json
+# vería de nuevo las filas borradas. Con los dos modos apagados ensure_db_files compacta los journals que hayan quedado.
+TOMBSTONE_DELETES = False
+
+# ----- Escrituras -----
+# Cada escritura va a un archivo temporal que se sincroniza a disco (fsync) y después se renombra sobre el original,
+# así un corte a mitad de escritura nunca deja una colección truncada.
+FSYNC_WRITES = True
+# Con CHECKSUM_WRITES cada colección se escribe junto con <archivo>.sum, que guarda el CRC32 y el tamaño
+# del contenido actual ("current") y del anterior ("previous"). El contenido anterior queda en <archivo>.bak
+# (un hard link, no una copia) como último snapshot bueno para recuperar la colección si el archivo se daña.
+CHECKSUM_WRITES = True
+# Colecciones que la verificación encontró dañadas ("dañado") o editadas por fuera ("modificado"), con su estado.
+# No se escriben hasta que se recuperen o se acepten sus cambios (ver accept_collection_changes),
+# así un archivo que no se pudo leer nunca queda pisado por una colección vacía.
+_held_files = {}
+
+class CollectionIntegrityError(Exception):
+    '''
+    Se lanza al leer una colección dañada que no se pudo recuperar, o al escribir una colección
+    dañada o editada por fuera cuyos cambios todavía no se aceptaron.
+    '''
+
+# Ventana de group commit en milisegundos. Con 0 cada escritura es inmediata; con un valor mayor las escrituras
+# de una colección dentro de la ventana se juntan en una sola escritura a disco (ver flush_pending_writes).
+GROUP_COMMIT_MS = 0
+_pending_writes = {}
+_pending_lock = threading.RLock()
+_pending_timer = []
+
+# Ledgers columnares por colección (ver movements_ledger), validados con el stamp de la colección
+_ledger_cache = {}
+
+# Nombres de usuario para el backend sqlite (ver _user_names)
+_user_names_cache = {}
+
+# ----- Transacciones -----
+# Pila con la transacción activa (ver transaction()). Cada transacción guarda:
+# - rows: filas de cada colección leída o modificada dentro de la transacción
+# - indexes: índices calculados sobre esas filas
+# - dirty: colecciones modificadas, que se escriben al hacer commit
+# - counters: copia de los contadores de ids para restaurarlos si hay rollback
+_transactions = []
+
+# ----- Contadores de ids -----
+# Último id asignado por colección junto con el stamp de la colección cuando se guardó.
+# Si el stamp no coincide con el archivo en disco el contador se recalcula recorriendo la colección una vez.
+# counters.json es solo una caché para no recorrerla al arrancar: se guarda al terminar el programa (ver _save_counters).
+# Lo que hace durable al contador es la escritura de la propia colección: el último id va en su .sum
+# (ver _rotate_last_good) y los inserts y tombstones del journal llevan su id (ver _persisted_last_id).
+_counters = {}
+_counters_state = {"loaded": False, "dirty": False}
+
+# ----- Rollup mensual -----
+# Suma y cantidad de movimientos por colección (incomes/expenses), usuario, mes ("yyyy-mm") y categoría,
+# guardadas en rollup.json con el stamp de cada colección: {"incomes.json": {"stamp": ..., "cells": {user: {mes: {categoria: [suma, cantidad]}}}, "days": ...}}.
+# "days" es el índice diario de cada usuario: {user: {"days": [ordinales], "counts": [...], "prefix": [suma acumulada]}},
+# con el que el total de cualquier rango de fechas sale de dos búsquedas binarias (ver _range_total).
+# Cada insert, update y delete de movimientos le aplica su delta; si el stamp no coincide con la colección
+# en disco (por ejemplo tras un corte o una edición externa) se reconstruye recorriéndola una vez.
+# Se guarda a disco al terminar el programa (ver _save_rollup).
+_rollup = {}
+_rollup_state = {"loaded": False, "dirty": False}
+# Con más días distintos que esto en un mismo delta, el índice diario del usuario se rearma en una pasada
+DAY_MERGE_THRESHOLD = 8
+
+# ----- Versiones de escritura -----
+# Cantidad de escrituras hechas por este módulo sobre cada colección ("users", "incomes", "expenses", "goals").
+# Sube también con las escrituras que todavía no llegaron al disco (transacciones y group commit), así quien
+# guarde resultados calculados a partir de una colección (ver service.py) puede saber si siguen valiendo.
+_write_versions = {}
+
+# ----- Caché de colecciones -----
+# Filas ya parseadas por archivo, validadas contra (mtime_ns, size) del archivo en disco
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+_collection_cache = {}
+_cache_stats = {"hits": 0, "misses": 0}
+
+# ----- Lectura en streaming -----
+# Tamaño de cada bloque de texto que se lee al recorrer una colección sin cargarla entera (ver iter_collection)
+STREAM_CHUNK_SIZE = 64 * 1024
+# Fragmentos del encoder JSON que se juntan en cada bloque al escribir una colección (ver _write_json_blocks)
+WRITE_BATCH = 8192
+_json_decoder = json.JSONDecoder()
+_STREAM_SEPARATOR = re.compile(r"[\s,]*")
+
+
+### Generales
+## Privadas
+def _collection_path(name):
+    lower = str(name).strip().lower()
+    if lower == "users":
+        return USERS_FILE
+    if lower == "incomes":
+        return INCOMES_FILE
+    if lower == "expenses":
+        return EXPENSES_FILE
+    if lower == "goals":
+        return GOALS_FILE
+    print(f"Error: colección desconocida '{name}'. Las opciones válidas son 'users', 'incomes', o 'expenses'.")
+    return None
+
+def _use_sqlite():
+    return STORAGE_BACKEND == "sqlite"
+
+def _sqlite():
+    '''
+    Devuelve la conexión a la base SQLite (ver db_sqlite.connect).
+    '''
+    import db_sqlite
+    return db_sqlite.connect(SQLITE_FILE)
+
+def _table_name(file_path):
+    '''
+    Devuelve el nombre de tabla SQLite de una colección: .../incomes.json -> incomes
+    '''
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def _file_stamp(file_path):
+    '''
+    Recibe un file_path de tipo str.
+    Devuelve la tupla (mtime_ns, size) del archivo, o None si no existe.
+    '''
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _journal_path(file_path):
+    '''
+    Devuelve el path del journal asociado a una colección: incomes.json -> incomes.jsonl
+    '''
+    return os.path.splitext(file_path)[0] + ".jsonl"
+
+def _journal_enabled(file_path):
+    '''
+    Indica si los inserts sobre file_path deben ir al journal en lugar de reescribir el archivo.
+    '''
+    if _current_transaction() is not None:
+        return False
+    movements = (INCOMES_FILE, EXPENSES_FILE)
+    partition_dirs = (_partition_dir(INCOMES_FILE), _partition_dir(EXPENSES_FILE))
+    return JOURNAL_MODE and (file_path in movements or os.path.dirname(file_path) in partition_dirs)
+
+def _current_transaction():
+    '''
+    Devuelve el dict de la transacción activa, o None si no hay ninguna.
+    '''
+    if not _transactions:
+        return None
+    return _transactions[-1]
+
+def _partition_dir(file_path):
+    '''
+    Devuelve la carpeta de particiones de una colección de movimientos: .../expenses.json -> .../expenses
+    '''
+    return os.path.splitext(file_path)[0]
+
+def _partitioned(file_path):
+    '''
+    Indica si la colección de file_path usa el layout particionado por mes (ver migrate_to_partitions):
+    solo incomes y expenses, con el backend json, y si existe su carpeta de particiones.
+    '''
+    if _use_sqlite() or file_path not in (INCOMES_FILE, EXPENSES_FILE):
+        return False
+    return os.path.isdir(_partition_dir(file_path))
+
+def _partition_key(date_str):
+    '''
+    Recibe una fecha "dd/mm/yyyy" y devuelve el nombre de su partición "yyyy-mm".
+    Las filas sin una fecha válida van a la partición "sin-fecha".
+    '''
+    parts = str(date_str).split("/")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return "sin-fecha"
+    return f"{int(parts[2]):04d}-{int(parts[1]):02d}"
+
+def _date_ordinal(date_str):
+    '''
+    Recibe una fecha "dd/mm/yyyy" y devuelve su ordinal (date.toordinal()), o None si no es una fecha válida.
+    '''
+    try:
+        d, m, y = map(int, str(date_str).split("/"))
+        return datetime(y, m, d).toordinal()
+    except ValueError:
+        return None
+
+def row_date_ordinal(row):
+    '''
+    Devuelve el ordinal de la fecha de un ingreso o egreso: el campo "date_ordinal" que se guarda
+    al insertar o actualizar, o si la fila es anterior a ese campo, el que sale de parsear "date".
+    '''
+    ordinal = row.get("date_ordinal")
+    if ordinal is None:
+        ordinal = _date_ordinal(row.get("date"))
+    return ordinal
+
+def month_bounds(month, year):
+    '''
+    Devuelve la tupla (primer día, último día) del mes como ordinales, para filtrar comparando enteros.
+    '''
+    first = datetime(int(year), int(month), 1).toordinal()
+    if int(month) == 12:
+        following = datetime(int(year) + 1, 1, 1).toordinal()
+    else:
+        following = datetime(int(year), int(month) + 1, 1).toordinal()
+    return (first, following - 1)
+
+def _partition_file(file_path, key):
+    '''
+    Devuelve el path del archivo de la partición key de la colección: .../expenses/2024-07.json
+    '''
+    return os.path.join(_partition_dir(file_path), key + ".json")
+
+def _row_partition(file_path, row):
+    '''
+    Devuelve el path de la partición donde se guarda row.
+    '''
+    return _partition_file(file_path, _partition_key(row.get("date")))
+
+def _group_by_partition(file_path, rows):
+    '''
+    Devuelve un dict {path de partición: [filas]} respetando el orden de rows.
+    '''
+    groups = {}
+    for row in rows:
+        groups.setdefault(_row_partition(file_path, row), []).append(row)
+    return groups
+
+def _partition_paths(file_path):
+    '''
+    Devuelve la lista ordenada (por mes) de los paths de las particiones de la colección:
+    las que están en disco (snapshot o journal) y las que por ahora solo existen en memoria
+    por una transacción o un group commit.
+    '''
+    directory = _partition_dir(file_path)
+    paths = set()
+    try:
+        listing = os.listdir(directory)
+    except OSError:
+        listing = []
+    for entry in listing:
+        base, extension = os.path.splitext(entry)
+        if extension in (".json", ".jsonl"):
+            paths.add(os.path.join(directory, base + ".json"))
+
+    in_memory = list(_pending_writes)
+    tx = _current_transaction()
+    if tx is not None:
+        in_memory.extend(tx["rows"])
+    for path in in_memory:
+        if os.path.dirname(path) == directory:
+            paths.add(path)
+    return sorted(paths)
+
+def _rows_in_memory(file_path):
+    '''
+    Indica si la colección de file_path (o alguna de sus particiones) tiene cambios que todavía no están
+    en disco, por un group commit pendiente o por la transacción activa. En ese caso los stamps
+    de los archivos no alcanzan para validar lo que haya en caché.
+    '''
+    paths = [file_path]
+    if _partitioned(file_path):
+        paths.extend(_partition_paths(file_path))
+    tx = _current_transaction()
+    for path in paths:
+        if path in _pending_writes or (tx is not None and path in tx["dirty"]):
+            return True
+    return False
+
+def _collection_stamp(file_path):
+    '''
+    Devuelve el stamp de una colección: el del snapshot y el de su journal.
+    Si no existe ninguno de los dos devuelve None.
+    Se usa para saber si una colección cambió en disco desde la última lectura.
+    Con el layout particionado el stamp junta los de todas las particiones (con el nombre de cada una).
+    '''
+    if _partitioned(file_path):
+        parts = []
+        for path in _partition_paths(file_path):
+            name = os.path.basename(path)
+            for part in _collection_stamp(path) or ():
+                parts.append(None if part is None else part + (name,))
+        return tuple(parts) or None
+
+    snapshot = _file_stamp(file_path)
+    journal = _file_stamp(_journal_path(file_path))
+    if snapshot is None and journal is None:
+        return None
+    return (snapshot, journal)
+
+def _stamp_size(stamp):
+    '''
+    Devuelve la cantidad de bytes en disco que representa un stamp de colección.
+    '''
+    total = 0
+    for part in stamp:
+        if part is not None:
+            total += part[1]
+    return total
+
+def _cache_get(file_path, stamp):
+    '''
+    Devuelve la entrada cacheada de file_path si su stamp coincide con el recibido, sino None.
+    La entrada se mueve al final del diccionario para que la expulsión sea LRU.
+    '''
+    entry = _collection_cache.get(file_path)
+    if entry is None or entry["stamp"] != stamp:
+        return None
+    _collection_cache.pop(file_path)
+    _collection_cache[file_path] = entry
+    return entry
+
+def _cache_put(file_path, stamp, rows, indexes=None):
+    '''
+    Guarda en la caché las filas parseadas de file_path junto con su stamp.
+    Opcionalmente recibe los índices ya calculados sobre esas filas (ver _field_index).
+    "removed" guarda las filas sacadas por tombstones que los índices todavía no reflejan (ver _journal_delete).
+    Si la colección supera CACHE_MAX_BYTES no se cachea, y si el total supera
+    el límite se expulsan las entradas usadas hace más tiempo.
+    '''
+    _collection_cache.pop(file_path, None)
+    if stamp is None:
+        return None
+    size = _stamp_size(stamp)
+    if size > CACHE_MAX_BYTES:
+        return None
+
+    entry = {"stamp": stamp, "rows": rows, "size": size, "indexes": indexes or {}, "removed": []}
+    _collection_cache[file_path] = entry
+
+    total = 0
+    for cached in _collection_cache.values():
+        total += cached["size"]
+    while total > CACHE_MAX_BYTES and len(_collection_cache) > 1:
+        oldest_path = next(iter(_collection_cache))
+        total -= _collection_cache.pop(oldest_path)["size"]
+    return entry
+
+def _journal_line(record):
+    '''
+    Devuelve la línea del journal para record: el JSON, un tab y el CRC32 del JSON en hexadecimal.
+    json.dumps escapa los tabs dentro de los strings, así el último tab de la línea siempre es el separador.
+    '''
+    payload = json.dumps(record, ensure_ascii=False)
+    return f"{payload}\t{zlib.crc32(payload.encode('utf-8')):08x}\n"
+
+def _parse_journal_line(line):
+    '''
+    Devuelve el registro de una línea del journal, o None si está dañada (no es JSON o no coincide con su CRC32).
+    Las líneas sin CRC32 (escritas antes de que existiera) solo se validan como JSON.
+    '''
+    payload = line.rstrip("\n")
+    if "\t" in payload:
+        payload, crc = payload.rsplit("\t", 1)
+        try:
+            if int(crc, 16) != zlib.crc32(payload.encode("utf-8")):
+                return None
+        except ValueError:
+            return None
+    try:
+        record = json.loads(payload)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+def _journal_records(file_path):
+    '''
+    Genera en orden los registros del journal de file_path.
+    Una última línea sin salto de línea es un append que se cortó a mitad de camino (nunca se confirmó) y se ignora.
+    Cualquier otra línea dañada se saltea avisando con un ERROR: puede ser un tombstone perdido
+    (ver verify_collections, que la reporta y guarda una copia en <journal>.corrupt).
+    '''
+    journal = _journal_path(file_path)
+    if not os.path.exists(journal):
+        return
+    with open(journal, "r", encoding="utf-8", errors="replace") as file:
+        for number, line in enumerate(file, 1):
+            record = _parse_journal_line(line)
+            if record is not None:
+                yield record
+            elif line.endswith("\n"):
+                print(f"ERROR: línea {number} dañada en {journal}, se ignora")
+
+def _replay_journal(file_path, rows):
+    '''
+    Aplica sobre rows las operaciones guardadas en el journal de file_path.
+    Un insert con un id que ya está en rows reemplaza la fila, así reaplicar el journal es idempotente.
+    Un delete (tombstone) saca la fila con ese id; si después vuelve a insertarse ese id, va al final.
+    '''
+    if not os.path.exists(_journal_path(file_path)):
+        return rows
+
+    positions = {}
+    for i, row in enumerate(rows):
+        positions[str(row.get("id"))] = i
+
+    deleted = False
+    for record in _journal_records(file_path):
+        op = record.get("op")
+        if op == "insert":
+            row = record.get("row")
+            row_id = str(row.get("id"))
+            if row_id in positions:
+                rows[positions[row_id]] = row
+            else:
+                positions[row_id] = len(rows)
+                rows.append(row)
+        elif op == "delete":
+            position = positions.pop(str(record.get("id")), None)
+            if position is not None:
+                rows[position] = None
+                deleted = True
+
+    if deleted:
+        rows[:] = [row for row in rows if row is not None]
+    return rows
+
+def _cached_rows(file_path):
+    '''
+    Devuelve la lista de filas de la colección de file_path según el backend configurado.
+    La lista devuelta puede ser la de la caché: quien la reciba no debe modificarla.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        return db_sqlite.all_rows(_sqlite(), _table_name(file_path))
+    return _json_rows(file_path)
+
+def _json_rows(file_path):
+    '''
+    Devuelve la lista de filas de la colección guardada en file_path (snapshot + journal).
+    Si la colección no cambió desde la última lectura (mismo mtime_ns y size) devuelve
+    la lista ya parseada sin volver a abrir el archivo.
+    La lista devuelta es la de la caché: quien la reciba no debe modificarla.
+    Dentro de una transacción cada colección se copia una sola vez, la primera vez que se usa, y se devuelve
+    esa copia en staging: las escrituras de la transacción la modifican en el lugar (ver _writable_rows).
+    Si hay una escritura pendiente de group commit se devuelven esas filas.
+    '''
+    if _partitioned(file_path):
+        return _load_partitioned_rows(file_path)
+    tx = _current_transaction()
+    if tx is not None:
+        if file_path not in tx["rows"]:
+            tx["rows"][file_path] = list(_load_json_rows(file_path))
+        return tx["rows"][file_path]
+    return _load_json_rows(file_path)
+
+def _load_partitioned_rows(file_path):
+    '''
+    Devuelve las filas de una colección particionada: las de cada partición, en orden de mes.
+    La lista armada se cachea con el stamp de todas las particiones; cada partición además tiene
+    su propia entrada en la caché, así después de escribir un mes solo se vuelve a leer ese archivo.
+    '''
+    if _rows_in_memory(file_path):
+        rows = []
+        for path in _partition_paths(file_path):
+            rows.extend(_json_rows(path))
+        return rows
+
+    stamp = _collection_stamp(file_path)
+    if stamp is None:
+        return []
+    entry = _cache_get(file_path, stamp)
+    if entry is not None:
+        _cache_stats["hits"] += 1
+        return entry["rows"]
+
+    _cache_stats["misses"] += 1
+    rows = []
+    for path in _partition_paths(file_path):
+        rows.extend(_json_rows(path))
+    _cache_put(file_path, stamp, rows)
+    return rows
+
+def _load_json_rows(file_path):
+    pending = _pending_writes.get(file_path)
+    if pending is not None:
+        return pending["rows"]
+
+    stamp = _collection_stamp(file_path)
+    if stamp is None:
+        return []
+
+    entry = _cache_get(file_path, stamp)
+    if entry is not None:
+        _cache_stats["hits"] += 1
+        return entry["rows"]
+
+    _cache_stats["misses"] += 1
+    try:
+        data = []
+        if stamp[0] is not None:
+            with open(file_path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+        if not isinstance(data, list):
+            raise ValueError(f"{file_path} no es un array JSON")
+        rows = _replay_journal(file_path, data)
+    except Exception:
+        # Archivo dañado: si se puede recuperar desde el último snapshot bueno se vuelve a leer.
+        # Si no, se corta acá: devolver [] haría que la próxima escritura pise el archivo dañado.
+        if _verify_file(file_path) != "recuperado":
+            _held_files[file_path] = "dañado"
+            raise CollectionIntegrityError(f"{_relative_name(file_path)} está dañado y no se pudo recuperar")
+        return _load_json_rows(file_path)
+
+    _cache_put(file_path, stamp, rows)
+    return rows
+
+def _iter_json_array(file_path):
+    '''
+    Recibe el file_path de un archivo con un array JSON de objetos.
+    Genera los elementos del array de a uno, leyendo el archivo en bloques de STREAM_CHUNK_SIZE
+    y decodificando cada elemento con JSONDecoder.raw_decode, así en memoria solo queda
+    el bloque actual y el elemento que se está devolviendo.
+    Si el archivo no existe, no es un array o está cortado se deja de generar en ese punto.
+    '''
+    try:
+        file = open(file_path, "r", encoding="utf-8")
+    except OSError:
+        return
+
+    with file:
+        buffer = ""
+        position = 0
+        started = False
+        eof = False
+        while True:
+            # Saltear espacios y comas entre elementos, y el "[" inicial
+            position = _STREAM_SEPARATOR.match(buffer, position).end()
+            if position < len(buffer):
+                if not started:
+                    if buffer[position] != "[":
+                        return
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    row, position = _json_decoder.raw_decode(buffer, position)
+                    yield row
+                    continue
+                except ValueError:
+                    pass
+
+            # Hace falta más texto: o el buffer se terminó o el elemento quedó cortado entre dos bloques
+            if eof:
+                return
+            chunk = file.read(STREAM_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+def _iter_json_collection(file_path):
+    '''
+    Genera las filas de la colección de file_path (snapshot + journal) sin cargarla entera.
+    El journal se lee antes y se aplica al pasar por el snapshot, con el mismo resultado
+    que _replay_journal: un insert con un id existente reemplaza la fila, las filas con tombstone
+    se saltean y el resto de los inserts va al final.
+    '''
+    journal_rows = {}
+    deleted = set()
+    for record in _journal_records(file_path):
+        op = record.get("op")
+        if op == "insert":
+            row = record.get("row")
+            journal_rows[str(row.get("id"))] = row
+        elif op == "delete":
+            row_id = str(record.get("id"))
+            journal_rows.pop(row_id, None)
+            deleted.add(row_id)
+
+    for row in _iter_json_array(file_path):
+        row_id = str(row.get("id"))
+        if row_id in deleted:
+            continue
+        replacement = journal_rows.pop(row_id, None)
+        yield row if replacement is None else replacement
+    for row in journal_rows.values():
+        yield row
+
+def _streaming(file_path):
+    '''
+    Indica si file_path conviene recorrerlo en streaming: colecciones JSON que no entran en la caché
+    (más grandes que CACHE_MAX_BYTES) y que no tienen filas en memoria por una transacción o un group commit.
+    '''
+    if _use_sqlite() or _rows_in_memory(file_path):
+        return False
+    tx = _current_transaction()
+    if tx is not None and file_path in tx["rows"]:
+        return False
+    stamp = _collection_stamp(file_path)
+    return stamp is not None and _stamp_size(stamp) > CACHE_MAX_BYTES
+
+def _iter_rows(file_path):
+    '''
+    Genera las filas de la colección de file_path: desde la caché (o la base SQLite) si está disponible,
+    y en streaming desde el disco si la colección es demasiado grande para la caché.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        return db_sqlite.iter_rows(_sqlite(), _table_name(file_path))
+    if _partitioned(file_path) and _streaming(file_path):
+        return (row for path in _partition_paths(file_path) for row in _iter_rows(path))
+    if _streaming(file_path):
+        return _iter_json_collection(file_path)
+    return iter(_json_rows(file_path))
+
+def _iter_by_field(file_path, field, value):
+    '''
+    Genera las filas de file_path cuyo campo field vale value.
+    Usa el índice del campo si la colección entra en la caché y la recorre en streaming si no.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        table = _table_name(file_path)
+        if field == db_sqlite._owner_field(table):
+            return db_sqlite.iter_rows(_sqlite(), table, value)
+    elif not _streaming(file_path):
+        rows, index = _field_index(file_path, field)
+        return (rows[position] for position in index.get(str(value), []))
+
+    key = str(value)
+    return (row for row in _iter_rows(file_path) if str(row.get(field)) == key)
+
+def _iter_by_user_between(file_path, username, first, last):
+    '''
+    Genera las filas de username con sqlite cuya fecha cae entre los ordinales first y last (inclusive),
+    con una consulta sobre el índice (owner, date_key).
+    '''
+    import db_sqlite
+    return db_sqlite.iter_rows_between(
+        _sqlite(), _table_name(file_path), username,
+        datetime.fromordinal(first).strftime("%Y-%m-%d"), datetime.fromordinal(last).strftime("%Y-%m-%d")
+    )
+
+def _iter_by_user_month(file_path, username, month, year):
+    '''
+    Genera las filas de username de un mes de la colección de movimientos de file_path.
+    Con el layout particionado solo se abre la partición de ese mes; con sqlite se consulta el índice (owner, date_key);
+    si no, se filtran las filas del usuario comparando su date_ordinal con el primer y el último día del mes.
+    '''
+    if _partitioned(file_path):
+        key = f"{int(year):04d}-{int(month):02d}"
+        return _iter_by_field(_partition_file(file_path, key), "user", username)
+    first, last = month_bounds(month, year)
+    if _use_sqlite():
+        return _iter_by_user_between(file_path, username, first, last)
+    return (row for row in _iter_by_field(file_path, "user", username) if first <= (row_date_ordinal(row) or 0) <= last)
+
+def _month_totals(file_path, username, month, year):
+    '''
+    Devuelve un dict {categoria: total} con los movimientos de username en ese mes, leído del rollup
+    (sin recorrer los movimientos). Con el backend sqlite se suman las filas del mes, que salen del índice (owner, date_key).
+    '''
+    if _use_sqlite():
+        totals = {}
+        for row in _iter_by_user_month(file_path, username, month, year):
+            category = row.get("category")
+            totals[category] = totals.get(category, 0.0) + float(row.get("amount", 0.0))
+        return totals
+    categories = _rollup_record(file_path)["cells"].get(str(username), {}).get(f"{int(year):04d}-{int(month):02d}", {})
+    return {category: cell[0] for category, cell in categories.items()}
+
+def _range_total(file_path, username, start_date=None, end_date=None):
+    '''
+    Devuelve la suma de los movimientos de username con fecha entre start_date y end_date ("dd/mm/yyyy", inclusive;
+    None deja ese extremo abierto), o None si alguna fecha no es válida.
+    Sale del índice diario del rollup: dos bisect sobre los días del usuario y una resta de sumas acumuladas.
+    Con el backend sqlite se suman las filas del rango, que salen del índice (owner, date_key).
+    '''
+    first = _date_ordinal(start_date) if start_date is not None else 1
+    last = _date_ordinal(end_date) if end_date is not None else datetime.max.toordinal()
+    if first is None or last is None:
+        return None
+    if _use_sqlite():
+        total = 0.0
+        if first > last:
+            return total
+        for row in _iter_by_user_between(file_path, username, first, last):
+            total += float(row.get("amount", 0.0))
+        return total
+    entry = _rollup_record(file_path)["days"].get(str(username))
+    if entry is None or first > last:
+        return 0.0
+    days, prefix = entry["days"], entry["prefix"]
+    low = bisect_left(days, first)
+    high = bisect_right(days, last)
+    if high == 0:
+        return 0.0
+    return round(prefix[high - 1] - (prefix[low - 1] if low else 0.0), 9)
+
+def read_collection(file_path):
+    '''
+    Recibe un file_path de tipo str.
+    Devuelve una lista con las filas de la colección, o [] si no existe.
+    Si está dañada y no se pudo recuperar lanza CollectionIntegrityError.
+    Las lecturas repetidas de un archivo sin cambios se resuelven desde la caché.
+    '''
+    return list(_cached_rows(file_path))
+
+def _writable_rows(file_path):
+    '''
+    Devuelve la lista de filas de file_path que una escritura puede modificar antes de pasarla a _write_collection.
+    Dentro de una transacción es la lista en staging (ya es una copia propia de la transacción), así una serie
+    de cambios sobre la misma colección no vuelve a copiarla entera en cada uno; fuera, una copia nueva.
+    '''
+    if _current_transaction() is not None:
+        return _json_rows(file_path)
+    return read_collection(file_path)
+
+def _field_index(file_path, field):
+    '''
+    Recibe un file_path y el nombre de un campo de la colección.
+    Devuelve la tupla (rows, index) donde index es un dict {str(valor): [posiciones en rows]}.
+    El índice se guarda en la entrada de la caché y se mantiene con los inserts y updates,
+    así buscar por ese campo cuesta lo que mide el resultado y no lo que mide la colección.
+    '''
+    rows = _json_rows(file_path)
+    tx = _current_transaction()
+    entry = _collection_cache.get(file_path)
+    if tx is not None and file_path in tx["rows"]:
+        indexes = tx["indexes"].setdefault(file_path, {})
+    elif entry is not None and entry["rows"] is rows:
+        _apply_removals(entry)
+        indexes = entry["indexes"]
+    else:
+        indexes = {}
+
+    index = indexes.get(field)
+    if index is None:
+        index = {}
+        for position, row in enumerate(rows):
+            index.setdefault(str(row.get(field)), []).append(position)
+        indexes[field] = index
+    return rows, index
+
+def _current_indexes(file_path):
+    '''
+    Devuelve los índices de la entrada cacheada de file_path si está al día con el disco, sino {}.
+    Dentro de una transacción devuelve los índices de las filas en staging, nunca los de la caché.
+    '''
+    tx = _current_transaction()
+    if tx is not None:
+        if file_path not in tx["rows"]:
+            return {}
+        return tx["indexes"].setdefault(file_path, {})
+    entry = _cache_get(file_path, _collection_stamp(file_path))
+    if entry is None:
+        return {}
+    _apply_removals(entry)
+    return entry["indexes"]
+
+def _index_append(indexes, row, position):
+    '''
+    Agrega a cada índice la fila row que quedó en la posición position.
+    '''
+    for field, index in indexes.items():
+        index.setdefault(str(row.get(field)), []).append(position)
+
+def _index_replace(indexes, old_row, new_row, position):
+    '''
+    Actualiza cada índice cuando la fila de position pasa de old_row a new_row.
+    Las listas de posiciones se mantienen ordenadas para respetar el orden de la colección.
+    '''
+    for field, index in indexes.items():
+        old_key = str(old_row.get(field))
+        new_key = str(new_row.get(field))
+        if old_key == new_key:
+            continue
+        positions = index.get(old_key, [])
+        if position in positions:
+            positions.remove(position)
+            if not positions:
+                index.pop(old_key)
+        insort(index.setdefault(new_key, []), position)
+
+def _original_position(removed, position):
+    '''
+    Recibe la lista ordenada removed de posiciones (según los índices) de filas ya sacadas,
+    y la posición actual de una fila. Devuelve la posición que esa fila tiene en los índices.
+    '''
+    original = position
+    while True:
+        candidate = position + bisect_right(removed, original)
+        if candidate == original:
+            return original
+        original = candidate
+
+def _apply_removals(entry):
+    '''
+    Pasa a los índices de una entrada de la caché las filas sacadas por tombstones:
+    se quitan sus posiciones y las posteriores se corren, todo en una sola pasada.
+    '''
+    removed = entry["removed"]
+    if not removed:
+        return
+    dropped = set(removed)
+    for index in entry["indexes"].values():
+        for key in list(index):
+            positions = [p - bisect_left(removed, p) for p in index[key] if p not in dropped]
+            if positions:
+                index[key] = positions
+            else:
+                index.pop(key)
+    entry["removed"] = []
+
+def _indexed_position(file_path, field, value):
+    '''
+    Devuelve la posición actual de la primera fila de file_path cuyo campo field vale value, o None.
+    Si la entrada de la caché tiene tombstones pendientes de pasar a los índices, la posición se
+    traduce con removed en lugar de reescribir los índices: así una serie de deletes no recorre la colección.
+    '''
+    rows = _json_rows(file_path)
+    entry = _collection_cache.get(file_path)
+    pending = (
+        _current_transaction() is None and entry is not None and entry["rows"] is rows
+        and entry["removed"] and field in entry["indexes"]
+    )
+    if pending:
+        removed = entry["removed"]
+        for original in entry["indexes"][field].get(str(value), []):
+            shift = bisect_left(removed, original)
+            if shift == len(removed) or removed[shift] != original:
+                return original - shift
+        return None
+
+    _, index = _field_index(file_path, field)
+    positions = index.get(str(value))
+    if not positions:
+        return None
+    return positions[0]
+
+def _rows_by_field(file_path, field, value):
+    '''
+    Devuelve la lista de filas de file_path cuyo campo field vale value (ver _iter_by_field).
+    '''
+    return list(_iter_by_field(file_path, field, value))
+
+def _scan_max_id(file_path, id_field="id"):
+    '''
+    Recorre la colección de file_path y devuelve el mayor id numérico encontrado (0 si está vacía).
+    '''
+    rows = _json_rows(file_path)
+    max_id = 0
+    for row in rows:
+        try:
+            current = int(str(row.get(id_field, "0")))
+            if current > max_id:
+                max_id = current
+        except Exception:
+            print("ERROR: el campo id no es numerico.")
+    return max_id
+
+def _stamp_to_json(stamp):
+    '''
+    Convierte un stamp de colección a listas para poder guardarlo y compararlo contra counters.json.
+    '''
+    if stamp is None:
+        return None
+    return [list(part) if part is not None else None for part in stamp]
+
+def _load_counters():
+    '''
+    Devuelve el dict de contadores, cargándolo de counters.json la primera vez.
+    Si el archivo no existe o está dañado se empieza con un dict vacío (se recalculan a demanda).
+    '''
+    if not _counters_state["loaded"]:
+        _counters_state["loaded"] = True
+        try:
+            with open(COUNTERS_FILE, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if isinstance(data, dict):
+                _counters.update(data)
+        except Exception:
+            pass
+    return _counters
+
+def _sync_counter(file_path, previous_stamp):
+    '''
+    Se llama después de escribir file_path. Si el contador de la colección estaba al día con
+    previous_stamp (el stamp antes de escribir) se actualiza al nuevo stamp, sino se descarta
+    para que el próximo insert lo recalcule. counters.json se escribe recién al terminar (ver _save_counters).
+    '''
+    counters = _load_counters()
+    key = os.path.basename(file_path)
+    record = counters.get(key)
+    if record is None:
+        return
+    if record.get("stamp") == _stamp_to_json(previous_stamp):
+        record["stamp"] = _stamp_to_json(_collection_stamp(file_path))
+    else:
+        counters.pop(key)
+    _counters_state["dirty"] = True
+
+def _bump_version(file_path):
+    '''
+    Sube la versión de escritura de la colección a la que pertenece file_path (el archivo plano o una partición).
+    '''
+    name = _table_name(_rollup_collection(file_path) or file_path)
+    _write_versions[name] = _write_versions.get(name, 0) + 1
+
+def _bump_all_versions():
+    '''
+    Sube la versión de todas las colecciones: se usa cuando cambian sin pasar por una escritura
+    (rollback de una transacción, cambio de carpeta de datos).
+    '''
+    for path in (USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
+        name = _table_name(path)
+        _write_versions[name] = _write_versions.get(name, 0) + 1
+
+def _drop_counter(file_path):
+    '''
+    Olvida el contador de ids de la colección de file_path (el próximo insert lo recalcula recorriéndola).
+    Se usa cuando la colección se reemplaza entera y el último id guardado ya no vale.
+    '''
+    counters = _load_counters()
+    if counters.pop(os.path.basename(file_path), None) is not None:
+        _counters_state["dirty"] = True
+
+def _reset_counters():
+    '''
+    Vuelve a cero los contadores de todas las colecciones (en memoria y en disco), para cuando se vacían:
+    la próxima escritura de cada colección guarda 0 como último id en su .sum y los ids vuelven a empezar.
+    '''
+    _counters.clear()
+    _counters_state["loaded"] = True
+    _counters_state["dirty"] = False
+    for path in (USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
+        _counters[os.path.basename(path)] = {"last_id": 0, "stamp": None}
+        if _use_sqlite():
+            import db_sqlite
+            db_sqlite.set_last_id(_sqlite(), _table_name(path), 0)
+    if os.path.exists(COUNTERS_FILE):
+        os.remove(COUNTERS_FILE)
+
+def _save_counters():
+    '''
+    Escribe los contadores en counters.json si cambiaron. Se llama al terminar el programa (antes vacía
+    el group commit, así los stamps guardados son los de las colecciones ya escritas). Si el programa se corta
+    antes, los stamps no coinciden y cada contador se recalcula con _persisted_last_id.
+    '''
+    flush_pending_writes()
+    if _counters_state["dirty"] and not _use_sqlite() and os.path.isdir(DB_DIR):
+        _atomic_write_json(COUNTERS_FILE, _counters)
+    _counters_state["dirty"] = False
+
+def _persisted_last_id(file_path, id_field="id"):
+    '''
+    Devuelve el último id asignado en la colección de file_path según lo que hay en disco: el mayor entre
+    el mayor id de sus filas, el last_id de su .sum (o los de sus particiones) y los ids de los tombstones
+    de su journal. Así un id borrado no se vuelve a asignar aunque counters.json no esté al día.
+    '''
+    last_id = _scan_max_id(file_path, id_field)
+    paths = _partition_paths(file_path) if _partitioned(file_path) else [file_path]
+    for path in paths:
+        last_id = max(last_id, (_load_checksums(path) or {}).get("last_id") or 0)
+        for record in _journal_records(path):
+            if record.get("op") == "delete" and str(record.get("id")).isdigit():
+                last_id = max(last_id, int(record.get("id")))
+    return last_id
+
+def _rollup_collection(file_path):
+    '''
+    Devuelve la colección de movimientos (INCOMES_FILE o EXPENSES_FILE) a la que pertenece file_path,
+    que puede ser el archivo plano o una de sus particiones, o None si no es una colección de movimientos.
+    '''
+    for path in (INCOMES_FILE, EXPENSES_FILE):
+        if file_path == path or os.path.dirname(file_path) == _partition_dir(path):
+            return path
+    return None
+
+def _rollup_month(ordinal):
+    '''
+    Devuelve el mes de un ordinal de fecha como "yyyy-mm", o "sin-fecha" si el movimiento no tiene una fecha válida.
+    '''
+    if not ordinal:
+        return "sin-fecha"
+    day = datetime.fromordinal(ordinal)
+    return f"{day.year:04d}-{day.month:02d}"
+
+def _days_apply(days_by_user, user, deltas):
+    '''
+    Aplica al índice diario de user los deltas {ordinal: [monto, cantidad]}.
+    El índice son tres listas paralelas ordenadas por día: "days" (ordinales), "counts" (movimientos del día)
+    y "prefix" (suma acumulada de montos hasta ese día inclusive). Con pocos días se corrige cada uno en su lugar
+    (los movimientos nuevos suelen caer al final, así casi no hay que correr sumas); con muchos, como en una
+    importación, se rearman las listas en una sola pasada. Los días que quedan sin movimientos se borran.
+    '''
+    entry = days_by_user.setdefault(user, {"days": [], "counts": [], "prefix": []})
+    days, counts, prefix = entry["days"], entry["counts"], entry["prefix"]
+    if len(deltas) > DAY_MERGE_THRESHOLD:
+        merged = {}
+        previous = 0.0
+        for day, count, total in zip(days, counts, prefix):
+            merged[day] = [total - previous, count]
+            previous = total
+        for day, (amount, count) in deltas.items():
+            cell = merged.setdefault(day, [0.0, 0])
+            cell[0] += amount
+            cell[1] += count
+        days.clear()
+        counts.clear()
+        prefix.clear()
+        total = 0.0
+        for day in sorted(merged):
+            amount, count = merged[day]
+            if count == 0:
+                continue
+            total = round(total + amount, 9)
+            days.append(day)
+            counts.append(count)
+            prefix.append(total)
+    else:
+        for day, (amount, count) in deltas.items():
+            position = bisect_left(days, day)
+            if position == len(days) or days[position] != day:
+                days.insert(position, day)
+                counts.insert(position, 0)
+                prefix.insert(position, prefix[position - 1] if position else 0.0)
+            counts[position] += count
+            if counts[position] == 0:
+                # El día queda vacío: se saca y a los siguientes se les resta lo que tenía
+                amount = -(prefix[position] - (prefix[position - 1] if position else 0.0))
+                del days[position]
+                del counts[position]
+                del prefix[position]
+            for i in range(position, len(prefix)):
+                prefix[i] = round(prefix[i] + amount, 9)
+    if not days:
+        del days_by_user[user]
+
+def _rollup_add(record, rows, sign):
+    '''
+    Suma (sign = 1) o resta (sign = -1) rows al rollup de una colección: a las celdas por mes y categoría
+    y al índice diario de cada usuario.
+    Las sumas se redondean a 9 decimales para que sumar y restar el mismo monto no deje residuos,
+    y las celdas que quedan sin movimientos se borran.
+    '''
+    cells = record["cells"]
+    day_deltas = {}
+    for row in rows:
+        try:
+            amount = float(row.get("amount", 0.0))
+        except (TypeError, ValueError):
+            amount = 0.0
+        user = str(row.get("user"))
+        ordinal = row_date_ordinal(row)
+        month = _rollup_month(ordinal)
+        category = str(row.get("category"))
+        months = cells.setdefault(user, {})
+        categories = months.setdefault(month, {})
+        cell = categories.setdefault(category, [0.0, 0])
+        cell[0] = round(cell[0] + sign * amount, 9)
+        cell[1] += sign
+        if cell[1] == 0:
+            del categories[category]
+            if not categories:
+                del months[month]
+            if not months:
+                del cells[user]
+        if ordinal:
+            delta = day_deltas.setdefault(user, {}).setdefault(ordinal, [0.0, 0])
+            delta[0] += sign * amount
+            delta[1] += sign
+
+    for user, deltas in day_deltas.items():
+        _days_apply(record["days"], user, deltas)
+
+def _build_rollup(file_path):
+    '''
+    Arma el rollup (celdas e índice diario) de la colección de movimientos file_path recorriéndola una vez.
+    '''
+    record = {"cells": {}, "days": {}}
+    _rollup_add(record, _iter_rows(file_path), 1)
+    return record
+
+def _load_rollup():
+    '''
+    Devuelve el dict del rollup, cargándolo de rollup.json la primera vez.
+    Si el archivo no existe o está dañado se empieza vacío (cada colección se reconstruye a demanda).
+    '''
+    if not _rollup_state["loaded"]:
+        _rollup_state["loaded"] = True
+        try:
+            with open(ROLLUP_FILE, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if isinstance(data, dict):
+                _rollup.update(data)
+        except Exception:
+            pass
+    return _rollup
+
+def _rollup_record(file_path):
+    '''
+    Devuelve el rollup ({"stamp", "cells", "days"}) de la colección de movimientos file_path.
+    Si no hay rollup para la colección, su stamp no coincide con el de la colección en disco
+    o fue guardado antes de que existiera el índice diario, lo reconstruye.
+    '''
+    rollup = _load_rollup()
+    key = os.path.basename(file_path)
+    stamp = _stamp_to_json(_collection_stamp(file_path))
+    record = rollup.get(key)
+    if record is None or record.get("stamp") != stamp or "days" not in record:
+        record = _build_rollup(file_path)
+        record["stamp"] = stamp
+        rollup[key] = record
+        _rollup_state["dirty"] = True
+    return record
+
+def _rollup_apply(file_path, removed, added):
+    '''
+    Aplica al rollup el delta de una escritura ya hecha sobre file_path: resta las filas removed y suma las added.
+    Un update pasa la fila vieja en removed y la nueva en added.
+    Si la colección todavía no tiene rollup no hace nada (se arma completo cuando se lo pida).
+    El mismo delta se aplica al ledger columnar de la colección (ver _ledger_apply).
+    '''
+    collection = _rollup_collection(file_path)
+    if collection is None or _use_sqlite():
+        return
+    _ledger_apply(file_path, collection, removed, added)
+    record = _load_rollup().get(os.path.basename(collection))
+    if record is None or "days" not in record:
+        return
+    _rollup_add(record, removed, -1)
+    _rollup_add(record, added, 1)
+    _rollup_state["dirty"] = True
+
+def _sync_rollup(file_path, previous_stamp):
+    '''
+    Igual que _sync_counter, para el rollup: se llama después de escribir la colección file_path.
+    Si el rollup estaba al día con el stamp anterior se le guarda el nuevo (el delta de la escritura
+    se aplica con _rollup_apply); si no, se descarta para reconstruirlo en la próxima consulta.
+    '''
+    if file_path not in (INCOMES_FILE, EXPENSES_FILE):
+        return
+    _sync_ledger(file_path, previous_stamp)
+    key = os.path.basename(file_path)
+    record = _rollup.get(key)
+    if record is None:
+        return
+    if record.get("stamp") == _stamp_to_json(previous_stamp):
+        record["stamp"] = _stamp_to_json(_collection_stamp(file_path))
+    else:
+        _rollup.pop(key)
+    _rollup_state["dirty"] = True
+
+def _ledger_apply(file_path, collection, removed, added):
+    '''
+    Aplica al ledger en memoria de collection (ver movements_ledger) el delta de una escritura sobre file_path,
+    así una escritura no obliga a reconstruirlo entero. Si la escritura fue sobre una partición
+    (el orden de las filas en la colección completa cambia) o el delta no se puede aplicar, se descarta el ledger.
+    '''
+    cached = _ledger_cache.get(collection)
+    if cached is None:
+        return
+    from ledger import apply_ledger_delta
+    try:
+        applied = file_path == collection and apply_ledger_delta(cached["ledger"], removed, added)
+    except BufferError:
+        # Alguien todavía tiene una vista de las columnas (np.frombuffer): no se pueden redimensionar
+        applied = False
+    if not applied:
+        _ledger_cache.pop(collection)
+
+def _sync_ledger(file_path, previous_stamp):
+    '''
+    Igual que _sync_rollup, para el ledger en memoria de file_path: si estaba al día con el stamp anterior
+    se le guarda el nuevo (el delta lo aplica _ledger_apply); si no, se descarta.
+    '''
+    cached = _ledger_cache.get(file_path)
+    if cached is None:
+        return
+    if cached["stamp"] == previous_stamp:
+        cached["stamp"] = _collection_stamp(file_path)
+    else:
+        _ledger_cache.pop(file_path)
+
+def _reset_rollup():
+    '''
+    Olvida el rollup (en memoria y en disco). Se usa cuando una colección de movimientos
+    se reemplaza entera sin pasar por los deltas.
+    '''
+    _rollup.clear()
+    _rollup_state["loaded"] = True
+    _rollup_state["dirty"] = False
+    if os.path.exists(ROLLUP_FILE):
+        os.remove(ROLLUP_FILE)
+
+def _save_rollup():
+    '''
+    Escribe el rollup en rollup.json si cambió. Se llama al terminar el programa (antes vacía el group commit,
+    así los stamps guardados son los de las colecciones ya escritas).
+    '''
+    flush_pending_writes()
+    if _rollup_state["dirty"] and not _use_sqlite() and os.path.isdir(DB_DIR):
+        _atomic_write_json(ROLLUP_FILE, _rollup)
+    _rollup_state["dirty"] = False
+
+def _next_id_from_collection(file_path, id_field="id"):
+    '''
+    Devuelve como str el próximo id de la colección de file_path.
+    '''
+    return _next_ids(file_path, 1, id_field)[0]
+
+def _next_ids(file_path, count, id_field="id"):
+    '''
+    Devuelve una lista con los próximos count ids (str, contiguos) de la colección de file_path.
+    Usa el contador en memoria (cargado de counters.json); solo recorre la colección si el contador
+    no existe o quedó desactualizado respecto del archivo (ver _persisted_last_id).
+    Los ids quedan reservados en memoria y se persisten con la próxima escritura de la colección.
+    Con el backend sqlite se reservan en su tabla counters (ver db_sqlite.reserve_ids).
+    Si la colección no se puede escribir (ver _check_writable) se corta antes de reservar.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        first = db_sqlite.reserve_ids(_sqlite(), _table_name(file_path), count)
+        return [str(first + i) for i in range(count)]
+
+    _check_writable(file_path)
+    counters = _load_counters()
+    key = os.path.basename(file_path)
+    stamp = _stamp_to_json(_collection_stamp(file_path))
+    record = counters.get(key)
+    if record is None or record.get("stamp") != stamp:
+        record = {"last_id": _persisted_last_id(file_path, id_field), "stamp": stamp}
+        counters[key] = record
+    first = record["last_id"] + 1
+    record["last_id"] += count
+    _counters_state["dirty"] = True
+    return [str(first + i) for i in range(count)]
+
+def _find_row_index(file_path, id_value, id_field="id"):
+    """
+    Recibe un file_path que es un str con el valor del path de la colección donde vamos a buscar
+    Tambien recibe un id_value que es el valor del id que estamos buscando
+    Y por último de forma opcional recibe un id_field que es un str que define como se llama el campo id en la colección, por defecto 'id'
+    Devuelve el índice del primer registro cuyo id == id_value.
+    Si no existe, devuelve None.
+    La búsqueda usa el índice de la colección por id_field, no recorre las filas.
+    """
+    if _use_sqlite():
+        import db_sqlite
+        return db_sqlite.position_of(_sqlite(), _table_name(file_path), id_value)
+    return _indexed_position(file_path, id_field, id_value)
+
+def _get_row(file_path, id_value):
+    '''
+    Devuelve la fila de la colección cuyo id == id_value, o None si no existe.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        return db_sqlite.get_row(_sqlite(), _table_name(file_path), id_value)
+    position = _find_row_index(file_path, id_value)
+    if position is None:
+        return None
+    return _json_rows(file_path)[position]
+
+def _checksum_path(file_path):
+    return file_path + ".sum"
+
+def _last_good_path(file_path):
+    return file_path + ".bak"
+
+def _file_checksum(file_path):
+    '''
+    Devuelve {"crc": CRC32, "size": bytes} del contenido de file_path, o None si no se puede leer.
+    Lee en bloques de 1 MB; zlib.crc32 suelta el GIL, así varios archivos se verifican en paralelo.
+    '''
+    crc = 0
+    size = 0
+    try:
+        with open(file_path, "rb") as f:
+            while True:
+                block = f.read(1024 * 1024)
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+    except OSError:
+        return None
+    return {"crc": crc, "size": size}
+
+def _load_checksums(file_path):
+    '''
+    Devuelve el contenido de <file_path>.sum, o None si no existe o no se puede leer.
+    '''
+    try:
+        with open(_checksum_path(file_path), "r", encoding="utf-8") as f:
+            checksums = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return checksums if isinstance(checksums, dict) else None
+
+def _replace_with_link(src, dst, use_copy=False):
+    '''
+    Hace que dst tenga el mismo contenido que src con un hard link (sin copiar datos) o, si el sistema
+    de archivos no los permite o se pide use_copy, con una copia. El reemplazo de dst es atómico.
+    El link sirve cuando src se va a reemplazar enseguida (nunca se modifica en el lugar), así no comparten el archivo.
+    '''
+    tmp_path = dst + ".link"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        if use_copy:
+            raise OSError
+        os.link(src, tmp_path)
+    except OSError:
+        import shutil
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+def _rotate_last_good(file_path, checksum):
+    '''
+    Se llama antes de reemplazar file_path por un contenido nuevo con ese checksum ({"crc", "size"}).
+    Pasa el contenido actual a <file_path>.bak y guarda en <file_path>.sum el checksum nuevo
+    como "current", el del contenido actual como "previous" y el último id asignado de la colección
+    como "last_id" (así el contador se persiste con la misma escritura, ver _persisted_last_id).
+    El .sum se escribe antes que el archivo: si hay un corte en el medio, el archivo sigue
+    coincidiendo con "previous" y se considera válido. No sincroniza la carpeta: lo hace la escritura
+    del archivo, que va enseguida y está en la misma carpeta.
+    '''
+    checksums = _load_checksums(file_path) or {}
+    previous = checksums.get("current")
+    if previous is not None and os.path.exists(file_path):
+        _replace_with_link(file_path, _last_good_path(file_path))
+    counter = _load_counters().get(os.path.basename(_rollup_collection(file_path) or file_path))
+    _atomic_write_json(_checksum_path(file_path), {
+        "current": checksum,
+        "previous": previous,
+        "last_id": counter["last_id"] if counter is not None else checksums.get("last_id")
+    }, sync_dir=False)
+
+def _parses_as_collection(file_path):
+    '''
+    Indica si file_path es un array JSON completo (una colección que se puede leer).
+    '''
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            return isinstance(json.load(file), list)
+    except (OSError, ValueError):
+        return False
+
+def _verify_file(file_path):
+    '''
+    Verifica file_path contra su .sum. Si coincide solo se calcula el CRC32, sin parsear JSON.
+    Si no coincide pero el archivo es un array JSON completo, es un cambio hecho por fuera de db.py (una edición a mano):
+    se devuelve "modificado" y la colección se puede leer, pero no se escribe ni se guarda su checksum
+    hasta que alguien acepte los cambios con accept_collection_changes.
+    Si no se puede parsear (dañado o cortado) se recupera desde el último snapshot bueno (.bak), que tiene
+    la versión anterior a la última escritura. El archivo dañado no se borra: queda como <file_path>.corrupt.
+    Si no hay snapshot bueno se devuelve "dañado" y la colección no se escribe.
+    Devuelve "ok", "sin checksum" (archivo anterior a los checksums), "modificado", "recuperado", "dañado" o "no existe".
+    '''
+    _held_files.pop(file_path, None)
+    checksums = _load_checksums(file_path)
+    if checksums is None:
+        return "sin checksum" if os.path.exists(file_path) else "no existe"
+    accepted = [checksum for checksum in (checksums.get("current"), checksums.get("previous")) if checksum]
+
+    checksum = _file_checksum(file_path)
+    if checksum in accepted:
+        return "ok"
+    if checksum is not None and _parses_as_collection(file_path):
+        _held_files[file_path] = "modificado"
+        return "modificado"
+    last_good = _last_good_path(file_path)
+    if os.path.exists(last_good) and _file_checksum(last_good) in accepted:
+        if os.path.exists(file_path):
+            _replace_with_link(file_path, file_path + ".corrupt")
+        # Copia y no link: el .bak tiene que seguir intacto aunque después se escriba el archivo en el lugar
+        _replace_with_link(last_good, file_path, use_copy=True)
+        return "recuperado"
+    if not os.path.exists(file_path):
+        return "no existe"
+    _held_files[file_path] = "dañado"
+    return "dañado"
+
+def _check_writable(file_path):
+    '''
+    Lanza CollectionIntegrityError si file_path quedó retenido por la verificación (ver _held_files):
+    una colección dañada o editada por fuera no se escribe hasta que se acepten sus cambios.
+    '''
+    status = _held_files.get(file_path)
+    if status == "modificado":
+        raise CollectionIntegrityError(
+            f"{_relative_name(file_path)} fue modificado por fuera del programa: "
+            f"aceptá los cambios con accept_collection_changes('{_relative_name(file_path)}') antes de escribir"
+        )
+    if status is not None:
+        raise CollectionIntegrityError(f"{_relative_name(file_path)} está dañado y no se puede escribir")
+
+def _relative_name(file_path):
+    '''
+    Devuelve file_path relativo a DB_DIR, como aparece en el resultado de verify_collections.
+    '''
+    return os.path.relpath(file_path, DB_DIR)
+
+def _verify_journal(journal):
+    '''
+    Verifica cada línea del journal contra su CRC32 (ver _journal_line).
+    Si hay líneas dañadas (sin contar una última línea cortada) las copia a <journal>.corrupt para revisarlas a mano
+    y devuelve "dañado": los inserts o tombstones de esas líneas no se aplican. Si no, devuelve "ok".
+    '''
+    damaged = []
+    with open(journal, "r", encoding="utf-8", errors="replace") as file:
+        for line in file:
+            if line.endswith("\n") and _parse_journal_line(line) is None:
+                damaged.append(line)
+    if not damaged:
+        return "ok"
+    with open(journal + ".corrupt", "w", encoding="utf-8") as file:
+        file.writelines(damaged)
+    return "dañado"
+
+def _write_json_blocks(file, data, indent):
+    '''
+    Escribe data como JSON en file (abierto en modo binario) en bloques de WRITE_BATCH fragmentos del encoder,
+    calculando el CRC32 a medida que escribe: nunca se arma el texto completo en memoria.
+    Cada bloque se junta con "".join sobre islice, así los fragmentos no pasan de a uno por código Python.
+    Devuelve {"crc", "size"} de lo escrito.
+    '''
+    crc = 0
+    size = 0
+    chunks = json.JSONEncoder(ensure_ascii=False, indent=indent).iterencode(data)
+    while True:
+        block = "".join(islice(chunks, WRITE_BATCH)).encode("utf-8")
+        if not block:
+            return {"crc": crc, "size": size}
+        crc = zlib.crc32(block, crc)
+        size += len(block)
+        file.write(block)
+
+def _atomic_write_json(file_path, data, indent=None, last_good=False, sync_dir=True):
+    '''
+    Escribe data como JSON en file_path de forma atómica:
+    primero en file_path + ".tmp", después fsync y por último os.replace sobre el original.
+    Si algo falla, el archivo original queda intacto.
+    Con last_good (colecciones) y CHECKSUM_WRITES también actualiza el .sum y el .bak (ver _rotate_last_good).
+    Con sync_dir=False no se sincroniza la carpeta después del rename (queda para la próxima escritura en ella).
+    '''
+    tmp_path = file_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            checksum = _write_json_blocks(f, data, indent)
+            f.flush()
+            if FSYNC_WRITES:
+                os.fsync(f.fileno())
+        if last_good and CHECKSUM_WRITES:
+            _rotate_last_good(file_path, checksum)
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if sync_dir and FSYNC_WRITES and hasattr(os, "O_DIRECTORY"):
+        # Sincronizamos el directorio para que el rename también sea durable
+        dir_fd = os.open(os.path.dirname(file_path) or ".", os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+def _serialized(function):
+    '''
+    Decorador para las escrituras de este módulo: toma _pending_lock durante toda la lectura-modificación-escritura,
+    así el flush del group commit (que corre en el hilo del timer) no puede escribir en el medio
+    y la escritura no se arma sobre una versión vieja de la colección.
+    '''
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with _pending_lock:
+            return function(*args, **kwargs)
+    return wrapper
+
+@_serialized
+def _write_collection(file_path, rows, indexes=None):
+    _bump_version(file_path)
+    if _use_sqlite():
+        import db_sqlite
+        db_sqlite.replace_all(_sqlite(), _table_name(file_path), rows)
+        return
+
+    if _partitioned(file_path):
+        groups = _group_by_partition(file_path, rows)
+        with _partition_writes(file_path):
+            for path in sorted(set(_partition_paths(file_path)) | set(groups)):
+                # Solo se reescriben las particiones que cambiaron
+                partition_rows = groups.get(path, [])
+                if partition_rows != _json_rows(path):
+                    _write_collection(path, partition_rows)
+        return
+
+    _check_writable(file_path)
+    tx = _current_transaction()
+    if tx is not None:
+        # Si rows es la lista en staging ya está modificada en el lugar: no se copia de nuevo
+        if tx["rows"].get(file_path) is not rows:
+            tx["rows"][file_path] = list(rows)
+        tx["indexes"][file_path] = indexes or {}
+        tx["dirty"].add(file_path)
+        return
+
+    if GROUP_COMMIT_MS > 0:
+        _stage_write(file_path, rows, indexes)
+        return
+    _write_now(file_path, rows, indexes)
+
+@contextmanager
+def _partition_writes(file_path):
+    '''
+    Envuelve las escrituras sobre las particiones de file_path para mantener al día
+    el contador de ids de la colección (se guarda con el stamp de la colección completa).
+    '''
+    previous_stamp = _collection_stamp(file_path)
+    yield
+    _sync_counter(file_path, previous_stamp)
+    _sync_rollup(file_path, previous_stamp)
+
+def _stage_write(file_path, rows, indexes):
+    '''
+    Deja la escritura de file_path pendiente para el próximo group commit.
+    Las lecturas de la colección ven las filas pendientes, y la primera escritura de la ventana
+    programa el flush a los GROUP_COMMIT_MS milisegundos.
+    '''
+    with _pending_lock:
+        _pending_writes[file_path] = {"rows": list(rows), "indexes": indexes}
+        entry = _collection_cache.get(file_path)
+        if entry is not None:
+            entry["rows"] = _pending_writes[file_path]["rows"]
+            entry["indexes"] = indexes or {}
+            entry["removed"] = []
+        if not _pending_timer:
+            timer = threading.Timer(GROUP_COMMIT_MS / 1000.0, flush_pending_writes)
+            timer.daemon = True
+            _pending_timer.append(timer)
+            timer.start()
+
+def _flush_pending(file_path):
+    '''
+    Si file_path tiene una escritura pendiente de group commit, la escribe ya.
+    '''
+    with _pending_lock:
+        pending = _pending_writes.get(file_path)
+        if pending is not None:
+            # La entrada se saca recién cuando el archivo y la caché ya tienen las filas:
+            # mientras tanto las lecturas siguen viendo las filas pendientes y no el archivo viejo
+            _write_now(file_path, pending["rows"], pending["indexes"])
+            _pending_writes.pop(file_path, None)
+
+def _write_now(file_path, rows, indexes=None):
+    previous_stamp = _collection_stamp(file_path)
+    try:
+        _atomic_write_json(file_path, rows, indent=2, last_good=True)
+    except Exception:
+        # Los índices pudieron quedar modificados: descartamos la entrada para releer del disco
+        _collection_cache.pop(file_path, None)
+        raise
+    # El snapshot ya contiene todo lo que había en el journal
+    journal = _journal_path(file_path)
+    if os.path.exists(journal):
+        os.remove(journal)
+    # Refrescamos la caché con lo que acabamos de escribir para no volver a parsearlo
+    _cache_put(file_path, _collection_stamp(file_path), list(rows), indexes)
+    _sync_counter(file_path, previous_stamp)
+    _sync_rollup(file_path, previous_stamp)
+
+def _journal_write(file_path, records):
+    '''
+    Agrega records al final del journal de file_path, una línea JSON por registro.
+    Devuelve el path del journal.
+    '''
+    _check_writable(file_path)
+    _bump_version(file_path)
+    journal = _journal_path(file_path)
+    with open(journal, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(_journal_line(record))
+        f.flush()
+        if FSYNC_WRITES:
+            os.fsync(f.fileno())
+    return journal
+
+def _journal_append(file_path, new_rows):
+    '''
+    Agrega new_rows al journal de file_path, una línea JSON por fila, sin reescribir el snapshot.
+    Si la colección estaba en caché se actualiza en el lugar.
+    Cuando el journal supera JOURNAL_COMPACT_BYTES se compacta sobre el snapshot.
+    '''
+    _flush_pending(file_path)
+    previous_stamp = _collection_stamp(file_path)
+    entry = _cache_get(file_path, previous_stamp)
+
+    journal = _journal_write(file_path, [{"op": "insert", "row": row} for row in new_rows])
+
+    if entry is not None:
+        _apply_removals(entry)
+        rows = entry["rows"]
+        indexes = entry["indexes"]
+        for row in new_rows:
+            rows.append(row)
+            _index_append(indexes, row, len(rows) - 1)
+        _cache_put(file_path, _collection_stamp(file_path), rows, indexes)
+    _sync_counter(file_path, previous_stamp)
+    _sync_rollup(file_path, previous_stamp)
+
+    if os.path.getsize(journal) > JOURNAL_COMPACT_BYTES:
+        _compact(file_path)
+
+def _journal_delete(file_path, deletions):
+    '''
+    Recibe una lista deletions de tuplas (id, posición), ordenada por posición.
+    Borra esas filas agregando un tombstone por cada una al journal de file_path, con una sola escritura
+    y sin reescribir el snapshot. Si la colección estaba en caché se sacan las filas de la lista;
+    los índices no se reescriben, las posiciones sacadas se anotan en "removed" (ver _indexed_position).
+    Cuando el journal supera JOURNAL_COMPACT_BYTES se compacta sobre el snapshot.
+    '''
+    _flush_pending(file_path)
+    previous_stamp = _collection_stamp(file_path)
+    entry = _cache_get(file_path, previous_stamp)
+
+    journal = _journal_write(file_path, [{"op": "delete", "id": str(id_value)} for id_value, _ in deletions])
+
+    if entry is not None:
+        rows = entry["rows"]
+        removed = entry["removed"]
+        if entry["indexes"]:
+            originals = [_original_position(removed, position) for _, position in deletions]
+            removed = sorted(removed + originals)
+        if len(deletions) == 1:
+            rows.pop(deletions[0][1])
+        else:
+            dropped = set(position for _, position in deletions)
+            rows[:] = [row for position, row in enumerate(rows) if position not in dropped]
+        refreshed = _cache_put(file_path, _collection_stamp(file_path), entry["rows"], entry["indexes"])
+        if refreshed is not None:
+            refreshed["removed"] = removed
+    _sync_counter(file_path, previous_stamp)
+    _sync_rollup(file_path, previous_stamp)
+
+    if os.path.getsize(journal) > JOURNAL_COMPACT_BYTES:
+        _compact(file_path)
+
+def _compact(file_path):
+    '''
+    Vuelca el journal de file_path sobre el snapshot y lo elimina.
+    '''
+    if _partitioned(file_path):
+        for path in _partition_paths(file_path):
+            _compact(path)
+        return
+    if _use_sqlite() or not os.path.exists(_journal_path(file_path)):
+        return
+    rows = read_collection(file_path)
+    _write_collection(file_path, rows)
+
+def _insert_row(file_path, row):
+    '''
+    Agrega row al final de la colección guardada en file_path.
+    '''
+    _insert_rows(file_path, [row])
+
+@_serialized
+def _insert_rows(file_path, new_rows):
+    '''
+    Agrega new_rows al final de la colección guardada en file_path con una sola escritura.
+    Si la colección tiene el journal activo se agregan líneas al journal,
+    sino se reescribe el archivo completo.
+    '''
+    if not new_rows:
+        return
+    if _use_sqlite():
+        import db_sqlite
+        _bump_version(file_path)
+        db_sqlite.insert_rows(_sqlite(), _table_name(file_path), new_rows)
+        return
+    if _partitioned(file_path):
+        with _partition_writes(file_path):
+            for path, rows in _group_by_partition(file_path, new_rows).items():
+                _insert_rows(path, rows)
+        return
+    if _journal_enabled(file_path):
+        _journal_append(file_path, new_rows)
+    else:
+        indexes = _current_indexes(file_path)
+        rows = _writable_rows(file_path)
+        for row in new_rows:
+            rows.append(row)
+            _index_append(indexes, row, len(rows) - 1)
+        _write_collection(file_path, rows, indexes)
+    _rollup_apply(file_path, [], new_rows)
+
+def _insert_many(file_path, records, validate, build_row):
+    '''
+    Inserta varios registros en la colección de file_path con una sola escritura.
+    - validate: función que recibe un registro y devuelve (ok, msg)
+    - build_row: función que recibe un registro y su nuevo id y devuelve la fila a guardar
+    Los registros válidos reciben ids contiguos.
+    Devuelve una lista con un resultado por registro, en el mismo orden:
+    (True, fila_guardada) o (False, "motivo").
+    '''
+    results = []
+    valid_positions = []
+    for record in records:
+        ok, msg = validate(record)
+        if ok:
+            valid_positions.append(len(results))
+            results.append(None)
+        else:
+            results.append((False, msg))
+
+    new_ids = _next_ids(file_path, len(valid_positions))
+    new_rows = []
+    for position, new_id in zip(valid_positions, new_ids):
+        row = build_row(records[position], new_id)
+        new_rows.append(row)
+        results[position] = (True, row)
+
+    _insert_rows(file_path, new_rows)
+    return results
+
+def _user_names():
+    '''
+    Devuelve un conjunto con los nombres de usuario existentes para pasarle a los validadores.
+    Con el backend json es el índice por "name" de users.json, que vive en la caché y se invalida
+    con cada escritura de la colección (users_insert/users_update/users_delete) o si el archivo cambia.
+    Con el backend sqlite se guarda en _user_names_cache y se invalida en esas mismas funciones.
+    '''
+    if not _use_sqlite():
+        _, index = _field_index(USERS_FILE, "name")
+        return index
+    if "names" not in _user_names_cache:
+        _user_names_cache["names"] = frozenset(row.get("name") for row in _cached_rows(USERS_FILE))
+    return _user_names_cache["names"]
+
+def _movement_row(movement, new_id):
+    '''
+    Devuelve la fila de un ingreso o egreso tal como se guarda en la colección.
+    Además de la fecha "dd/mm/yyyy" guarda date_ordinal, para que las consultas por fecha comparen enteros.
+    '''
+    return {
+        "id": new_id,
+        "amount": movement.get("amount"),
+        "category": movement.get("category"),
+        "date": movement.get("date"),
+        "date_ordinal": _date_ordinal(movement.get("date")),
+        "user": movement.get("user")
+    }
+
+def _goal_row(goal, new_id, start_date):
+    '''
+    Devuelve la fila de un objetivo de ahorro tal como se guarda en la colección.
+    '''
+    return {
+        "id": new_id,
+        "name": goal.get("name"),
+        "category": goal.get("category"),
+        "total_amount": goal.get("total_amount"),
+        "saved_amount": goal.get("saved_amount"),
+        "start_date": start_date,
+        "end_date": goal.get("end_date"),
+        "status": goal.get("status"),
+        "user": goal.get("user")
+    }
 
+@_serialized
+def _replace_row(file_path, id_value, row):
+    '''
+    Reemplaza la fila de la colección cuyo id == id_value por row (row puede traer otro id) y guarda.
+    Los índices de la colección se actualizan en lugar de recalcularse.
+    Devuelve True si la fila existía, False si no.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        _bump_version(file_path)
+        return db_sqlite.replace_row(_sqlite(), _table_name(file_path), id_value, row)
+
+    if _partitioned(file_path):
+        old_row = _get_row(file_path, id_value)
+        if old_row is None:
+            return False
+        old_path = _row_partition(file_path, old_row)
+        new_path = _row_partition(file_path, row)
+        with _partition_writes(file_path):
+            if old_path == new_path:
+                _replace_row(old_path, id_value, row)
+            else:
+                # Cambió el mes: la fila se mueve de partición
+                _delete_by_id(old_path, id_value)
+                _insert_rows(new_path, [row])
+        return True
+
+    position = _find_row_index(file_path, id_value)
+    if position is None:
+        return False
+    indexes = _current_indexes(file_path)
+    rows = _writable_rows(file_path)
+    old_row = rows[position]
+    _index_replace(indexes, old_row, row, position)
+    rows[position] = row
+    _write_collection(file_path, rows, indexes)
+    _rollup_apply(file_path, [old_row], [row])
+    return True
 
-### Generales
-## Privadas
-def _collection_path(name):
+@_serialized
+def _delete_by_id(file_path, id_value, id_field="id"):
+    '''
+    Borra de la colección la fila cuyo id == id_value.
+    Devuelve True si la borró, False si no existía.
+    Con TOMBSTONE_DELETES (y fuera de una transacción) solo se agrega un tombstone al journal,
+    sino se reescribe la colección sin la fila y los índices se recalculan en la próxima búsqueda.
+    '''
+    if _use_sqlite():
+        import db_sqlite
+        _bump_version(file_path)
+        return db_sqlite.delete_row(_sqlite(), _table_name(file_path), id_value)
+
+    if _partitioned(file_path):
+        old_row = _get_row(file_path, id_value)
+        if old_row is None:
+            return False
+        with _partition_writes(file_path):
+            _delete_by_id(_row_partition(file_path, old_row), id_value, id_field)
+        return True
+
+    position = _find_row_index(file_path, id_value, id_field)
+    if position is None:
+        return False
+    old_row = _cached_rows(file_path)[position]
+    if TOMBSTONE_DELETES and id_field == "id" and _current_transaction() is None:
+        _journal_delete(file_path, [(id_value, position)])
+    else:
+        rows = _writable_rows(file_path)
+        rows.pop(position)
+        _write_collection(file_path, rows)
+    _rollup_apply(file_path, [old_row], [])
+    return True
+
+def _movement_filter(user=None, start_date=None, end_date=None, category=None):
+    '''
+    Arma el filtro de *_delete_where / *_update_where. Los criterios que son None no filtran;
+    start_date y end_date ("dd/mm/yyyy") son inclusivos.
+    Devuelve (True, predicate) o (False, "motivo") si no hay ningún criterio o una fecha es inválida.
+    '''
+    if user is None and start_date is None and end_date is None and category is None:
+        return (False, "Hay que indicar al menos un filtro (user, start_date, end_date o category)")
+
+    bounds = []
+    for date_str in (start_date, end_date):
+        if date_str is None:
+            bounds.append(None)
+            continue
+        ordinal = _date_ordinal(date_str)
+        if ordinal is None:
+            return (False, f"Fecha inválida '{date_str}' (usar dd/mm/yyyy)")
+        bounds.append(ordinal)
+    start, end = bounds
+
+    def predicate(row):
+        if user is not None and row.get("user") != user:
+            return False
+        if category is not None and row.get("category") != category:
+            return False
+        if start is not None or end is not None:
+            ordinal = row_date_ordinal(row)
+            if ordinal is None:
+                return False
+            if start is not None and ordinal < start:
+                return False
+            if end is not None and ordinal > end:
+                return False
+        return True
+
+    return (True, predicate)
+
+@_serialized
+def _delete_where(file_path, predicate):
+    '''
+    Borra de la colección todas las filas que cumplen predicate, en una sola pasada y con una sola escritura:
+    con TOMBSTONE_DELETES se agregan todos los tombstones juntos al journal, sino se reescribe la colección.
+    Con el layout particionado solo se escriben las particiones que tenían filas a borrar.
+    Devuelve la cantidad de filas borradas.
+    '''
+    if _partitioned(file_path):
+        with _partition_writes(file_path):
+            return sum(_delete_where(path, predicate) for path in _partition_paths(file_path))
+
+    rows = _cached_rows(file_path)
+    if TOMBSTONE_DELETES and not _use_sqlite() and _current_transaction() is None:
+        deletions = [(row.get("id"), position) for position, row in enumerate(rows) if predicate(row)]
+        if deletions:
+            removed = [rows[position] for _, position in deletions]
+            _journal_delete(file_path, deletions)
+            _rollup_apply(file_path, removed, [])
+        return len(deletions)
+
+    kept = []
+    removed = []
+    for row in rows:
+        (removed if predicate(row) else kept).append(row)
+    if removed:
+        _write_collection(file_path, kept)
+        _rollup_apply(file_path, removed, [])
+    return len(removed)
+
+@_serialized
+def _update_where(file_path, predicate, changes, validate, fields=MOVEMENT_UPDATE_FIELDS):
+    '''
+    Aplica changes (dict de campos a reemplazar) a todas las filas de la colección que cumplen predicate,
+    en una sola pasada y con una sola escritura. Cada fila resultante se valida con validate;
+    si alguna no es válida no se modifica ninguna.
+    changes solo puede traer campos de fields: el id, el dueño y los campos derivados (date_ordinal) no se tocan.
+    Devuelve (True, cantidad de filas actualizadas) o (False, "motivo").
+    '''
+    if not changes:
+        return (False, "No hay campos para actualizar")
+    invalid = sorted(str(field) for field in changes if field not in fields)
+    if invalid:
+        return (False, f"No se pueden modificar los campos {', '.join(invalid)} (solo {', '.join(fields)})")
+
+    rows = _writable_rows(file_path)
+    updates = []
+    for position, row in enumerate(rows):
+        if not predicate(row):
+            continue
+        updated = dict(row)
+        updated.update(changes)
+        if "date" in changes:
+            updated["date_ordinal"] = _date_ordinal(updated.get("date"))
+        valid, msg = validate(updated)
+        if not valid:
+            return (False, f"El registro {row.get('id')} quedaría inválido: {msg}")
+        updates.append((position, updated))
+
+    # Se aplican recién después de validar todas: rows puede ser la lista en staging de una transacción
+    old_rows = []
+    new_rows = []
+    for position, updated in updates:
+        old_rows.append(rows[position])
+        new_rows.append(updated)
+        rows[position] = updated
+
+    if new_rows:
+        _write_collection(file_path, rows)
+        _rollup_apply(file_path, old_rows, new_rows)
+    return (True, len(new_rows))
+
+
+## Publicas
+def flush_pending_writes():
+    '''
+    Escribe a disco todas las escrituras pendientes de group commit.
+    Se llama sola al cerrarse la ventana de GROUP_COMMIT_MS y al terminar el programa.
+    '''
+    with _pending_lock:
+        for timer in _pending_timer:
+            timer.cancel()
+        _pending_timer.clear()
+        for file_path in list(_pending_writes):
+            _flush_pending(file_path)
+
+atexit.register(flush_pending_writes)
+atexit.register(_save_rollup)
+atexit.register(_save_counters)
+
+@contextmanager
+def transaction():
+    '''
+    Context manager para agrupar varias operaciones de este módulo:
+
+        with transaction():
+            incomes_insert(...)
+            goals_update(...)
+
+    Dentro del bloque cada colección se lee como mucho una vez y las modificaciones quedan en memoria.
+    Al salir sin errores se hace commit: una sola escritura por colección modificada.
+    Si el bloque lanza una excepción se hace rollback: no se escribe nada y los contadores de ids vuelven atrás.
+    Una transacción dentro de otra se suma a la de afuera.
+    '''
+    if _current_transaction() is not None:
+        yield
+        return
+
+    if _use_sqlite():
+        import db_sqlite
+        try:
+            with db_sqlite.transaction(_sqlite()):
+                yield
+        except BaseException:
+            _bump_all_versions()
+            raise
+        return
+
+    import copy
+    tx = {"rows": {}, "indexes": {}, "dirty": set(), "counters": copy.deepcopy(_load_counters())}
+    _transactions.append(tx)
+    try:
+        yield
+    except BaseException:
+        _transactions.pop()
+        _counters.clear()
+        _counters.update(tx["counters"])
+        _counters_state["dirty"] = True
+        # Los deltas del rollup ya se aplicaron: se descarta y se reconstruye en la próxima consulta.
+        # No se vuelve a cargar rollup.json porque puede no incluir escrituras pendientes de group commit.
+        _rollup.clear()
+        _rollup_state["loaded"] = True
+        _ledger_cache.clear()
+        _bump_all_versions()
+        raise
+    _transactions.pop()
+    for file_path in tx["dirty"]:
+        _write_collection(file_path, tx["rows"][file_path], tx["indexes"].get(file_path))
+
+def set_db_dir(path):
+    '''
+    Recibe un path de tipo str.
+    Cambia la carpeta donde se guardan las colecciones (por defecto ./data) y limpia la caché y los contadores.
+    Útil para pruebas y benchmarks que no deben tocar los datos reales.
+    '''
+    global DB_DIR, USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE, COUNTERS_FILE, ROLLUP_FILE, SQLITE_FILE
+    _save_rollup()
+    _save_counters()
+    DB_DIR = path
+    USERS_FILE = os.path.join(DB_DIR, "users.json")
+    INCOMES_FILE = os.path.join(DB_DIR, "incomes.json")
+    EXPENSES_FILE = os.path.join(DB_DIR, "expenses.json")
+    GOALS_FILE = os.path.join(DB_DIR, "goals.json")
+    COUNTERS_FILE = os.path.join(DB_DIR, "counters.json")
+    ROLLUP_FILE = os.path.join(DB_DIR, "rollup.json")
+    SQLITE_FILE = os.path.join(DB_DIR, "finanzas.sqlite3")
+    cache_clear()
+    _held_files.clear()
+    _counters.clear()
+    _counters_state["loaded"] = False
+    _rollup.clear()
+    _rollup_state["loaded"] = False
+    _bump_all_versions()
+
+def cache_stats():
+    '''
+    Devuelve un dict con las estadísticas de la caché de colecciones:
+    hits, misses, cantidad de entradas y bytes ocupados (tamaño en disco de los archivos cacheados).
+    '''
+    total = 0
+    for entry in _collection_cache.values():
+        total += entry["size"]
+    return {
+        "hits": _cache_stats["hits"],
+        "misses": _cache_stats["misses"],
+        "entries": len(_collection_cache),
+        "bytes": total
+    }
+
+def cache_clear():
+    '''
+    Vacía la caché de colecciones y reinicia los contadores.
+    '''
+    _collection_cache.clear()
+    _ledger_cache.clear()
+    _cache_stats["hits"] = 0
+    _cache_stats["misses"] = 0
+
+def compact_collection(name):
+    '''
+    Recibe un name de formato string ('users' | 'incomes' | 'expenses' | 'goals').
+    Vuelca el journal de la colección sobre su archivo .json y lo elimina:
+    los inserts pasan al snapshot y las filas con tombstone se borran físicamente.
+    Devuelve True si se pudo compactar, False si el name es inválido.
+    '''
+    path = _collection_path(name)
+    if path is None:
+        return False
+    _compact(path)
+    return True
+
+def collection_version(name):
+    '''
+    Recibe un name de formato string ('users' | 'incomes' | 'expenses' | 'goals').
+    Devuelve la tupla (versión de escritura, stamp en disco) de la colección, o None si el name es inválido.
+    La versión sube con cada escritura hecha por este proceso, aunque todavía esté en una transacción o
+    pendiente de group commit; el stamp detecta los cambios hechos por fuera (con sqlite es None).
+    Si la tupla no cambió, tampoco cambió el contenido de la colección.
+    '''
+    path = _collection_path(name)
+    if path is None:
+        return None
+    stamp = None if _use_sqlite() else _collection_stamp(path)
+    return (_write_versions.get(name, 0), stamp)
+
+def get_by_id(name, id_value):
+    '''
+    Recibe un name de formato string ('users' | 'incomes' | 'expenses' | 'goals') y un id_value.
+    Devuelve el registro de esa colección cuyo id coincide con id_value, o None si no existe
+    o si el name es inválido. La búsqueda usa el índice por id de la colección.
+    '''
+    path = _collection_path(name)
+    if path is None:
+        return None
+    return _get_row(path, id_value)
+
+def _movements_path(name):
+    '''
+    Devuelve la tupla (path, categorías) de una colección de movimientos ('incomes' | 'expenses'),
+    o (None, None) si el name es inválido.
+    '''
     lower = str(name).strip().lower()
-    if lower == "users":
-        return USERS_FILE
     if lower == "incomes":
-        return INCOMES_FILE
+        return (INCOMES_FILE, income_categories)
     if lower == "expenses":
-        return EXPENSES_FILE
-    if lower == "goals":
-        return GOALS_FILE
-    print(f"Error: colección desconocida '{name}'. Las opciones válidas son 'users', 'incomes', o 'expenses'.")
-    return None
+        return (EXPENSES_FILE, expense_categories)
+    print(f"Error: colección de movimientos desconocida '{name}'. Las opciones válidas son 'incomes' o 'expenses'.")
+    return (None, None)
 
-def read_collection(file_path):
+def binary_ledger_path(name):
+    '''
+    Devuelve el path del ledger binario de una colección de movimientos: data/incomes.bin o data/expenses.bin
+    '''
+    path, _ = _movements_path(name)
+    if path is None:
+        return None
+    return os.path.splitext(path)[0] + ".bin"
+
+def export_binary_ledger(name):
+    '''
+    Recibe un name de formato string ('incomes' | 'expenses').
+    Convierte la colección actual al formato binario de ancho fijo (ver ledger.py) en data/<name>.bin.
+    Devuelve la cantidad de registros exportados, o None si el name es inválido.
+    '''
+    from ledger import write_binary_ledger
+    path, categories = _movements_path(name)
+    if path is None:
+        return None
+    return write_binary_ledger(binary_ledger_path(name), _cached_rows(path), categories)
+
+def import_binary_ledger(name):
+    '''
+    Recibe un name de formato string ('incomes' | 'expenses').
+    Reemplaza la colección por el contenido de data/<name>.bin (la conversión inversa de export_binary_ledger).
+    Devuelve la cantidad de registros importados, o None si el name es inválido o el archivo no se puede abrir.
+    '''
+    from ledger import open_binary_ledger, close_binary_ledger, binary_rows
+    path, _ = _movements_path(name)
+    if path is None:
+        return None
+    binary = open_binary_ledger(binary_ledger_path(name))
+    if binary is None:
+        return None
     try:
-        if not os.path.exists(file_path):
-            return []
-        with open(file_path, "r", encoding="utf-8") as file:
-            data = json.load(file)
-            return data if isinstance(data, list) else []
-    except Exception:
-        return []
+        rows = binary_rows(binary)
+    finally:
+        close_binary_ledger(binary)
+    _write_collection(path, rows)
+    _drop_counter(path)
+    _rollup.pop(os.path.basename(path), None)
+    _ledger_cache.pop(path, None)
+    return len(rows)
+
+def movements_ledger(name):
+    '''
+    Recibe un name de formato string ('incomes' | 'expenses').
+    Devuelve la colección en formato columnar (ver ledger.py), para agregar montos sin recorrer dicts.
+    El ledger se guarda en memoria aparte de la caché de filas y se reconstruye solo si la colección cambió,
+    así sigue disponible aunque la colección sea demasiado grande para CACHE_MAX_BYTES.
+    Si el name es inválido devuelve None.
+    '''
+    from ledger import build_ledger
+    path, categories = _movements_path(name)
+    if path is None:
+        return None
 
-def _next_id_from_collection(file_path, id_field="id"):
-    # TODO: podría guardar un json de contadores con el último valor de id de cáda colección para evitar recorrer las colecciones 
-    rows = read_collection(file_path)
-    max_id = 0
-    for row in rows:
-        try:
-            current = int(str(row.get(id_field, "0")))
-            if current > max_id:
-                max_id = current
-        except Exception:
-            print("ERROR: el campo id no es numerico.")
-    return str(max_id + 1)
+    # Con sqlite, escrituras pendientes o dentro de una transacción el stamp del archivo no alcanza
+    if _use_sqlite() or _rows_in_memory(path):
+        return build_ledger(_cached_rows(path), categories)
 
-def _find_row_index(file_path, id_value, id_field="id"):
-    """
-    Recibe un file_path que es un str con el valor del path de la colección donde vamos a buscar
-    Tambien recibe un id_value que es el valor del id que estamos buscando
-    Y por último de forma opcional recibe un id_field que es un str que define como se llama el campo id en la colección, por defecto 'id'
-    Devuelve el índice del primer registro cuyo id == id_value.
-    Si no existe, devuelve None.
-    """
-    rows = read_collection(file_path)
-    for i, row in enumerate(rows):
-        if str(row.get(id_field, "")) == str(id_value):
-            return i
-    return None
+    stamp = _collection_stamp(path)
+    cached = _ledger_cache.get(path)
+    if cached is not None and cached["stamp"] == stamp:
+        return cached["ledger"]
 
-def _write_collection(file_path, rows):
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(rows, f, ensure_ascii=False, indent=2)
+    ledger = build_ledger(_cached_rows(path), categories)
+    _ledger_cache[path] = {"stamp": stamp, "ledger": ledger}
+    return ledger
 
+def movements_ledger_ready(name):
+    '''
+    Recibe un name de formato string ('incomes' | 'expenses').
+    Indica si movements_ledger(name) devuelve el ledger guardado en memoria: ya está al día, o se arma una vez
+    y las escrituras siguientes le aplican su delta (ver _ledger_apply) en lugar de reconstruirlo.
+    Devuelve False si cada llamada lo reconstruiría entero: con sqlite, con escrituras pendientes o dentro
+    de una transacción, y con el layout particionado si todavía no está armado (ahí cada escritura lo descarta).
+    '''
+    path, _ = _movements_path(name)
+    if path is None or _use_sqlite() or _rows_in_memory(path):
+        return False
+    if not _partitioned(path):
+        return True
+    cached = _ledger_cache.get(path)
+    return cached is not None and cached["stamp"] == _collection_stamp(path)
+
+def movements_count(name, username):
+    '''
+    Recibe un name de formato string ('incomes' | 'expenses') y un username.
+    Devuelve la cantidad de movimientos de username en esa colección, sumada del rollup mensual
+    (sin recorrer las filas; con el backend sqlite se cuentan las filas del usuario).
+    Si el name es inválido devuelve None.
+    '''
+    path, _ = _movements_path(name)
+    if path is None:
+        return None
+    if _use_sqlite():
+        return sum(1 for _ in _iter_by_field(path, "user", username))
+    months = _rollup_record(path)["cells"].get(str(username), {})
+    return sum(cell[1] for categories in months.values() for cell in categories.values())
+
+def iter_collection(name, predicate=None):
+    '''
+    Recibe un name de formato string ('users' | 'incomes' | 'expenses' | 'goals') y opcionalmente
+    un predicate: una función que recibe una fila y devuelve True si hay que incluirla.
+    Devuelve un generador con las filas de la colección (las que cumplen predicate, si se pasó).
+    Si la colección no entra en la caché se lee del disco elemento por elemento,
+    así la memoria no crece con el tamaño del archivo. Si el name es inválido no genera nada.
+    '''
+    path = _collection_path(name)
+    if path is None:
+        return
+    for row in _iter_rows(path):
+        if predicate is None or predicate(row):
+            yield row
 
-## Publicas
 def read_collection_by_name(name):
     """
     Recibe un name de formato string 
@@ -114,7 +2312,6 @@ def users_insert(user):
     if not ok:
         return False
     
-    rows = read_collection(USERS_FILE)
     new_id = _next_id_from_collection(USERS_FILE)
 
     user_final = {
@@ -126,8 +2323,8 @@ def users_insert(user):
         "role": user.get("role")
     }
 
-    rows.append(user_final)
-    _write_collection(USERS_FILE, rows)
+    _insert_row(USERS_FILE, user_final)
+    _user_names_cache.clear()
     return True
 
 def users_update(user):
@@ -145,32 +2342,26 @@ def users_update(user):
     if not ok:
         return False
     
-    rows = read_collection(USERS_FILE)
     new_id = _next_id_from_collection(USERS_FILE)
 
-    rows[index] = {
+    _user_names_cache.clear()
+    _replace_row(USERS_FILE, userExist.get("id"), {
         "id": new_id,
         "name": user.get("name"),
         "password": user.get("password"),
         "age": user.get("age"),
         "genre": user.get("genre"),
         "role": user.get("role")
-    }
-
-    _write_collection(USERS_FILE, rows)
+    })
 
 def users_delete(user_id):
     '''
     Recibe el id de un usuario, busca que exista.
     En caso de existir lo elimina, sino envía un error.
     '''
-    rows = read_collection(USERS_FILE)
-    updated_rows = [row for row in rows if str(row.get("id")) != str(user_id)]
-
-    if len(updated_rows) == len(rows):
+    if not _delete_by_id(USERS_FILE, user_id):
         return (False, "El ingreso que intenta borrar no existe")
-
-    _write_collection(USERS_FILE, updated_rows)
+    _user_names_cache.clear()
 
     return (True, "El usuario fue borrado satisfactoriamente")
 
@@ -179,14 +2370,12 @@ def users_find_by_name(username):
     Recibe el nombre de un usuario, busca que exista.
     En caso de existir lo devuelve completo, sino envía un error.
     '''
-    rows = read_collection(USERS_FILE)
-    user = None
-    for index, row in enumerate(rows):
-        if row.get("name") == username:
-            user = row
-    if not user: 
+    matches = _rows_by_field(USERS_FILE, "name", username)
+    if not matches:
         return (None, False)
 
+    user = matches[-1]
+    index = _find_row_index(USERS_FILE, user.get("id"))
     return (index, user)
 
 def login_check(username, password):
@@ -214,34 +2403,42 @@ def incomes_insert(income):
     - category en income_categories
     - formato de fecha
     - user existe en users.json
-    Se asigna id Auto-incremental (max(id)+1).
+    Se asigna id Auto-incremental (último id de counters.json + 1).
     Devuelve (True, income_final) o (False, "motivo").
     '''
-    users = read_collection(USERS_FILE)
+    users = _user_names()
     ok, msg = validate_income(income, income_categories, users)
     if not ok:
         return (False, msg)
 
-    rows = read_collection(INCOMES_FILE)
     new_id = _next_id_from_collection(INCOMES_FILE)
+    income_final = _movement_row(income, new_id)
 
-    income_final = {
-        "id": new_id,
-        "amount": income.get("amount"),
-        "category": income.get("category"),
-        "date": income.get("date"),
-        "user": income.get("user")
-    }
-
-    rows.append(income_final)
-    _write_collection(INCOMES_FILE, rows)
+    _insert_row(INCOMES_FILE, income_final)
 
     return (True, income_final)
 
+def incomes_insert_many(incomes, validate=True):
+    '''
+    Recibe incomes de tipo list de dict.
+    Guarda todos los ingresos válidos en incomes.json con una sola lectura de users.json,
+    ids contiguos y una sola escritura. Aplica los mismos chequeos que incomes_insert.
+    Con validate=False no se vuelven a chequear (para registros ya validados, ver importer.py).
+    Devuelve una lista con un resultado por ingreso: (True, income_final) o (False, "motivo").
+    '''
+    if not validate:
+        return _insert_many(INCOMES_FILE, incomes, lambda income: (True, None), _movement_row)
+    users = _user_names()
+    return _insert_many(
+        INCOMES_FILE,
+        incomes,
+        lambda income: validate_income(income, income_categories, users),
+        _movement_row
+    )
+
 def incomes_id_is_valid(income_id):
     # Buscar índice del registro a actualizar antes de pedir datos nuevos
-    index = _find_row_index(INCOMES_FILE, income_id)
-    if index is None:
+    if _get_row(INCOMES_FILE, income_id) is None:
         print(f"No existe ingreso con id {income_id}. Por favor intentelo nuevamente.")
         return False
     return True
@@ -258,28 +2455,21 @@ def incomes_update(income):
     if not income_id:
         return (False, "falta campo id")
 
-    rows = read_collection(INCOMES_FILE)
-    if not rows:
+    if not _cached_rows(INCOMES_FILE):
         return (False, "no hay registros en incomes.json")
 
     # Buscar índice del registro a actualizar
     index = _find_row_index(INCOMES_FILE, income_id)
-    #if index is None:
-    #    return (False, f"no existe ingreso con id {income_id}")
+    if index is None:
+        return (False, f"no existe ingreso con id {income_id}")
 
-    users = read_collection(USERS_FILE)
+    users = _user_names()
     valid, msg = validate_income(income, income_categories, users)
     if not valid:
         return (False, msg)
 
-    rows[index] = {
-        "id": str(income_id),
-        "amount": income.get("amount"),
-        "category": income.get("category"),
-        "date": income.get("date"),
-        "user": income.get("user")
-    }
-    _write_collection(INCOMES_FILE, rows)
+    if not _replace_row(INCOMES_FILE, income_id, _movement_row(income, str(income_id))):
+        return (False, f"no existe ingreso con id {income_id}")
 
     return (True, None)
 
@@ -291,25 +2481,75 @@ def incomes_delete(income_id):
     (True, "El ingreso fue borrado satisfactoriamente")
     o (False, "El ingreso que intenta borrar no existe").
     '''
-    rows = read_collection(INCOMES_FILE)
-    updated_rows = [row for row in rows if str(row.get("id")) != str(income_id)]
-
-    if len(updated_rows) == len(rows):
+    if not _delete_by_id(INCOMES_FILE, income_id):
         return (False, "El ingreso que intenta borrar no existe")
 
-    _write_collection(INCOMES_FILE, updated_rows)
-
     return (True, "El ingreso fue borrado satisfactoriamente")
 
+def incomes_delete_where(user=None, start_date=None, end_date=None, category=None):
+    '''
+    Borra todos los ingresos que cumplen el filtro: user, rango de fechas start_date..end_date
+    ("dd/mm/yyyy", inclusivo) y category. Los criterios que no se pasan no filtran, pero hay que pasar al menos uno.
+    Se recorre la colección una sola vez y se escribe una sola vez.
+    Devuelve (True, cantidad de ingresos borrados) o (False, "motivo").
+    '''
+    ok, predicate = _movement_filter(user, start_date, end_date, category)
+    if not ok:
+        return (False, predicate)
+    return (True, _delete_where(INCOMES_FILE, predicate))
+
+def incomes_update_where(changes, user=None, start_date=None, end_date=None, category=None):
+    '''
+    Recibe changes de tipo dict con los campos a modificar (amount, category o date; el id y el user no se pueden cambiar)
+    y el mismo filtro que incomes_delete_where.
+    Aplica changes a todos los ingresos que cumplen el filtro con una sola escritura. Cada ingreso modificado
+    pasa por los mismos chequeos que el update; si alguno queda inválido no se modifica ninguno.
+    Devuelve (True, cantidad de ingresos actualizados) o (False, "motivo").
+    '''
+    ok, predicate = _movement_filter(user, start_date, end_date, category)
+    if not ok:
+        return (False, predicate)
+    users = _user_names()
+    return _update_where(INCOMES_FILE, predicate, changes, lambda row: validate_income(row, income_categories, users))
+
 def incomes_by_user(username):
     '''
     Recibe username de tipo str.
     Devuelve una lista con todos los ingresos (incomes) donde el campo "user" coincide con username.
     Si no hay coincidencias, devuelve una lista vacía.
     '''
-    rows = read_collection(INCOMES_FILE)
-    results = [row for row in rows if row.get("user") == username]
-    return results
+    return _rows_by_field(INCOMES_FILE, "user", username)
+
+def incomes_iter_by_user(username):
+    '''
+    Igual que incomes_by_user pero devuelve un generador: las filas se producen a medida que se recorren,
+    sin armar la lista completa (ver iter_collection).
+    '''
+    return _iter_by_field(INCOMES_FILE, "user", username)
+
+def incomes_iter_by_user_month(username, month, year):
+    '''
+    Recibe username de tipo str, month y year de tipo int.
+    Devuelve un generador con los ingresos de username de ese mes.
+    Con el layout particionado (ver migrate_to_partitions) solo se lee la partición de ese mes.
+    '''
+    return _iter_by_user_month(INCOMES_FILE, username, month, year)
+
+def incomes_month_totals(username, month, year):
+    '''
+    Recibe username de tipo str, month y year de tipo int.
+    Devuelve un dict {categoria: total} con los ingresos de username de ese mes, sacado del rollup mensual:
+    no recorre los ingresos, el costo depende solo de la cantidad de categorías.
+    '''
+    return _month_totals(INCOMES_FILE, username, month, year)
+
+def incomes_between(username, start_date=None, end_date=None):
+    '''
+    Recibe username de tipo str y las fechas start_date y end_date ("dd/mm/yyyy", inclusive; None deja el extremo abierto).
+    Devuelve la suma (float) de los ingresos de username entre esas fechas, o None si alguna fecha no es válida.
+    Sale del índice diario del rollup (dos búsquedas binarias), no recorre los ingresos.
+    '''
+    return _range_total(INCOMES_FILE, username, start_date, end_date)
 
 ### Expenses
 def expenses_insert(expense):
@@ -320,38 +2560,46 @@ def expenses_insert(expense):
     - category en expense_categories
     - formato de fecha
     - user existe en users.json
-    Se asigna id Auto-incremental (max(id)+1)
+    Se asigna id Auto-incremental (último id de counters.json + 1)
     Devuelve (True, expense_final) o (False, "motivo").
     '''
 
     # Validación
-    users = read_collection(USERS_FILE)
+    users = _user_names()
     ok, msg = validate_expense(expense, expense_categories, users)
     if not ok:
         return (False, msg)
     
-    # Leer colección y calcular próximo id
-    rows = read_collection(EXPENSES_FILE)
+    # Calcular próximo id
     new_id = _next_id_from_collection(EXPENSES_FILE)
-
-    expense_final = {
-        "id": new_id,
-        "amount": expense.get("amount"),
-        "category": expense.get("category"),
-        "date": expense.get("date"),
-        "user": expense.get("user")
-    }
+    expense_final = _movement_row(expense, new_id)
 
     # Guardar en base de datos
-    rows.append(expense_final)
-    _write_collection(EXPENSES_FILE, rows)
+    _insert_row(EXPENSES_FILE, expense_final)
 
     return (True, expense_final)
 
+def expenses_insert_many(expenses, validate=True):
+    '''
+    Recibe expenses de tipo list de dict.
+    Guarda todos los egresos válidos en expenses.json con una sola lectura de users.json,
+    ids contiguos y una sola escritura. Aplica los mismos chequeos que expenses_insert.
+    Con validate=False no se vuelven a chequear (para registros ya validados, ver importer.py).
+    Devuelve una lista con un resultado por egreso: (True, expense_final) o (False, "motivo").
+    '''
+    if not validate:
+        return _insert_many(EXPENSES_FILE, expenses, lambda expense: (True, None), _movement_row)
+    users = _user_names()
+    return _insert_many(
+        EXPENSES_FILE,
+        expenses,
+        lambda expense: validate_expense(expense, expense_categories, users),
+        _movement_row
+    )
+
 def expenses_id_is_valid(expense_id):
     # Buscar índice del registro a actualizar antes de pedir datos nuevos
-    index = _find_row_index(EXPENSES_FILE, expense_id)
-    if index is None:
+    if _get_row(EXPENSES_FILE, expense_id) is None:
         print(f"No existe egreso con id {expense_id}. Por favor intentelo nuevamente.")
         return False
     return True
@@ -373,31 +2621,22 @@ def expenses_update(expense):
     if not expense_id:
         return (False, "falta campo id")
     
-    rows = read_collection(EXPENSES_FILE)
-    if not rows:
+    if not _cached_rows(EXPENSES_FILE):
         return (False, "no hay registros en expenses.json")
 
     index = _find_row_index(EXPENSES_FILE, expense_id)
-    #if index is None:
-    #    return (False, f"no existe egreso con id {expense_id}")
+    if index is None:
+        return (False, f"no existe egreso con id {expense_id}")
 
     # Validar las reglas de negocio antes de reemplazar
-    users = read_collection(USERS_FILE)
+    users = _user_names()
     valid, msg = validate_expense(expense, expense_categories, users)
     if not valid:
         return (False, msg)
 
-    # Actualizar registro existente
-    rows[index] = {
-        "id": str(expense_id),
-        "amount": expense.get("amount"),
-        "category": expense.get("category"),
-        "date": expense.get("date"),
-        "user": expense.get("user")
-    }
-
-    # Guardar en disco
-    _write_collection(EXPENSES_FILE, rows)
+    # Actualizar registro existente y guardar en disco
+    if not _replace_row(EXPENSES_FILE, expense_id, _movement_row(expense, str(expense_id))):
+        return (False, f"no existe egreso con id {expense_id}")
 
     return (True, None)
 
@@ -409,27 +2648,76 @@ def expenses_delete(expense_id):
     En caso de éxito: (True, "El egreso fue borrado satisfactoriamente")
     En caso de que no encuentre el expense: (False, "El egreso que intenta borrar no existe").
     '''
-    rows = read_collection(EXPENSES_FILE)
-    updated_rows = [row for row in rows if str(row.get("id")) != str(expense_id)]
-
-    # Si la cantidad no cambió, no existía
-    if len(updated_rows) == len(rows):
+    # Si no se borró nada, no existía
+    if not _delete_by_id(EXPENSES_FILE, expense_id):
         return (False, "El egreso que intenta borrar no existe")
 
-    # Guardar cambios
-    _write_collection(EXPENSES_FILE, updated_rows)
-
     return (True, "El egreso fue borrado satisfactoriamente")
     
+def expenses_delete_where(user=None, start_date=None, end_date=None, category=None):
+    '''
+    Borra todos los egresos que cumplen el filtro: user, rango de fechas start_date..end_date
+    ("dd/mm/yyyy", inclusivo) y category. Los criterios que no se pasan no filtran, pero hay que pasar al menos uno.
+    Se recorre la colección una sola vez y se escribe una sola vez.
+    Devuelve (True, cantidad de egresos borrados) o (False, "motivo").
+    '''
+    ok, predicate = _movement_filter(user, start_date, end_date, category)
+    if not ok:
+        return (False, predicate)
+    return (True, _delete_where(EXPENSES_FILE, predicate))
+
+def expenses_update_where(changes, user=None, start_date=None, end_date=None, category=None):
+    '''
+    Recibe changes de tipo dict con los campos a modificar (amount, category o date; el id y el user no se pueden cambiar)
+    y el mismo filtro que expenses_delete_where.
+    Aplica changes a todos los egresos que cumplen el filtro con una sola escritura. Cada egreso modificado
+    pasa por los mismos chequeos que el update; si alguno queda inválido no se modifica ninguno.
+    Devuelve (True, cantidad de egresos actualizados) o (False, "motivo").
+    '''
+    ok, predicate = _movement_filter(user, start_date, end_date, category)
+    if not ok:
+        return (False, predicate)
+    users = _user_names()
+    return _update_where(EXPENSES_FILE, predicate, changes, lambda row: validate_expense(row, expense_categories, users))
+
 def expenses_by_user(username):
     '''
     Recibe username de tipo str.
     Devuelve una lista con todos los egresos (expenses) donde el campo "user" coincide con username.
     Si no hay coincidencias, devuelve una lista vacía.
     '''
-    rows = read_collection(EXPENSES_FILE)
-    results = [row for row in rows if row.get("user") == username]
-    return results
+    return _rows_by_field(EXPENSES_FILE, "user", username)
+
+def expenses_iter_by_user(username):
+    '''
+    Igual que expenses_by_user pero devuelve un generador: las filas se producen a medida que se recorren,
+    sin armar la lista completa (ver iter_collection).
+    '''
+    return _iter_by_field(EXPENSES_FILE, "user", username)
+
+def expenses_iter_by_user_month(username, month, year):
+    '''
+    Recibe username de tipo str, month y year de tipo int.
+    Devuelve un generador con los egresos de username de ese mes.
+    Con el layout particionado (ver migrate_to_partitions) solo se lee la partición de ese mes.
+    '''
+    return _iter_by_user_month(EXPENSES_FILE, username, month, year)
+
+def expenses_month_totals(username, month, year):
+    '''
+    Recibe username de tipo str, month y year de tipo int.
+    Devuelve un dict {categoria: total} con los egresos de username de ese mes, sacado del rollup mensual:
+    no recorre los egresos, el costo depende solo de la cantidad de categorías.
+    '''
+    return _month_totals(EXPENSES_FILE, username, month, year)
+
+def expenses_between(username, start_date=None, end_date=None):
+    '''
+    Recibe username de tipo str y las fechas start_date y end_date ("dd/mm/yyyy", inclusive; None deja el extremo abierto).
+    Devuelve la suma (float) de los egresos de username entre esas fechas, o None si alguna fecha no es válida.
+    Sale del índice diario del rollup (dos búsquedas binarias), no recorre los egresos.
+    '''
+    return _range_total(EXPENSES_FILE, username, start_date, end_date)
 
 ### Goals
 
@@ -443,38 +2731,41 @@ def goals_insert(goal):
     - end_date sean fechas válidas
     - status esté entre los estados válidos
     - user existe en users.json
-    Se asigna id Auto-incremental (max(id)+1)
+    Se asigna id Auto-incremental (último id de counters.json + 1)
     Devuelve (True, expense_final) o (False, "motivo").
     '''
-    users = read_collection(USERS_FILE)
+    users = _user_names()
     ok, msg = validate_goal(goal, goal_categories, goals_status, users)
     if not ok:
         return (False, msg)
     
-    # Leer colección y calcular próximo id
-    rows = read_collection(GOALS_FILE)
+    # Calcular próximo id
     new_id = _next_id_from_collection(GOALS_FILE)
 
     today_str = datetime.now().strftime("%d/%m/%Y")
-
-    goal_final = {
-        "id": new_id,
-        "name": goal.get("name"),
-        "category": goal.get("category"),
-        "total_amount": goal.get("total_amount"),
-        "saved_amount": goal.get("saved_amount"),
-        "start_date": today_str,
-        "end_date": goal.get("end_date"),
-        "status": goal.get("status"),
-        "user": goal.get("user")
-    }
+    goal_final = _goal_row(goal, new_id, today_str)
 
     # Guardar en base de datos
-    rows.append(goal_final)
-    _write_collection(GOALS_FILE, rows)
+    _insert_row(GOALS_FILE, goal_final)
 
     return (True, goal_final)
 
+def goals_insert_many(goals):
+    '''
+    Recibe goals de tipo list de dict.
+    Guarda todos los objetivos de ahorro válidos en goals.json con una sola lectura de users.json,
+    ids contiguos y una sola escritura. Aplica los mismos chequeos que goals_insert.
+    Devuelve una lista con un resultado por objetivo: (True, goal_final) o (False, "motivo").
+    '''
+    users = _user_names()
+    today_str = datetime.now().strftime("%d/%m/%Y")
+    return _insert_many(
+        GOALS_FILE,
+        goals,
+        lambda goal: validate_goal(goal, goal_categories, goals_status, users),
+        lambda goal, new_id: _goal_row(goal, new_id, today_str)
+    )
+
 def goals_update(goal):
     '''
     Recibe goal de tipo dict.
@@ -494,24 +2785,23 @@ def goals_update(goal):
     if not goal_id:
         return (False, "falta campo id")
     
-    rows = read_collection(GOALS_FILE)
-    if not rows:
+    if not _cached_rows(GOALS_FILE):
         return (False, "no hay registros en goals.json")
 
     index = _find_row_index(GOALS_FILE, goal_id)
-    #if index is None:
-    #    return (False, f"no existe egreso con id {goal_id}")
+    if index is None:
+        return (False, f"no existe meta con id {goal_id}")
 
     # Validar las reglas de negocio antes de reemplazar
-    users = read_collection(USERS_FILE)
+    users = _user_names()
     valid, msg = validate_goal(goal, goal_categories, goals_status, users)
     if not valid:
         return (False, msg)
     
-    original_start_date = rows[index].get("start_date")
+    original_start_date = _get_row(GOALS_FILE, goal_id).get("start_date")
 
-    # Actualizar registro existente
-    rows[index] = {
+    # Actualizar registro existente y guardar en disco
+    updated = _replace_row(GOALS_FILE, goal_id, {
         "id": str(goal_id),
         "name": goal.get("name"),
         "category": goal.get("category"),
@@ -521,10 +2811,9 @@ def goals_update(goal):
         "end_date": goal.get("end_date"),
         "status": goal.get("status"),
         "user": goal.get("user")
-    }
-
-    # Guardar en disco
-    _write_collection(GOALS_FILE, rows)
+    })
+    if not updated:
+        return (False, f"no existe meta con id {goal_id}")
 
     return (True, None)
 
@@ -536,16 +2825,10 @@ def goals_delete(goal_id):
     En caso de éxito: (True, "La meta fue borrada satisfactoriamente")
     En caso de que no encuentre el expense: (False, "La meta que intenta borrar no existe").
     '''
-    rows = read_collection(GOALS_FILE)
-    updated_rows = [row for row in rows if str(row.get("id")) != str(goal_id)]
-
-    # Si la cantidad no cambió, no existía
-    if len(updated_rows) == len(rows):
+    # Si no se borró nada, no existía
+    if not _delete_by_id(GOALS_FILE, goal_id):
         return (False, "El objetivo de ahorro que intenta borrar no existe")
 
-    # Guardar cambios
-    _write_collection(GOALS_FILE, updated_rows)
-
     return (True, "El objetivo de ahorro fue borrado satisfactoriamente")
     
 def goals_by_user(username):
@@ -554,9 +2837,7 @@ def goals_by_user(username):
     Devuelve una lista con todos las metas (goals) donde el campo "user" coincide con username.
     Si no hay coincidencias, devuelve una lista vacía.
     '''
-    rows = read_collection(GOALS_FILE)
-    results = [row for row in rows if row.get("user") == username]
-    return results
+    return _rows_by_field(GOALS_FILE, "user", username)
 
 ### Boostrap DDBB
 def ensure_db_files():
@@ -568,13 +2849,229 @@ def ensure_db_files():
     - goals.json
     Si falta alguno, lo inicializa con [].
     No imprime ni pide input. Es solo para inicializar la bbdd en caso de que no exista
+    Con el backend sqlite además crea las tablas si no existen.
+    Con el backend json antes verifica los checksums de las colecciones (ver verify_collections),
+    recuperando las que estén dañadas, y devuelve ese resultado. Si JOURNAL_MODE y TOMBSTONE_DELETES están
+    apagados, los journals que hayan quedado se vuelcan sobre sus colecciones, así en disco quedan solo los .json.
     '''
     os.makedirs(DB_DIR, exist_ok=True)
+    report = {}
+    if _use_sqlite():
+        _sqlite()
+    else:
+        report = verify_collections()
+        if not JOURNAL_MODE and not TOMBSTONE_DELETES and not _held_files:
+            for path in (USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
+                _compact(path)
 
     for path in (USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
-        if not os.path.exists(path):
+        if not os.path.exists(path) and not _partitioned(path):
             with open(path, "w", encoding="utf-8") as file:
                 json.dump([], file, ensure_ascii=False)
+    return report
+
+def verify_collections():
+    '''
+    Verifica en paralelo (un hilo por archivo) el checksum de cada archivo de colección, incluidas
+    las particiones por mes, y el CRC32 de cada línea de los journals.
+    Los archivos que coinciden solo se leen una vez para calcular el CRC32; los que no coinciden se parsean:
+    si son JSON válido se informan como editados por fuera (ver accept_collection_changes),
+    y si no se recuperan desde el último snapshot bueno.
+    Devuelve un dict {archivo relativo a DB_DIR: estado} con los estados de _verify_file y _verify_journal.
+    '''
+    paths = []
+    for path in (USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
+        if _partitioned(path):
+            paths.extend(_partition_paths(path))
+        else:
+            paths.append(path)
+    paths.extend(_journal_path(path) for path in list(paths) if os.path.exists(_journal_path(path)))
+
+    def verify(path):
+        return _verify_journal(path) if path.endswith(".jsonl") else _verify_file(path)
+
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(8, len(paths))) as pool:
+        statuses = list(pool.map(verify, paths))
+
+    report = {}
+    for path, status in zip(paths, statuses):
+        if status == "recuperado":
+            _collection_cache.pop(path, None)
+        report[_relative_name(path)] = status
+    if "recuperado" in statuses:
+        _collection_cache.clear()
+        _ledger_cache.clear()
+    return report
+
+def accept_collection_changes(file_name):
+    '''
+    Recibe un file_name de tipo str, relativo a DB_DIR, como aparece en verify_collections (ej: 'incomes.json').
+    Acepta el contenido actual de una colección que verify_collections informó como "modificado":
+    guarda su checksum como "current" (el .bak y el último id asignado no cambian) y la vuelve a habilitar para escribir.
+    Devuelve True si se aceptaron los cambios, False si la colección no estaba pendiente de aceptar.
+    '''
+    file_path = os.path.join(DB_DIR, file_name)
+    if _held_files.get(file_path) != "modificado" or not _parses_as_collection(file_path):
+        return False
+    checksums = _load_checksums(file_path) or {}
+    # "previous" sigue siendo el del .bak, así el .bak se puede seguir usando para recuperar
+    _atomic_write_json(_checksum_path(file_path), {
+        "current": _file_checksum(file_path),
+        "previous": checksums.get("previous"),
+        "last_id": checksums.get("last_id")
+    })
+    del _held_files[file_path]
+    return True
+
+def set_storage_backend(name):
+    '''
+    Recibe un name de tipo str ('json' | 'sqlite').
+    Cambia el backend de almacenamiento que usan todas las funciones de este módulo.
+    Devuelve True si el backend es válido, False si no lo es.
+    '''
+    global STORAGE_BACKEND
+    if name not in STORAGE_BACKENDS:
+        print(f"Error: backend desconocido '{name}'. Las opciones válidas son {STORAGE_BACKENDS}.")
+        return False
+    STORAGE_BACKEND = name
+    _user_names_cache.clear()
+    ensure_db_files()
+    return True
+
+def migrate_json_to_sqlite():
+    '''
+    Copia el contenido actual de data/*.json (incluido el journal si lo hay) a la base SQLite,
+    reemplazando lo que hubiera en sus tablas. Se ejecuta una sola vez antes de pasar al backend sqlite.
+    También copia el último id asignado de cada colección, así los ids siguen igual que con el backend json.
+    Devuelve un dict {colección: cantidad de filas migradas}.
+    '''
+    import db_sqlite
+    os.makedirs(DB_DIR, exist_ok=True)
+    migrated = {}
+    for path in (USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
+        table = _table_name(path)
+        migrated[table] = db_sqlite.replace_all(_sqlite(), table, _json_rows(path))
+        counter = _load_counters().get(os.path.basename(path))
+        last_id = _persisted_last_id(path)
+        if counter is not None:
+            last_id = max(last_id, counter["last_id"])
+        db_sqlite.set_last_id(_sqlite(), table, last_id)
+    return migrated
+
+def migrate_to_partitions():
+    '''
+    Pasa incomes y expenses del layout plano (data/incomes.json) al particionado por mes
+    (data/incomes/yyyy-mm.json), incluido el journal si lo hay. Las particiones se escriben primero
+    en una carpeta temporal que después se renombra, así una migración cortada no deja datos a medias.
+    Las colecciones que ya están particionadas se dejan como están.
+    Devuelve un dict {colección: cantidad de filas migradas}.
+    '''
+    import shutil
+    flush_pending_writes()
+    migrated = {}
+    for path in (INCOMES_FILE, EXPENSES_FILE):
+        if _use_sqlite() or _partitioned(path):
+            continue
+        rows = _json_rows(path)
+        directory = _partition_dir(path)
+        tmp_dir = directory + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for partition, group in _group_by_partition(path, rows).items():
+            _atomic_write_json(os.path.join(tmp_dir, os.path.basename(partition)), group, indent=2, last_good=True)
+        os.replace(tmp_dir, directory)
+
+        for old_file in (path, _journal_path(path), _checksum_path(path), _last_good_path(path)):
+            if os.path.exists(old_file):
+                os.remove(old_file)
+        _collection_cache.pop(path, None)
+        migrated[_table_name(path)] = len(rows)
+    return migrated
+
+def backfill_date_ordinals():
+    '''
+    Agrega (o corrige) el campo date_ordinal en los ingresos y egresos guardados antes de que existiera.
+    Se ejecuta una sola vez; cada colección se reescribe solo si tenía filas para completar.
+    Devuelve un dict {colección: cantidad de filas completadas}.
+    '''
+    filled = {}
+    for path in (INCOMES_FILE, EXPENSES_FILE):
+        rows = read_collection(path)
+        count = 0
+        for position, row in enumerate(rows):
+            ordinal = _date_ordinal(row.get("date"))
+            if "date_ordinal" not in row or row["date_ordinal"] != ordinal:
+                updated = dict(row)
+                updated["date_ordinal"] = ordinal
+                rows[position] = updated
+                count += 1
+        if count:
+            _write_collection(path, rows)
+            _rollup.pop(os.path.basename(path), None)
+            _ledger_cache.pop(path, None)
+        filled[_table_name(path)] = count
+    return filled
+
+def rebuild_rollup():
+    '''
+    Reconstruye el rollup mensual e índice diario de incomes y expenses recorriendo las colecciones y lo guarda en rollup.json.
+    Antes lo compara con el que se venía manteniendo con deltas, celda por celda (usuario, mes, categoría)
+    y día por día (usuario, día).
+    Devuelve un dict {colección: cantidad de celdas y días distintos}, o None para una colección que no tenía
+    un rollup al día con el archivo (no hay nada que comparar).
+    '''
+    flush_pending_writes()
+    report = {}
+    rollup = _load_rollup()
+    for path in (INCOMES_FILE, EXPENSES_FILE):
+        key = os.path.basename(path)
+        stamp = _stamp_to_json(_collection_stamp(path))
+        record = rollup.get(key)
+        rebuilt = _build_rollup(path)
+        rebuilt["stamp"] = stamp
+
+        differences = None
+        if record is not None and record.get("stamp") == stamp and "days" in record:
+            differences = 0
+            kept = record["cells"]
+            cells = rebuilt["cells"]
+            for user in set(kept) | set(cells):
+                for month in set(kept.get(user, {})) | set(cells.get(user, {})):
+                    old = kept.get(user, {}).get(month, {})
+                    new = cells.get(user, {}).get(month, {})
+                    for category in set(old) | set(new):
+                        old_cell = old.get(category, [0.0, 0])
+                        new_cell = new.get(category, [0.0, 0])
+                        if old_cell[1] != new_cell[1] or abs(old_cell[0] - new_cell[0]) > 1e-6:
+                            differences += 1
+            for user in set(record["days"]) | set(rebuilt["days"]):
+                old = _days_table(record["days"].get(user))
+                new = _days_table(rebuilt["days"].get(user))
+                for day in set(old) | set(new):
+                    old_day = old.get(day, (0, 0.0))
+                    new_day = new.get(day, (0, 0.0))
+                    if old_day[0] != new_day[0] or abs(old_day[1] - new_day[1]) > 1e-6:
+                        differences += 1
+        rollup[key] = rebuilt
+        report[_table_name(path)] = differences
+
+    _rollup_state["dirty"] = True
+    _save_rollup()
+    return report
+
+def _days_table(entry):
+    '''
+    Convierte el índice diario de un usuario en un dict {ordinal: (cantidad, monto del día)} para compararlo.
+    '''
+    table = {}
+    if entry is None:
+        return table
+    previous = 0.0
+    for day, count, total in zip(entry["days"], entry["counts"], entry["prefix"]):
+        table[day] = (count, total - previous)
+        previous = total
+    return table
 
 def load_sample_data():
     """
@@ -705,6 +3202,8 @@ def delete_data():
     En users.json conserva (o crea) únicamente el usuario admin/1234.
     """
     ensure_db_files()
+    _reset_counters()
+    _reset_rollup()
 
     for path in (INCOMES_FILE, EXPENSES_FILE, GOALS_FILE):
         _write_collection(path, [])
@@ -730,6 +3229,7 @@ def delete_data():
         admin_user["id"] = "1"
 
     _write_collection(USERS_FILE, [admin_user])
+    _user_names_cache.clear()
     print("Base de datos limpiada. Se mantuvo el usuario 'admin' (password: 1234).")
 
 ### EXPORTS ### 
@@ -743,22 +3243,53 @@ __all__ = [
     "expense_categories",
 
     # General
+    "transaction",
     "read_collection_by_name",
     "read_collection",
+    "iter_collection",
+    "movements_ledger",
+    "movements_ledger_ready",
+    "movements_count",
+    "binary_ledger_path",
+    "export_binary_ledger",
+    "import_binary_ledger",
+    "get_by_id",
+    "row_date_ordinal",
+    "month_bounds",
+    "compact_collection",
+    "collection_version",
+    "cache_stats",
+    "cache_clear",
+    "flush_pending_writes",
+    "set_db_dir",
 
     # Incomes
     "incomes_insert",
+    "incomes_insert_many",
     "incomes_id_is_valid",
     "incomes_update",
     "incomes_delete",
+    "incomes_delete_where",
+    "incomes_update_where",
     "incomes_by_user",
+    "incomes_iter_by_user",
+    "incomes_iter_by_user_month",
+    "incomes_month_totals",
+    "incomes_between",
 
     # Expenses
     "expenses_insert",
+    "expenses_insert_many",
     "expenses_id_is_valid",
     "expenses_update",
     "expenses_delete",
+    "expenses_delete_where",
+    "expenses_update_where",
     "expenses_by_user",
+    "expenses_iter_by_user",
+    "expenses_iter_by_user_month",
+    "expenses_month_totals",
+    "expenses_between",
 
     # Users
     "users_insert",
@@ -769,12 +3300,21 @@ __all__ = [
 
     # Goals
     "goals_insert",
+    "goals_insert_many",
     "goals_update",
     "goals_delete",
     "goals_by_user",
 
     # Utils / Setup
     "ensure_db_files",
+    "verify_collections",
+    "accept_collection_changes",
+    "CollectionIntegrityError",
+    "set_storage_backend",
+    "migrate_json_to_sqlite",
+    "migrate_to_partitions",
+    "backfill_date_ordinals",
+    "rebuild_rollup",
     "load_sample_data",
     "delete_data"
 ]
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""El archivo db_sqlite.py implementa el almacenamiento de las colecciones sobre SQLite.
+    db.py lo usa cuando STORAGE_BACKEND == "sqlite", manteniendo la misma interfaz pública
+    (incomes_insert, expenses_by_user, goals_update, users_find_by_name, ...).
+    Cada colección es una tabla con el id como clave primaria, un índice por (owner, date_key)
+    y la fila completa guardada como JSON en la columna data.
+    La tabla counters guarda el último id asignado de cada colección, así un id borrado no se vuelve a usar
+    (igual que los contadores del backend json).
+"""
+
+import os
+import json
+from contextlib import contextmanager, nullcontext
+
+
+# ----- Conexión -----
+_connections = {}
+# Conexiones con una transacción explícita abierta (ver transaction())
+_open_transactions = set()
+
+# Tamaño de la caché de sentencias preparadas de sqlite3 por conexión.
+# Todas las consultas de este módulo usan SQL fijo con parámetros, así se compilan una sola vez.
+STATEMENT_CACHE_SIZE = 64
+
+TABLES = ("users", "incomes", "expenses", "goals")
+
+
+def _owner_field(table):
+    '''
+    Devuelve el campo de la fila que identifica a su dueño: "name" para users y "user" para el resto.
+    '''
+    return "name" if table == "users" else "user"
+
+def _date_key(row):
+    '''
+    Recibe una fila y devuelve su fecha como "yyyy-mm-dd" para que se pueda ordenar e indexar.
+    Usa "date" (incomes/expenses) o "start_date" (goals). Si no hay fecha válida devuelve None.
+    '''
+    date_str = row.get("date") or row.get("start_date")
+    if not isinstance(date_str, str):
+        return None
+    parts = date_str.split("/")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+    return f"{int(parts[2]):04d}-{int(parts[1]):02d}-{int(parts[0]):02d}"
+
+def _params(table, row):
+    '''
+    Devuelve la tupla (id, owner, date_key, data) con la que se guarda row en table.
+    '''
+    return (
+        int(str(row.get("id"))),
+        row.get(_owner_field(table)),
+        _date_key(row),
+        json.dumps(row, ensure_ascii=False)
+    )
+
+def _create_schema(connection):
+    for table in TABLES:
+        connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "id INTEGER PRIMARY KEY, owner TEXT, date_key TEXT, data TEXT NOT NULL)"
+        )
+        connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_owner_date ON {table} (owner, date_key)")
+    connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)")
+    connection.commit()
+
+def connect(db_path):
+    '''
+    Recibe el path del archivo .sqlite3.
+    Devuelve la conexión abierta para ese archivo (una por proceso), creándola si hace falta.
+    La base se abre en modo WAL, así las lecturas no se bloquean mientras se escribe.
+    '''
+    connection = _connections.get(db_path)
+    if connection is None:
+        # sqlite3 se importa acá: con el backend json nunca se carga
+        import sqlite3
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        connection = sqlite3.connect(db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        _create_schema(connection)
+        _connections[db_path] = connection
+    return connection
+
+def close_all():
+    '''
+    Cierra todas las conexiones abiertas.
+    '''
+    for connection in _connections.values():
+        connection.close()
+    _connections.clear()
+
+
+@contextmanager
+def transaction(connection):
+    '''
+    Agrupa todas las escrituras hechas dentro del bloque en una sola transacción de SQLite:
+    commit al salir sin errores, rollback si el bloque lanza una excepción.
+    '''
+    _open_transactions.add(id(connection))
+    try:
+        yield
+    except BaseException:
+        connection.rollback()
+        raise
+    else:
+        connection.commit()
+    finally:
+        _open_transactions.discard(id(connection))
+
+def _write_scope(connection):
+    '''
+    Devuelve el context manager con el que se hace cada escritura: la propia conexión
+    (commit al terminar) o, si hay una transacción explícita abierta, uno que no hace nada.
+    '''
+    if id(connection) in _open_transactions:
+        return nullcontext()
+    return connection
+
+
+# ----- Lecturas -----
+def all_rows(connection, table):
+    '''
+    Devuelve todas las filas de table ordenadas por id.
+    '''
+    cursor = connection.execute(f"SELECT data FROM {table} ORDER BY id")
+    return [json.loads(data) for (data,) in cursor]
+
+def rows_by_owner(connection, table, owner):
+    '''
+    Devuelve las filas de table cuyo dueño (user, o name en users) es owner, ordenadas por id.
+    Usa el índice (owner, date_key).
+    '''
+    cursor = connection.execute(f"SELECT data FROM {table} WHERE owner = ? ORDER BY id", (owner,))
+    return [json.loads(data) for (data,) in cursor]
+
+def iter_rows(connection, table, owner=None):
+    '''
+    Genera las filas de table ordenadas por id (solo las de owner, si se pasa) sin armar la lista completa:
+    cada fila se decodifica recién cuando se la pide.
+    '''
+    if owner is None:
+        cursor = connection.execute(f"SELECT data FROM {table} ORDER BY id")
+    else:
+        cursor = connection.execute(f"SELECT data FROM {table} WHERE owner = ? ORDER BY id", (owner,))
+    for (data,) in cursor:
+        yield json.loads(data)
+
+def iter_rows_between(connection, table, owner, first_key, last_key):
+    '''
+    Genera las filas de owner en table cuyo date_key ("yyyy-mm-dd") está entre first_key y last_key (inclusive),
+    ordenadas por id. La consulta usa el índice (owner, date_key), no recorre las demás filas del dueño.
+    '''
+    cursor = connection.execute(
+        f"SELECT data FROM {table} WHERE owner = ? AND date_key BETWEEN ? AND ? ORDER BY id",
+        (owner, first_key, last_key)
+    )
+    for (data,) in cursor:
+        yield json.loads(data)
+
+def get_row(connection, table, id_value):
+    '''
+    Devuelve la fila de table con ese id, o None si no existe (o si el id no es numérico).
+    '''
+    try:
+        key = int(str(id_value))
+    except ValueError:
+        return None
+    found = connection.execute(f"SELECT data FROM {table} WHERE id = ?", (key,)).fetchone()
+    if found is None:
+        return None
+    return json.loads(found[0])
+
+def position_of(connection, table, id_value):
+    '''
+    Devuelve la posición (desde 0) de la fila con ese id dentro de table ordenada por id,
+    o None si no existe. Equivale al índice que tendría la fila en la colección JSON.
+    '''
+    if get_row(connection, table, id_value) is None:
+        return None
+    found = connection.execute(f"SELECT COUNT(*) FROM {table} WHERE id < ?", (int(str(id_value)),)).fetchone()
+    return found[0]
+
+def max_id(connection, table):
+    '''
+    Devuelve el mayor id de table, o 0 si está vacía. Usa la clave primaria, no recorre la tabla.
+    '''
+    found = connection.execute(f"SELECT MAX(id) FROM {table}").fetchone()
+    return found[0] or 0
+
+def last_id(connection, table):
+    '''
+    Devuelve el último id asignado en table: el de la tabla counters, o el mayor id de la tabla si es mayor
+    (filas insertadas antes de que existiera el contador).
+    '''
+    found = connection.execute("SELECT last_id FROM counters WHERE name = ?", (table,)).fetchone()
+    return max(found[0] if found else 0, max_id(connection, table))
+
+
+# ----- Escrituras -----
+def reserve_ids(connection, table, count):
+    '''
+    Reserva count ids consecutivos para table y devuelve el primero. El contador se guarda en la tabla counters
+    en la misma transacción que las escrituras que la rodean, y nunca baja: borrar la fila con el id más alto
+    no hace que ese id se vuelva a asignar.
+    '''
+    first = last_id(connection, table) + 1
+    set_last_id(connection, table, first + count - 1)
+    return first
+
+def set_last_id(connection, table, value):
+    '''
+    Guarda value como último id asignado de table.
+    '''
+    with _write_scope(connection):
+        connection.execute("INSERT OR REPLACE INTO counters (name, last_id) VALUES (?, ?)", (table, value))
+
+def insert_rows(connection, table, rows):
+    '''
+    Inserta rows en table en una sola transacción.
+    '''
+    with _write_scope(connection):
+        connection.executemany(
+            f"INSERT INTO {table} (id, owner, date_key, data) VALUES (?, ?, ?, ?)",
+            [_params(table, row) for row in rows]
+        )
+
+def replace_row(connection, table, id_value, row):
+    '''
+    Reemplaza la fila de table cuyo id es id_value por row (row puede traer otro id).
+    Devuelve True si la fila existía, False si no (o si alguno de los ids no es numérico).
+    '''
+    try:
+        key = int(str(id_value))
+        params = _params(table, row)
+    except ValueError:
+        return False
+    with _write_scope(connection):
+        cursor = connection.execute(
+            f"UPDATE {table} SET id = ?, owner = ?, date_key = ?, data = ? WHERE id = ?",
+            params + (key,)
+        )
+    return cursor.rowcount > 0
+
+def delete_row(connection, table, id_value):
+    '''
+    Borra la fila de table con ese id. Devuelve True si existía, False si no.
+    '''
+    try:
+        key = int(str(id_value))
+    except ValueError:
+        return False
+    with _write_scope(connection):
+        cursor = connection.execute(f"DELETE FROM {table} WHERE id = ?", (key,))
+    return cursor.rowcount > 0
+
+def replace_all(connection, table, rows):
+    '''
+    Reemplaza todo el contenido de table por rows en una sola transacción.
+    Las filas con id no numérico se descartan con un mensaje de error.
+    '''
+    valid_rows = []
+    for row in rows:
+        if str(row.get("id")).isdigit():
+            valid_rows.append(row)
+        else:
+            print(f"ERROR: el campo id no es numerico en {table}: {row.get('id')}")
+
+    with _write_scope(connection):
+        connection.execute(f"DELETE FROM {table}")
+        connection.executemany(
+            f"INSERT INTO {table} (id, owner, date_key, data) VALUES (?, ?, ?, ?)",
+            [_params(table, row) for row in valid_rows]
+        )
+    return len(valid_rows)
+
+
+#TODAS LAS FUNCIONES
+__all__ = [
+    "TABLES",
+    "connect",
+    "close_all",
+    "transaction",
+    "all_rows",
+    "rows_by_owner",
+    "iter_rows",
+    "iter_rows_between",
+    "get_row",
+    "position_of",
+    "max_id",
+    "last_id",
+    "reserve_ids",
+    "set_last_id",
+    "insert_rows",
+    "replace_row",
+    "delete_row",
+    "replace_all",
+]
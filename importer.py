@@ -0,0 +1,238 @@
+"""El archivo importer.py importa extractos bancarios en CSV como ingresos y egresos.
+    Cada línea del CSV tiene fecha, monto, categoría y descripción (en ese orden, o con un encabezado
+    date/amount/category/description o fecha/monto/categoria/descripcion). El archivo se lee en streaming
+    por bloques de CHUNK_ROWS líneas, los bloques se validan en paralelo en un pool de procesos
+    con validate_income/validate_expense y las filas válidas se guardan con una sola transacción de db.py.
+    Con el backend json esa transacción vive en memoria, así que los extractos de más de JSON_IMPORT_MAX_BYTES
+    se importan con el backend sqlite.
+    Las líneas rechazadas se copian a un CSV aparte con el número de línea y el motivo.
+    Uso: python importer.py archivo.csv usuario [incomes|expenses]
+"""
+
+import os
+import sys
+import csv
+from collections import deque
+
+import db
+from validations import validate_income, validate_expense
+
+
+# Líneas por bloque: cada bloque se valida en un proceso y se inserta con una sola llamada a *_insert_many
+CHUNK_ROWS = 5000
+# Bloques en vuelo por proceso del pool. Limita la memoria: nunca hay más de workers * CHUNKS_AHEAD bloques leídos
+CHUNKS_AHEAD = 2
+# Con el backend json la transacción guarda en memoria la colección completa más todas las filas importadas hasta
+# el commit (unos 500 bytes por fila, contra unos 40 en el CSV). Los extractos más grandes que esto se rechazan;
+# con sqlite cada bloque se inserta en la transacción de la base y en memoria queda solo el bloque actual.
+JSON_IMPORT_MAX_BYTES = 8 * 1024 * 1024
+
+_COLUMNS = ("date", "amount", "category", "description")
+_HEADER_NAMES = {
+    "date": "date", "fecha": "date",
+    "amount": "amount", "monto": "amount", "importe": "amount",
+    "category": "category", "categoria": "category", "categoría": "category",
+    "description": "description", "descripcion": "description", "descripción": "description"
+}
+
+
+def _read_header(reader):
+    '''
+    Lee la primera línea del CSV. Si es un encabezado devuelve (posiciones de las columnas, None, encabezado);
+    si ya es una fila de datos devuelve (posiciones por defecto, esa fila, _COLUMNS).
+    Si el archivo está vacío devuelve (None, None, None).
+    '''
+    first = next(reader, None)
+    if first is None:
+        return (None, None, None)
+    names = [_HEADER_NAMES.get(field.strip().lower()) for field in first]
+    if "date" not in names or "amount" not in names:
+        return ({column: i for i, column in enumerate(_COLUMNS)}, first, list(_COLUMNS))
+    return ({column: names.index(column) for column in _COLUMNS if column in names}, None, first)
+
+def _read_chunks(reader, positions, first_row, chunk_size):
+    '''
+    Genera bloques de hasta chunk_size tuplas (número de línea, campos), leyendo el CSV de a una línea.
+    '''
+    chunk = []
+    if first_row is not None:
+        chunk.append((1, first_row))
+    for fields in reader:
+        if not any(field.strip() for field in fields):
+            continue
+        chunk.append((reader.line_num, fields))
+        if len(chunk) >= chunk_size:
+            yield (positions, chunk)
+            chunk = []
+    if chunk:
+        yield (positions, chunk)
+
+def _parse_amount(value):
+    '''
+    Convierte el monto del extracto a float. Acepta coma decimal ("1234,50") si no hay punto.
+    Devuelve None si no es un número.
+    '''
+    value = value.strip()
+    if "," in value and "." not in value:
+        value = value.replace(",", ".")
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+def _parse_date(value):
+    '''
+    Devuelve la fecha como "dd/mm/yyyy". Acepta también "yyyy-mm-dd", el formato habitual de los extractos.
+    '''
+    value = value.strip()
+    parts = value.split("-")
+    if len(parts) == 3 and len(parts[0]) == 4:
+        return f"{parts[2]}/{parts[1]}/{parts[0]}"
+    return value
+
+def _map_row(fields, positions, kind, username):
+    '''
+    Convierte los campos de una línea en (colección, movimiento) con el formato de db.py,
+    o en (None, "motivo") si la línea no se puede interpretar.
+    Sin kind, los montos negativos son egresos y los positivos ingresos.
+    Sin categoría se usa "Otros"; la descripción no forma parte del esquema y se descarta.
+    '''
+    def field(column):
+        position = positions.get(column)
+        if position is None or position >= len(fields):
+            return ""
+        return fields[position]
+
+    amount = _parse_amount(field("amount"))
+    if amount is None:
+        return (None, "amount debe ser numérico")
+    target = kind
+    if target is None:
+        target = "expenses" if amount < 0 else "incomes"
+    movement = {
+        "amount": abs(amount),
+        "category": field("category").strip() or "Otros",
+        "date": _parse_date(field("date")),
+        "user": username
+    }
+    return (target, movement)
+
+def _validate_chunk(task):
+    '''
+    Corre en los procesos del pool. Recibe (posiciones, bloque, kind, username) y devuelve
+    una lista de (número de línea, campos, colección, movimiento) para las líneas válidas
+    y (número de línea, campos, None, "motivo") para las rechazadas.
+    '''
+    positions, chunk, kind, username = task
+    users = {username}
+    results = []
+    for line, fields in chunk:
+        target, value = _map_row(fields, positions, kind, username)
+        if target == "incomes":
+            ok, msg = validate_income(value, db.income_categories, users)
+        elif target == "expenses":
+            ok, msg = validate_expense(value, db.expense_categories, users)
+        else:
+            ok, msg = (False, value)
+        results.append((line, fields, target, value) if ok else (line, fields, None, msg))
+    return results
+
+def _validated_chunks(chunks, kind, username, workers):
+    '''
+    Genera los resultados de _validate_chunk para cada bloque, en el mismo orden del archivo.
+    Con workers > 1 los bloques se validan en un pool de procesos, con como mucho
+    workers * CHUNKS_AHEAD bloques pendientes; con workers <= 1 se validan en este proceso.
+    '''
+    tasks = ((positions, chunk, kind, username) for positions, chunk in chunks)
+    if workers <= 1:
+        for task in tasks:
+            yield _validate_chunk(task)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_validate_chunk, task))
+            if len(pending) >= workers * CHUNKS_AHEAD:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def import_csv(csv_path, username, kind=None, rejects_path=None, workers=None, chunk_size=CHUNK_ROWS):
+    '''
+    Importa el extracto csv_path como movimientos de username.
+    - kind: "incomes" o "expenses" para importar todo como ese tipo; None usa el signo del monto
+    - rejects_path: CSV donde se copian las líneas rechazadas (por defecto <csv_path>.rechazados.csv),
+      solo se crea si hay alguna
+    - workers: procesos para validar (por defecto la cantidad de CPUs; 1 valida en este proceso)
+    Todas las filas válidas se guardan en una sola transacción: si la escritura falla no se guarda ninguna.
+    Con el backend json el archivo no puede pasar de JSON_IMPORT_MAX_BYTES, porque la transacción queda en memoria.
+    Devuelve (True, {"incomes": n, "expenses": n, "rejected": n, "rejects_path": path o None})
+    o (False, "motivo").
+    '''
+    if kind not in (None, "incomes", "expenses"):
+        return (False, "kind debe ser 'incomes', 'expenses' o None")
+    if not db.users_find_by_name(username)[1]:
+        return (False, "El usuario que intenta realizar la operación no existe")
+    if not os.path.exists(csv_path):
+        return (False, f"No existe el archivo {csv_path}")
+    size = os.path.getsize(csv_path)
+    if db.STORAGE_BACKEND == "json" and size > JSON_IMPORT_MAX_BYTES:
+        return (False, (
+            f"El archivo pesa {size / 1e6:.1f} MB y con el backend json se importan hasta "
+            f"{JSON_IMPORT_MAX_BYTES / 1e6:.1f} MB de una vez: use el backend sqlite o divida el archivo"
+        ))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if rejects_path is None:
+        rejects_path = csv_path + ".rechazados.csv"
+
+    report = {"incomes": 0, "expenses": 0, "rejected": 0, "rejects_path": None}
+    rejects_file = None
+    rejects = None
+    try:
+        with open(csv_path, newline="", encoding="utf-8-sig") as source, db.transaction():
+            reader = csv.reader(source)
+            positions, first_row, header = _read_header(reader)
+            if positions is None:
+                return (True, report)
+
+            chunks = _read_chunks(reader, positions, first_row, chunk_size)
+            for results in _validated_chunks(chunks, kind, username, workers):
+                movements = {"incomes": [], "expenses": []}
+                for line, fields, target, value in results:
+                    if target is not None:
+                        movements[target].append(value)
+                        continue
+                    if rejects is None:
+                        rejects_file = open(rejects_path, "w", newline="", encoding="utf-8")
+                        rejects = csv.writer(rejects_file)
+                        rejects.writerow(["linea", "motivo"] + header)
+                        report["rejects_path"] = rejects_path
+                    rejects.writerow([line, value] + fields)
+                    report["rejected"] += 1
+
+                db.incomes_insert_many(movements["incomes"], validate=False)
+                db.expenses_insert_many(movements["expenses"], validate=False)
+                report["incomes"] += len(movements["incomes"])
+                report["expenses"] += len(movements["expenses"])
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+    return (True, report)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python importer.py archivo.csv usuario [incomes|expenses]")
+        sys.exit(1)
+    db.ensure_db_files()
+    ok, result = import_csv(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
+    if not ok:
+        print(f"ERROR: {result}")
+        sys.exit(1)
+    print(f"Ingresos importados: {result['incomes']}")
+    print(f"Egresos importados: {result['expenses']}")
+    if result["rejected"]:
+        print(f"Líneas rechazadas: {result['rejected']} (ver {result['rejects_path']})")
@@ -1,27 +1,5 @@
-from db import (
-    ensure_db_files,
-    income_categories, 
-    expense_categories,
-    incomes_insert, 
-    incomes_id_is_valid,
-    incomes_update, 
-    incomes_delete, 
-    incomes_by_user, 
-    expenses_insert,
-    expenses_id_is_valid,
-    expenses_update, 
-    expenses_delete, 
-    expenses_by_user,
-    users_insert,
-    login_check,
-    users_find_by_name,
-    goals_insert,
-    goals_update,
-    goals_delete,
-    goals_by_user,
-    load_sample_data,
-    delete_data
-)
+# db.py y service.py se importan recién en las funciones que los usan: el programa muestra la primera pregunta
+# sin cargarlos (ni sqlite3, ni el ledger), y se cargan después de la primera respuesta (ver bench_startup).
 #utils
 from utils import(
     get_menu_option,
@@ -34,15 +12,6 @@ from utils import(
     input_password,
     COLORS
 )
-#service
-from service import (
-    calculate_monthly_savings,
-    percent_change_in_savings, 
-    average_expense_by_category,
-    build_dashboard_metrics,
-    compute_goal_status
-)
-import getpass
 
 ## DATOS DEL SISTEMA
 
@@ -88,6 +57,7 @@ def insertIncome(income):
     En caso de una funcion de db.py
     Devuelve True en caso de éxito, False en caso de error
     '''
+    from db import incomes_insert
     ok, message = incomes_insert(income)
     return ok, message
 
@@ -99,6 +69,7 @@ def updateIncome(income):
     Reemplaza el ingreso anterior con el nuevo
     Devuelve True en caso de éxito, False en caso de error
     '''
+    from db import incomes_update
     ok, message = incomes_update(income)
     return ok, message
 
@@ -109,6 +80,7 @@ def deleteIncome(income):
     Esto lo hace a través de una funcion de db.py
     Devuelve True en caso de éxito, False en caso de error
     '''
+    from db import incomes_delete
     income_id = income.get("id")
     ok, message = incomes_delete(income_id)
     return ok, message
@@ -120,6 +92,7 @@ def getIncomesByUser(username):
     Usa una función de db.py que busca todos los incomes pertenecientes a ese usuario
     Devuelve una lista de incomes, si el usuario no existe o no tiene incomes devuelve una lista vacia
     '''
+    from db import incomes_by_user
     return incomes_by_user(username)
 
 
@@ -130,6 +103,7 @@ def insertExpenses(expense):
     y lo inserta en la base de datos a través de una función de db.py.
     Devuelve True en caso de éxito, False en caso de error.
     '''
+    from db import expenses_insert
     ok, message = expenses_insert(expense)
     return ok, message
     
@@ -141,6 +115,7 @@ def updateExpenses(expense):
     reemplazando el egreso anterior con el nuevo (mismo id).
     Devuelve True en caso de éxito, False en caso de error.
     '''
+    from db import expenses_update
     ok, message = expenses_update(expense)
     return ok, message
 
@@ -151,6 +126,7 @@ def deleteExpenses(expense):
     utilizando una función de db.py.
     Devuelve True en caso de éxito, False en caso de error.
     '''
+    from db import expenses_delete
     expense_id = expense.get("id")
     ok, message = expenses_delete(expense_id)
     return ok, message
@@ -162,6 +138,7 @@ def getExpensesByUser(username):
     Devuelve una lista de egresos; si el usuario no existe o no tiene egresos,
     devuelve una lista vacía.
     '''
+    from db import expenses_by_user
     return expenses_by_user(username)
 
 # ABM OBJETIVOS DE AHORRO
@@ -171,6 +148,7 @@ def insertGoals(goal):
     y lo inserta en la base de datos a través de una función de db.py.
     Devuelve True en caso de éxito, False en caso de error.
     '''
+    from db import goals_insert
     ok, message = goals_insert(goal)
     return ok, message
 
@@ -181,6 +159,7 @@ def updateGoals(goal):
     reemplazando el objetivo de ahorro anterior con el nuevo (mismo id).
     Devuelve True en caso de éxito, False en caso de error.
     '''
+    from db import goals_update
     ok, message = goals_update(goal)
     return ok, message
 
@@ -191,6 +170,7 @@ def deleteGoals(goal):
     utilizando una función de db.py.
     Devuelve True en caso de éxito, False en caso de error.
     '''
+    from db import goals_delete
     goal_id = goal.get("id")
     ok, message = goals_delete(goal_id)
    
@@ -202,15 +182,16 @@ def getGoalsByUser(username):
     Usa una función de db.py que busca todos los goals pertenecientes a ese usuario
     Devuelve una lista de goals, si el usuario no existe o no tiene goals devuelve una lista vacia.
     '''
+    from db import goals_by_user
     return goals_by_user(username)
 
 def get_goal_for_user_by_id(username, goal_id):
     """Devuelve el objetivo de ahorro del usuario con ese id, o None si no existe."""
-    goals = getGoalsByUser(username)
-    for g in goals:
-        if str(g.get("id")) == str(goal_id):
-            return g
-    return None
+    from db import get_by_id
+    goal = get_by_id("goals", goal_id)
+    if goal is None or goal.get("user") != username:
+        return None
+    return goal
 
 # AUTH
 
@@ -222,6 +203,7 @@ def register_user(name, password, password2, age, genre, role="user"):
     Si todo sale bien, devuelve un True
     Si alguna validación falla o falla el guardado en db devuelve False
     '''
+    from db import users_insert, users_find_by_name
 
     _, user_exist = users_find_by_name(name)
     if user_exist:
@@ -253,6 +235,7 @@ def login(name, password):
     Valida que el usuario exista y que la contraseña ingresada sea correcta.
     Retorna True si el usuario existe y coincide la contraseña, retorna False si no coinciden o no existe
     """
+    from db import login_check
     login_success = login_check(name, password)
     if login_success: 
         print("Acceso concedido.")
@@ -263,6 +246,7 @@ def login(name, password):
 
 ### Menus
 def incomes_menu(current_username):
+    from db import income_categories, incomes_id_is_valid
     options = [
         "Agregar ingreso",
         "Actualizar ingreso",
@@ -331,6 +315,7 @@ def incomes_menu(current_username):
             print("Volviendo al menú principal...")
 
 def expenses_menu(current_username):
+    from db import expense_categories, expenses_id_is_valid
     options = [
         "Agregar egreso",
         "Actualizar egreso",
@@ -486,6 +471,7 @@ def _show_dashboard_details(metrics, username):
     print("\n" + "=" * 60 + "\n")
 
 def show_dashboard_plain(username):
+    from service import build_dashboard_metrics
     metrics = build_dashboard_metrics(username)
 
     month = metrics["month"]
@@ -518,6 +504,7 @@ def show_dashboard_plain(username):
         _show_dashboard_details(metrics, username)
 
 def metrics_menu(current_username):
+    from service import calculate_monthly_savings, percent_change_in_savings, average_expense_by_category
     options = [
         "Ver métricas generales",
         "Calcular ahorro mensual",
@@ -578,6 +565,8 @@ def metrics_menu(current_username):
             print("Volviendo al menú principal...")
 
 def goals_menu(current_username):
+    from db import transaction
+    from service import compute_goal_status
     options = [
         "Agregar objetivo de ahorro",
         "Modificar objetivo de ahorro",
@@ -673,7 +662,12 @@ def goals_menu(current_username):
                     "user": current_username
                 }
 
-                ok, message = updateGoals(updated_goal)
+                # Releer la meta y actualizarla en una sola transacción (una lectura y una escritura de goals.json)
+                with transaction():
+                    if get_goal_for_user_by_id(current_username, goal.get("id")) is None:
+                        ok, message = False, "El objetivo de ahorro ya no existe."
+                    else:
+                        ok, message = updateGoals(updated_goal)
                 if ok:
                     print(f"Aporte registrado. Nuevo monto ahorrado: ${new_saved:.2f}. Estado: {new_status}.")
                 else:
@@ -697,6 +691,35 @@ def goals_menu(current_username):
         elif selected == 6:
             print("Volviendo al menú principal...")
 
+def open_database():
+    '''
+    Inicializa la base de datos (ver ensure_db_files) y avisa si algún archivo estaba dañado.
+    Si un archivo fue modificado por fuera del programa pregunta si se aceptan los cambios.
+    Se llama recién antes del registro o el login, así el programa muestra la primera pregunta
+    sin leer ni verificar las colecciones.
+    Devuelve True si se puede seguir, False si hay una colección dañada o con cambios no aceptados:
+    en ese caso no se escribe nada, para no pisar el archivo.
+    '''
+    from db import ensure_db_files, accept_collection_changes
+    report = ensure_db_files()
+    usable = True
+    for file_name, status in report.items():
+        if status == "recuperado":
+            print(f"AVISO: {file_name} estaba dañado y se recuperó desde el último snapshot bueno")
+        elif status == "modificado":
+            print(f"AVISO: {file_name} fue modificado por fuera del programa")
+            if get_menu_option(f"¿Acepta los cambios de {file_name}? (si/no): ", ["si", "no"]) == 1:
+                accept_collection_changes(file_name)
+            else:
+                print(f"ERROR: revise {file_name} antes de volver a usar el programa; no se modificó")
+                usable = False
+        elif status == "dañado" and file_name.endswith(".jsonl"):
+            print(f"ERROR: {file_name} tiene líneas dañadas que no se aplicaron (copiadas a {file_name}.corrupt)")
+        elif status == "dañado":
+            print(f"ERROR: {file_name} está dañado y no hay un snapshot bueno para recuperarlo; no se modificó")
+            usable = False
+    return usable
+
 def main():
 
 #### INICIO DE PROGRAMA--------
@@ -710,6 +733,8 @@ def main():
     #TODO: toda la perte de usuarios hasta 858 (print("resultado: Auteticacion exitosa")) se crea funcion para modularizar el menu de auth crear funcion auth_menu o dividr registro y login.
 
     is_register = get_menu_option("¿Ya posee una cuenta? (si/no): ", ["si", "no"])
+    if not open_database():
+        return
     
     while is_register == 2:
         print("\n--- REGISTRO DE NUEVO USUARIO ---")
@@ -744,6 +769,7 @@ def main():
 
 
     # --- LOGIN ---
+    import getpass
     print("Bienvenido al sistema de finanzas.\n")
     username = input_non_empty("Ingrese nombre de usuario: ")
     password = getpass.getpass("Ingrese contraseña: ")
@@ -788,11 +814,11 @@ def main():
 #### INICIO DE PROGRAMA
 if __name__ == "__main__":
     # para pruebas comentar ensure_db_files(), delete_data() y dscomentar load_sample_data()
-    # load_sample_data()
+    # from db import load_sample_data; load_sample_data()
 
     # Si quiero reestablecer los .json puedo comentar  ensure_db_files(), load_sample_data() y main() y ejecutar solo delete_data()
-    # delete_data()
+    # from db import delete_data; delete_data()
 
     # Para iniciar correctamente dejar descomentada solamente ensure_db_files() y main()
-    ensure_db_files()
+    # ensure_db_files() se llama dentro de main() (ver open_database), recién después de la primera pregunta
     main()
\ No newline at end of file
@@ -0,0 +1,462 @@
+#ledger
+
+
+"""El archivo ledger.py arma una representación columnar y compacta de ingresos o egresos.
+    En lugar de una lista de dicts (cada uno con id, amount, category, date y user como objetos de Python)
+    guarda una columna por campo en arrays del módulo array:
+    - amount: array('d') con los montos
+    - date: array('i') con la fecha como ordinal (date.toordinal()), 0 si la fecha es inválida
+    - month: array('i') con year * 12 + (month - 1), para filtrar por mes sin volver a parsear la fecha
+    - category: array('h') con el código de la categoría (posición en la lista categories)
+    - user: array('i') con el código del usuario (posición en la lista users)
+    - id: array('q') con el id numérico
+    Una fila ocupa unos 34 bytes en lugar de los 500+ de un dict, y las funciones de agregación
+    de este archivo recorren directamente esas columnas.
+
+    También define un formato binario de registros de ancho fijo para guardar un ledger en disco
+    y leerlo con mmap, sin decodificar texto JSON.
+"""
+
+
+from array import array
+from bisect import bisect_left, insort
+from datetime import date
+import json
+import mmap
+import struct
+
+
+def month_key(month, year):
+    '''
+    Devuelve la clave de mes que usa la columna month: year * 12 + (month - 1).
+    '''
+    return year * 12 + (month - 1)
+
+
+def _parse_date(date_str, ordinal=None):
+    '''
+    Recibe un str "dd/mm/yyyy" y devuelve la tupla (ordinal, clave de mes), o (0, 0) si no es una fecha válida.
+    Si la fila ya trae su ordinal (campo date_ordinal de db.py) se usa ese en lugar de parsear el str.
+    '''
+    try:
+        if ordinal:
+            parsed = date.fromordinal(ordinal)
+            return (ordinal, month_key(parsed.month, parsed.year))
+        d, m, y = map(int, date_str.split("/"))
+        return (date(y, m, d).toordinal(), month_key(m, y))
+    except Exception:
+        return (0, 0)
+
+
+def _code(value, codes, names):
+    '''
+    Devuelve el código de value en codes, agregándolo al final de names si todavía no tiene uno.
+    '''
+    code = codes.get(value)
+    if code is None:
+        code = len(names)
+        codes[value] = code
+        names.append(value)
+    return code
+
+
+def _row_values(row):
+    '''
+    Devuelve la tupla (id, amount, ordinal, clave de mes) de una fila, como se guarda en las columnas del ledger.
+    Si el id no es numérico se usa -1.
+    '''
+    try:
+        row_id = int(str(row.get("id")))
+    except ValueError:
+        row_id = -1
+    ordinal, month = _parse_date(row.get("date"), row.get("date_ordinal"))
+    return (row_id, float(row.get("amount", 0.0)), ordinal, month)
+
+
+def build_ledger(rows, categories):
+    '''
+    Recibe rows (cualquier iterable de ingresos o egresos con el formato de db.py) y la lista de categorías
+    de esa colección (income_categories o expense_categories).
+    Devuelve un dict con las columnas descritas arriba y las listas "categories" y "users"
+    para traducir los códigos. Las categorías que no estén en la lista se agregan al final.
+    '''
+    ledger = {
+        "id": array("q"),
+        "amount": array("d"),
+        "date": array("i"),
+        "month": array("i"),
+        "category": array("h"),
+        "user": array("i"),
+        "categories": list(categories),
+        "users": []
+    }
+    category_codes = {}
+    for code, name in enumerate(ledger["categories"]):
+        category_codes[name] = code
+    user_codes = {}
+
+    for row in rows:
+        row_id, amount, ordinal, month = _row_values(row)
+        ledger["id"].append(row_id)
+        ledger["amount"].append(amount)
+        ledger["date"].append(ordinal)
+        ledger["month"].append(month)
+        ledger["category"].append(_code(row.get("category"), category_codes, ledger["categories"]))
+        ledger["user"].append(_code(row.get("user"), user_codes, ledger["users"]))
+
+    return ledger
+
+
+# Columnas de un ledger, en el orden de build_ledger
+COLUMNS = ("id", "amount", "date", "month", "category", "user")
+
+# Máximo de filas borradas o modificadas que apply_ledger_delta aplica de a una (cada borrado corre las columnas);
+# con más conviene reconstruir el ledger completo
+MAX_DELTA_ROWS = 64
+# Filas borradas que el índice por id acumula antes de descartarse y volver a armarse (ver _id_positions)
+MAX_REMOVED_POSITIONS = 4096
+
+
+def _list_code(value, names):
+    '''
+    Igual que _code, buscando value directamente en names (para agregar pocas filas a un ledger ya armado).
+    '''
+    if value in names:
+        return names.index(value)
+    names.append(value)
+    return len(names) - 1
+
+
+def _set_row(ledger, position, row):
+    '''
+    Escribe row en la posición position del ledger (position == ledger_size(ledger) agrega la fila al final).
+    '''
+    values = _row_values(row) + (
+        _list_code(row.get("category"), ledger["categories"]),
+        _list_code(row.get("user"), ledger["users"])
+    )
+    for column, value in zip(COLUMNS, values):
+        if position == len(ledger[column]):
+            ledger[column].append(value)
+        else:
+            ledger[column][position] = value
+
+
+def _id_positions(ledger):
+    '''
+    Devuelve el índice {id: posición original} del ledger, que se arma recorriendo la columna id la primera vez
+    que se busca una fila y después se mantiene con cada delta. Los borrados no lo reescriben: la posición original
+    de la fila borrada se anota en ledger["removed"] (ordenada) y _row_position la descuenta con bisect,
+    igual que los tombstones de la caché de db.py. Con más de MAX_REMOVED_POSITIONS anotadas se vuelve a armar.
+    '''
+    index = ledger.get("positions")
+    if index is None or len(ledger["removed"]) > MAX_REMOVED_POSITIONS:
+        index = {}
+        for position, row_id in enumerate(ledger["id"]):
+            index.setdefault(row_id, position)
+        ledger["positions"] = index
+        ledger["removed"] = []
+    return index
+
+
+def _row_position(ledger, row):
+    '''
+    Devuelve la tupla (posición actual, posición original) de row en el ledger buscándola por id,
+    o None si no está o su id no es numérico.
+    '''
+    row_id = _row_values(row)[0]
+    if row_id < 0:
+        return None
+    original = _id_positions(ledger).get(row_id)
+    if original is None:
+        return None
+    return (original - bisect_left(ledger["removed"], original), original)
+
+
+def _index_row(ledger, row, original):
+    '''
+    Anota en el índice por id (si ya está armado) que row quedó en la posición original.
+    '''
+    index = ledger.get("positions")
+    row_id = _row_values(row)[0]
+    if index is not None and row_id >= 0:
+        index.setdefault(row_id, original)
+
+
+def apply_ledger_delta(ledger, removed, added):
+    '''
+    Aplica al ledger el delta de una escritura sobre su colección, con el mismo formato que db._rollup_apply:
+    las filas added se agregan al final, las removed se borran y, si vienen las dos listas, cada fila
+    de removed se reemplaza en su lugar por la de added en la misma posición (un update no mueve la fila).
+    Devuelve False si no se pudo aplicar (una fila que no está en el ledger o demasiadas filas para buscar
+    de a una); en ese caso el ledger puede haber quedado a medias y hay que reconstruirlo.
+    '''
+    if len(removed) > MAX_DELTA_ROWS:
+        return False
+    if removed and added:
+        if len(removed) != len(added):
+            return False
+        for old_row, row in zip(removed, added):
+            found = _row_position(ledger, old_row)
+            if found is None:
+                return False
+            position, original = found
+            _set_row(ledger, position, row)
+            if ledger["id"][position] != _row_values(old_row)[0]:
+                ledger["positions"].pop(_row_values(old_row)[0], None)
+                _index_row(ledger, row, original)
+        return True
+    for row in removed:
+        found = _row_position(ledger, row)
+        if found is None:
+            return False
+        position, original = found
+        for column in COLUMNS:
+            del ledger[column][position]
+        ledger["positions"].pop(_row_values(row)[0], None)
+        insort(ledger["removed"], original)
+    for row in added:
+        original = ledger_size(ledger) + len(ledger.get("removed", ()))
+        _set_row(ledger, ledger_size(ledger), row)
+        _index_row(ledger, row, original)
+    return True
+
+
+def ledger_size(ledger):
+    '''
+    Devuelve la cantidad de filas del ledger.
+    '''
+    return len(ledger["amount"])
+
+
+def ledger_nbytes(ledger):
+    '''
+    Devuelve los bytes que ocupan las columnas del ledger.
+    '''
+    total = 0
+    for column in COLUMNS:
+        total += ledger[column].itemsize * len(ledger[column])
+    return total
+
+
+def user_code(ledger, username):
+    '''
+    Devuelve el código de username en el ledger, o None si no tiene filas.
+    '''
+    if username in ledger["users"]:
+        return ledger["users"].index(username)
+    return None
+
+
+def _matching_positions(ledger, username=None, month=None, year=None):
+    '''
+    Devuelve las posiciones de las filas que cumplen los filtros recibidos (los que son None no filtran).
+    month y year se usan juntos. Si username no tiene filas devuelve [].
+    '''
+    positions = range(ledger_size(ledger))
+
+    if username is not None:
+        code = user_code(ledger, username)
+        if code is None:
+            return []
+        users = ledger["user"]
+        positions = [i for i in positions if users[i] == code]
+
+    if month is not None and year is not None:
+        key = month_key(month, year)
+        months = ledger["month"]
+        positions = [i for i in positions if months[i] == key]
+
+    return positions
+
+
+def sum_amounts(ledger, username=None, month=None, year=None):
+    '''
+    Suma los montos de las filas del ledger que cumplen los filtros.
+    Devuelve float.
+    '''
+    amounts = ledger["amount"]
+    total = 0.0
+    for i in _matching_positions(ledger, username, month, year):
+        total += amounts[i]
+    return total
+
+
+def sum_by_category(ledger, username=None, month=None, year=None):
+    '''
+    Suma los montos por categoría de las filas del ledger que cumplen los filtros.
+    Devuelve un dict {categoria: total} solo con las categorías que tienen movimientos.
+    '''
+    amounts = ledger["amount"]
+    codes = ledger["category"]
+    names = ledger["categories"]
+    totals = {}
+    for i in _matching_positions(ledger, username, month, year):
+        name = names[codes[i]]
+        totals[name] = totals.get(name, 0.0) + amounts[i]
+    return totals
+
+
+# ----- Formato binario -----
+# Archivo: MAGIC (4 bytes) | versión (H) | largo del encabezado (I) | encabezado JSON | registros
+# El encabezado guarda la cantidad de registros y las listas "categories" y "users" para traducir códigos.
+# Cada registro: id (q) | fecha ordinal (i) | monto (d) | código de categoría (h) | código de usuario (i)
+# La versión 1 guardaba el monto en centavos (q) y perdía los decimales de más; se sigue pudiendo leer.
+BINARY_MAGIC = b"FLDG"
+BINARY_VERSION = 2
+_PREFIX = struct.Struct("<4sHI")
+_RECORDS = {1: struct.Struct("<qiqhi"), 2: struct.Struct("<qidhi")}
+RECORD = _RECORDS[BINARY_VERSION]
+_USER_OFFSET = 22
+
+
+def write_binary_ledger(file_path, rows, categories):
+    '''
+    Recibe un file_path de destino, las filas de ingresos o egresos y la lista de categorías de la colección.
+    Guarda las filas en formato binario de ancho fijo. Devuelve la cantidad de registros escritos.
+    '''
+    ledger = build_ledger(rows, categories)
+    count = ledger_size(ledger)
+    header = json.dumps({
+        "count": count,
+        "categories": ledger["categories"],
+        "users": ledger["users"]
+    }, ensure_ascii=False).encode("utf-8")
+
+    with open(file_path, "wb") as f:
+        f.write(_PREFIX.pack(BINARY_MAGIC, BINARY_VERSION, len(header)))
+        f.write(header)
+        for i in range(count):
+            f.write(RECORD.pack(
+                ledger["id"][i],
+                ledger["date"][i],
+                ledger["amount"][i],
+                ledger["category"][i],
+                ledger["user"][i]
+            ))
+    return count
+
+
+def open_binary_ledger(file_path):
+    '''
+    Abre un ledger binario con mmap (solo lectura) y devuelve un dict con:
+    - records: memoryview sobre los registros (sin copiarlos)
+    - record: el struct de los registros según la versión del archivo
+    - count, categories, users: datos del encabezado
+    - file, mmap: para cerrarlo con close_binary_ledger
+    Devuelve None si el archivo no existe o no tiene el formato esperado.
+    '''
+    try:
+        file = open(file_path, "rb")
+    except OSError:
+        return None
+
+    try:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_len = _PREFIX.unpack_from(mapped, 0)
+        if magic != BINARY_MAGIC or version not in _RECORDS:
+            raise ValueError("formato de ledger binario desconocido")
+        start = _PREFIX.size + header_len
+        header = json.loads(bytes(mapped[_PREFIX.size:start]).decode("utf-8"))
+    except Exception:
+        file.close()
+        return None
+
+    count = header["count"]
+    record = _RECORDS[version]
+    return {
+        "file": file,
+        "mmap": mapped,
+        "records": memoryview(mapped)[start:start + count * record.size],
+        "record": record,
+        "version": version,
+        "count": count,
+        "categories": header["categories"],
+        "users": header["users"]
+    }
+
+
+def close_binary_ledger(binary):
+    '''
+    Cierra un ledger abierto con open_binary_ledger.
+    '''
+    binary["records"].release()
+    binary["mmap"].close()
+    binary["file"].close()
+
+
+def _binary_row(binary, record):
+    '''
+    Convierte una tupla de registro binario en un dict con el formato de db.py.
+    '''
+    row_id, ordinal, amount, category, user = record
+    if binary["version"] == 1:
+        amount = amount / 100.0
+    date_str = ""
+    if ordinal > 0:
+        date_str = date.fromordinal(ordinal).strftime("%d/%m/%Y")
+    return {
+        "id": str(row_id),
+        "amount": float(amount),
+        "category": binary["categories"][category],
+        "date": date_str,
+        "date_ordinal": ordinal if ordinal > 0 else None,
+        "user": binary["users"][user]
+    }
+
+
+def binary_rows(binary):
+    '''
+    Devuelve todas las filas de un ledger binario abierto, con el formato de db.py.
+    '''
+    return [_binary_row(binary, record) for record in binary["record"].iter_unpack(binary["records"])]
+
+
+def binary_rows_by_user(binary, username):
+    '''
+    Devuelve las filas de username de un ledger binario abierto.
+    Solo se lee el código de usuario de cada registro y se decodifican los que coinciden.
+    '''
+    if username not in binary["users"]:
+        return []
+    code = binary["users"].index(username)
+    records = binary["records"]
+    record = binary["record"]
+    user_field = struct.Struct("<i")
+    results = []
+    for i in range(binary["count"]):
+        offset = i * record.size
+        if user_field.unpack_from(records, offset + _USER_OFFSET)[0] == code:
+            results.append(_binary_row(binary, record.unpack_from(records, offset)))
+    return results
+
+
+def binary_sum_amounts(binary):
+    '''
+    Suma los montos de todos los registros de un ledger binario abierto. Devuelve float.
+    '''
+    total = 0
+    for record in binary["record"].iter_unpack(binary["records"]):
+        total += record[2]
+    if binary["version"] == 1:
+        return total / 100.0
+    return float(total)
+
+
+#TODAS LAS FUNCIONES
+__all__ = [
+    "month_key",
+    "build_ledger",
+    "apply_ledger_delta",
+    "ledger_size",
+    "ledger_nbytes",
+    "user_code",
+    "sum_amounts",
+    "sum_by_category",
+    "write_binary_ledger",
+    "open_binary_ledger",
+    "close_binary_ledger",
+    "binary_rows",
+    "binary_rows_by_user",
+    "binary_sum_amounts",
+]
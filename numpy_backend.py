@@ -0,0 +1,148 @@
+"""El archivo numpy_backend.py agrega ingresos y egresos con NumPy sobre las columnas de un ledger (ver ledger.py).
+    Las columnas amount, month, category y user del ledger son arrays del módulo array, así que se ven
+    como arrays de NumPy con np.frombuffer sin copiarlas. Los totales por mes y por categoría salen de
+    np.bincount en lugar de recorrer dicts en Python.
+    NumPy es opcional: se importa la primera vez que se lo necesita y, si no está instalado,
+    available() devuelve False y service.py usa sus funciones en Python puro.
+"""
+
+
+from ledger import month_key, user_code
+
+
+# Módulo numpy ya importado (o None si no está instalado), ver _numpy()
+_loaded = {}
+
+
+def _numpy():
+    '''
+    Devuelve el módulo numpy, o None si no está instalado. Se importa una sola vez y recién cuando se lo pide.
+    '''
+    if "numpy" not in _loaded:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _loaded["numpy"] = numpy
+    return _loaded["numpy"]
+
+
+def available():
+    '''
+    Indica si NumPy está instalado.
+    '''
+    return _numpy() is not None
+
+
+def _column(ledger, name):
+    '''
+    Devuelve la columna name del ledger como array de NumPy del mismo tipo, sin copiarla.
+    '''
+    np = _numpy()
+    column = ledger[name]
+    if not len(column):
+        return np.zeros(0, dtype=column.typecode)
+    return np.frombuffer(column, dtype=column.typecode)
+
+
+def user_columns(ledger, username):
+    '''
+    Devuelve la tupla (amount, month, category) de arrays de NumPy con las filas de username,
+    en el mismo orden que en la colección. Si username no tiene filas los arrays están vacíos.
+    '''
+    np = _numpy()
+    amount = _column(ledger, "amount")
+    month = _column(ledger, "month")
+    category = _column(ledger, "category")
+    code = user_code(ledger, username)
+    if code is None:
+        return (amount[:0], month[:0], category[:0])
+    mask = _column(ledger, "user") == code
+    return (amount[mask], month[mask], category[mask])
+
+
+def _period_positions(month, periods):
+    '''
+    Devuelve un array con la posición en periods (lista de (month, year)) del mes de cada fila,
+    o len(periods) para las filas que no caen en ninguno. Si un período se repite gana el primero.
+    '''
+    np = _numpy()
+    positions = np.full(len(month), len(periods), dtype=np.intp)
+    for position in range(len(periods) - 1, -1, -1):
+        period_month, period_year = periods[position]
+        positions[month == month_key(period_month, period_year)] = position
+    return positions
+
+
+def _sequential_sum(amount):
+    '''
+    Suma amount en orden, como un for en Python (np.sum suma por pares y puede diferir en el último decimal).
+    '''
+    np = _numpy()
+    return float(np.bincount(np.zeros(len(amount), dtype=np.intp), weights=amount, minlength=1)[0])
+
+
+def period_totals(amount, month, periods):
+    '''
+    Recibe las columnas de un usuario (ver user_columns) y periods, una lista de tuplas (month, year).
+    Devuelve un dict {(month, year): total} con la suma de montos de cada período.
+    '''
+    np = _numpy()
+    positions = _period_positions(month, periods)
+    totals = np.bincount(positions, weights=amount, minlength=len(periods) + 1)
+    result = {}
+    for position, period in enumerate(periods):
+        result.setdefault(period, float(totals[position]))
+    return result
+
+
+def period_categories(amount, month, category, periods, categories):
+    '''
+    Recibe las columnas de un usuario, periods y la lista de nombres de categoría del ledger.
+    Devuelve un dict {(month, year): {categoria: total}} con las categorías que tienen movimientos en cada período,
+    en el orden en que aparecen por primera vez (igual que al sumarlas recorriendo las filas).
+    '''
+    np = _numpy()
+    positions = _period_positions(month, periods)
+    width = len(categories)
+    cells = positions * width + category
+    size = (len(periods) + 1) * width
+    sums = np.bincount(cells, weights=amount, minlength=size).reshape(len(periods) + 1, width)
+
+    result = {}
+    for position, period in enumerate(periods):
+        if period in result:
+            continue
+        codes = category[positions == position]
+        present, first = np.unique(codes, return_index=True)
+        result[period] = {
+            categories[code]: float(sums[position, code])
+            for _, code in sorted(zip(first.tolist(), present.tolist()))
+        }
+    return result
+
+
+def aggregate_movements(incomes_ledger, expenses_ledger, username, periods):
+    '''
+    Igual que service.aggregate_movements, sobre los ledgers de incomes y expenses (ver db.movements_ledger).
+    Las sumas se hacen en el mismo orden que recorriendo las filas, así los resultados son iguales.
+    '''
+    income_amount, income_month, _ = user_columns(incomes_ledger, username)
+    amount, month, category = user_columns(expenses_ledger, username)
+    return {
+        "total_in_all": _sequential_sum(income_amount),
+        "total_out_all": _sequential_sum(amount),
+        "incomes": period_totals(income_amount, income_month, periods),
+        "expenses": period_totals(amount, month, periods),
+        "categories": period_categories(amount, month, category, periods, expenses_ledger["categories"])
+    }
+
+
+#TODAS LAS FUNCIONES
+__all__ = [
+    "available",
+    "user_columns",
+    "period_totals",
+    "period_categories",
+    "aggregate_movements",
+]
@@ -8,8 +8,83 @@
 
 
 from datetime import datetime
-from db import incomes_by_user, expenses_by_user, goals_by_user
-from utils import convert_to_tuple
+from functools import wraps
+from db import (
+    incomes_iter_by_user,
+    expenses_iter_by_user,
+    incomes_month_totals,
+    expenses_month_totals,
+    incomes_between,
+    expenses_between,
+    goals_by_user,
+    row_date_ordinal,
+    month_bounds,
+    collection_version,
+    movements_ledger,
+    movements_ledger_ready,
+    movements_count
+)
+# numpy_backend se importa recién en aggregate_movements (el dashboard), no al importar este módulo
+
+
+# ----- Memo de métricas -----
+# Resultados de las funciones de este módulo que recorren movimientos o metas, por (función, argumentos).
+# Cada resultado se guarda con las versiones (db.collection_version) de las colecciones de las que depende
+# y solo se reusa si no cambiaron. Si hay más de MEMO_MAX_ENTRIES se expulsan los usados hace más tiempo.
+MEMO_MAX_ENTRIES = 256
+_memo = {}
+_memo_stats = {"hits": 0, "misses": 0}
+
+# aggregate_movements usa numpy_backend si NumPy está instalado y el usuario tiene al menos
+# NUMPY_MIN_ROWS movimientos entre ingresos y egresos; con menos, recorrer sus filas en Python es más rápido.
+NUMPY_MIN_ROWS = 100000
+
+
+def _memoized(*collections):
+    '''
+    Decorador que guarda en _memo el resultado de la función para cada combinación de argumentos.
+    collections son los nombres de las colecciones de db.py que lee la función ('incomes', 'expenses', 'goals').
+    El resultado guardado se devuelve tal cual: quien lo recibe no debe modificarlo.
+    '''
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            key = (function.__name__,) + tuple(tuple(arg) if isinstance(arg, list) else arg for arg in args)
+            if kwargs:
+                key += tuple(sorted(kwargs.items()))
+            versions = tuple(collection_version(name) for name in collections)
+            entry = _memo.pop(key, None)
+            if entry is not None and entry[0] == versions:
+                _memo_stats["hits"] += 1
+                _memo[key] = entry
+                return entry[1]
+            _memo_stats["misses"] += 1
+            result = function(*args, **kwargs)
+            _memo[key] = (versions, result)
+            while len(_memo) > MEMO_MAX_ENTRIES:
+                _memo.pop(next(iter(_memo)))
+            return result
+        return wrapper
+    return decorator
+
+
+def invalidate(username=None):
+    '''
+    Descarta los resultados guardados en el memo: todos, o solo los de username si se lo pasa.
+    Las escrituras hechas con db.py ya invalidan solas; esto es para cuando los datos cambian por otro lado.
+    '''
+    if username is None:
+        _memo.clear()
+        return
+    for key in [key for key in _memo if len(key) > 1 and key[1] == username]:
+        _memo.pop(key)
+
+
+def memo_stats():
+    '''
+    Devuelve un dict con hits, misses y cantidad de entradas del memo de métricas.
+    '''
+    return {"hits": _memo_stats["hits"], "misses": _memo_stats["misses"], "entries": len(_memo)}
 
 
 
@@ -17,21 +92,10 @@ def calculate_monthly_savings(username, month, year):
     '''
     -Calcula el ahorro (ingresos - egresos) del usuario `username`
     para el mes `month` y año `year`.
+    - Usa el rollup mensual de db.py: no recorre los movimientos.
     - Devuelve float (positivo/negativo/0.0).
     '''
-    total_in = 0.0
-    for inc in incomes_by_user(username):
-        parsed = convert_to_tuple(inc.get("date"))
-        if parsed and (parsed[1], parsed[2]) == (month, year):
-            total_in = total_in + float(inc.get("amount", 0.0))
-
-    total_out = 0.0
-    for exp in  expenses_by_user(username):
-        parsed = convert_to_tuple(exp.get("date"))
-        if parsed and (parsed[1], parsed[2]) == (month, year):
-            total_out = total_out + float(exp.get("amount", 0.0))
-
-    return total_in - total_out
+    return total_incomes_for_month(username, month, year) - total_expenses_for_month(username, month, year)
 
 
 def percent_change_in_savings(username, month1, year1, month2, year2):
@@ -63,26 +127,13 @@ def average_expense_by_category(username, month, year):
     """
     Calcula el porcentaje de gasto por categoría para un usuario.
     - Proceso:
-        1. Filtra egresos del usuario para el mes/año dados
-        2. Agrupa por categoría y acumula el total por categoría
-        3. Calcula porcentaje = (suma_categoria / total_gastos) * 100
+        1. Toma del rollup mensual el total por categoría de los egresos del usuario para el mes/año dados
+        2. Calcula porcentaje = (suma_categoria / total_gastos) * 100
     
     Devuelve el porcentaje que representa cada categoría del total de gastos.
     """
-    category_totals = {}
-    total_expenses = 0.0
-        
-    for exp in expenses_by_user(username):
-        parsed = convert_to_tuple(exp.get("date"))
-        if parsed:
-            if (parsed[1] == month and parsed[2] == year):
-                cat = exp.get("category", "otros")
-                amount = exp.get("amount")
-                if cat in category_totals:
-                    category_totals[cat] = category_totals[cat] + amount
-                else:
-                    category_totals[cat] = amount
-                total_expenses += amount
+    category_totals = expenses_month_totals(username, month, year)
+    total_expenses = sum(category_totals.values(), 0.0)
     
     percentages = {}
     if total_expenses > 0:
@@ -98,14 +149,9 @@ def total_incomes_for_month(username, month, year):
     username: str que corresponde al nombre de usuario
     month: int para el mes
     year: para el año
-    Trae todos los incomes para ese username y devuelve la suma total de los incomes correspondintes al mes y año recibidos
+    Devuelve la suma total de los incomes de ese username correspondintes al mes y año recibidos (sale del rollup mensual)
     '''
-    total = 0.0
-    for inc in incomes_by_user(username):
-        parsed = convert_to_tuple(inc.get("date"))
-        if parsed and (parsed[1], parsed[2]) == (month, year):
-            total += float(inc.get("amount", 0.0))
-    return total
+    return sum(incomes_month_totals(username, month, year).values(), 0.0)
 
 def total_expenses_for_month(username, month, year):
     '''
@@ -114,35 +160,45 @@ def total_expenses_for_month(username, month, year):
     username: str que corresponde al nombre de usuario
     month: int para el mes
     year: para el año
-    Trae todos los expenses para ese username y devuelve la suma total de las expenses correspondintes al mes y año recibidos
+    Devuelve la suma total de las expenses de ese username correspondintes al mes y año recibidos (sale del rollup mensual)
     '''
-    total = 0.0
-    for exp in expenses_by_user(username):
-        parsed = convert_to_tuple(exp.get("date"))
-        if parsed and (parsed[1], parsed[2]) == (month, year):
-            total += float(exp.get("amount", 0.0))
-    return total
+    return sum(expenses_month_totals(username, month, year).values(), 0.0)
 
+@_memoized("incomes")
 def total_incomes_all_time(username):
     '''    
     username: str que corresponde al nombre de usuario
     Devuelve todos los incomes pertenecientes al usuario que recibe por parametro, si no existen o no existe el usuario devuelve None
     '''
     total = 0.0
-    for inc in incomes_by_user(username):
+    for inc in incomes_iter_by_user(username):
         total += float(inc.get("amount", 0.0))
     return total
 
+@_memoized("expenses")
 def total_expenses_all_time(username):
     '''    
     username: str que corresponde al nombre de usuario
     Devuelve todos los expenses pertenecientes al usuario que recibe por parametro, si no existen o no existe el usuario devuelve None
     '''
     total = 0.0
-    for exp in expenses_by_user(username):
+    for exp in expenses_iter_by_user(username):
         total += float(exp.get("amount", 0.0))
     return total
 
+def net_between(username, start_date=None, end_date=None):
+    '''
+    username: str que corresponde al nombre de usuario
+    start_date, end_date: str "dd/mm/yyyy" (inclusive). None deja ese extremo abierto
+    Devuelve el balance neto (ingresos - egresos) del usuario entre esas fechas, o None si alguna fecha no es válida.
+    Sale del índice diario de db.py: dos búsquedas binarias por colección, no recorre los movimientos.
+    '''
+    incomes = incomes_between(username, start_date, end_date)
+    expenses = expenses_between(username, start_date, end_date)
+    if incomes is None or expenses is None:
+        return None
+    return incomes - expenses
+
 def compute_goal_status(total_amount, saved_amount):
     """
     Devuelve el estado de una meta según su progreso:
@@ -164,6 +220,7 @@ def compute_goal_status(total_amount, saved_amount):
     else:
         return "Completado"
 
+@_memoized("goals")
 def goals_summary(username):
     """
     Recibe
@@ -220,6 +277,77 @@ def goals_summary(username):
 
     return summary
 
+@_memoized("incomes", "expenses")
+def aggregate_movements(username, periods):
+    '''
+    Recibe username y periods, una lista de tuplas (month, year).
+    Devuelve los totales del usuario descritos en _aggregate_movements_python. Si NumPy está instalado y el usuario
+    tiene al menos NUMPY_MIN_ROWS movimientos, los calcula numpy_backend sobre los ledgers columnares de db.py
+    (mismos resultados, sumados en el mismo orden). Solo si db.movements_ledger_ready indica que los ledgers
+    no se reconstruyen en cada llamada: armarlos recorre la colección entera, no solo las filas del usuario.
+    '''
+    import numpy_backend
+    if numpy_backend.available() and movements_ledger_ready("incomes") and movements_ledger_ready("expenses"):
+        rows = movements_count("incomes", username) + movements_count("expenses", username)
+        if rows >= NUMPY_MIN_ROWS:
+            return numpy_backend.aggregate_movements(
+                movements_ledger("incomes"), movements_ledger("expenses"), username, list(periods)
+            )
+    return _aggregate_movements_python(username, periods)
+
+def _aggregate_movements_python(username, periods):
+    '''
+    Recibe username y periods, una lista de tuplas (month, year).
+    Recorre una sola vez los ingresos y una sola vez los egresos del usuario y devuelve un dict con:
+    - total_in_all / total_out_all: totales históricos
+    - incomes / expenses: dict {(month, year): total} para cada período de periods
+    - categories: dict {(month, year): {categoria: total}} con los egresos de cada período
+    El mes de cada fila se resuelve comparando su date_ordinal con el primer y el último día de cada período,
+    sin volver a parsear la fecha. Las filas sin fecha válida solo suman a los totales históricos.
+    '''
+    bounds = []
+    for period in periods:
+        first, last = month_bounds(period[0], period[1])
+        bounds.append((first, last, period))
+
+    result = {
+        "total_in_all": 0.0,
+        "total_out_all": 0.0,
+        "incomes": {period: 0.0 for period in periods},
+        "expenses": {period: 0.0 for period in periods},
+        "categories": {period: {} for period in periods}
+    }
+
+    incomes = result["incomes"]
+    total = 0.0
+    for inc in incomes_iter_by_user(username):
+        amount = float(inc.get("amount", 0.0))
+        total += amount
+        ordinal = row_date_ordinal(inc) or 0
+        for first, last, period in bounds:
+            if first <= ordinal <= last:
+                incomes[period] += amount
+                break
+    result["total_in_all"] = total
+
+    expenses = result["expenses"]
+    categories = result["categories"]
+    total = 0.0
+    for exp in expenses_iter_by_user(username):
+        amount = float(exp.get("amount", 0.0))
+        total += amount
+        ordinal = row_date_ordinal(exp) or 0
+        for first, last, period in bounds:
+            if first <= ordinal <= last:
+                expenses[period] += amount
+                totals = categories[period]
+                cat = exp.get("category", "otros")
+                totals[cat] = totals.get(cat, 0.0) + amount
+                break
+    result["total_out_all"] = total
+
+    return result
+
 def build_dashboard_metrics(username):
     """
     Arma todas las métricas necesarias para el dashboard:
@@ -228,22 +356,17 @@ def build_dashboard_metrics(username):
     - Mes anterior: ahorro y cambio %
     - Resumen de metas
     - Distribución de egresos por categoría (mes actual)
+    Los ingresos y egresos se leen una sola vez (ver aggregate_movements), y si ninguna colección
+    cambió desde la última llamada para el mismo mes se devuelve el resultado guardado en el memo.
     """
     today = datetime.today()
-    month = today.month
-    year = today.year
-
-    # Totales históricos
-    total_in_all = total_incomes_all_time(username)
-    total_out_all = total_expenses_all_time(username)
-    savings_all = total_in_all - total_out_all
-
-    # Mes actual
-    total_in = total_incomes_for_month(username, month, year)
-    total_out = total_expenses_for_month(username, month, year)
-    savings_current = total_in - total_out
+    return _dashboard_metrics(username, today.month, today.year)
 
-    # Mes anterior
+@_memoized("incomes", "expenses", "goals")
+def _dashboard_metrics(username, month, year):
+    '''
+    Arma las métricas de build_dashboard_metrics tomando (month, year) como mes actual.
+    '''
     if month == 1:
         prev_month = 12
         prev_year = year - 1
@@ -251,7 +374,20 @@ def build_dashboard_metrics(username):
         prev_month = month - 1
         prev_year = year
 
-    savings_prev = calculate_monthly_savings(username, prev_month, prev_year)
+    totals = aggregate_movements(username, [(month, year), (prev_month, prev_year)])
+
+    # Totales históricos
+    total_in_all = totals["total_in_all"]
+    total_out_all = totals["total_out_all"]
+    savings_all = total_in_all - total_out_all
+
+    # Mes actual
+    total_in = totals["incomes"][(month, year)]
+    total_out = totals["expenses"][(month, year)]
+    savings_current = total_in - total_out
+
+    # Mes anterior
+    savings_prev = totals["incomes"][(prev_month, prev_year)] - totals["expenses"][(prev_month, prev_year)]
 
     # Cambio porcentual
     change_pct = None
@@ -265,7 +401,10 @@ def build_dashboard_metrics(username):
     goals_info = goals_summary(username)
 
     # Distribución de egresos por categoría (mes actual)
-    expenses_distribution = average_expense_by_category(username, month, year)
+    expenses_distribution = {}
+    if total_out > 0:
+        for category, amount in totals["categories"][(month, year)].items():
+            expenses_distribution[category] = (amount / total_out) * 100.0
 
     return {
         "month": month,
@@ -294,9 +433,13 @@ __all__ = [
     "total_expenses_for_month",
     "total_incomes_all_time",
     "total_expenses_all_time",
+    "net_between",
     "compute_goal_status",
     "goals_summary",
+    "aggregate_movements",
     "build_dashboard_metrics",
+    "invalidate",
+    "memo_stats",
 ]
 
 
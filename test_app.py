@@ -2,6 +2,8 @@ import pytest
 import os
 import json
 
+import db
+
 from index import (
     register_user,
     login,
@@ -9,7 +11,28 @@ from index import (
     insertExpenses,
     insertGoals,
 )
-from db import USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE, ensure_db_files
+from db import (
+    ensure_db_files,
+    read_collection,
+    cache_stats,
+    cache_clear,
+    compact_collection,
+    incomes_by_user,
+    incomes_update,
+    incomes_delete,
+    get_by_id,
+)
+
+
+@pytest.fixture(autouse=True)
+def test_database_dir(tmp_path):
+    """
+    Cada prueba usa una carpeta de datos temporal (ver db.set_db_dir), así nunca se toca ./data.
+    """
+    original_dir = db.DB_DIR
+    db.set_db_dir(str(tmp_path))
+    yield
+    db.set_db_dir(original_dir)
 
 
 def setup_test_database():
@@ -17,10 +40,13 @@ def setup_test_database():
     Función de ayuda para limpiar la base de datos antes de una prueba.
     """
     ensure_db_files()
-    for db_file in [USERS_FILE, INCOMES_FILE, EXPENSES_FILE, GOALS_FILE]:
+    for db_file in [db.USERS_FILE, db.INCOMES_FILE, db.EXPENSES_FILE, db.GOALS_FILE]:
         if os.path.exists(db_file):
             with open(db_file, "w") as f:
                 json.dump([], f)
+        for side_file in (db._journal_path(db_file), db._checksum_path(db_file), db._last_good_path(db_file)):
+            if os.path.exists(side_file):
+                os.remove(side_file)
 
 
 #  Pruebas para Autenticación (Auth) 
@@ -74,4 +100,747 @@ def test_insert_goal_success():
     setup_test_database()
     register_user("testuser", "pass123", "pass123", 30, "M")
     goal = {"name": "Viaje", "category": "Viaje", "total_amount": 500.0, "saved_amount": 50.0, "end_date": "01/01/2026", "status": "Iniciado", "user": "testuser"}
-    assert insertGoals(goal)[0] == True
\ No newline at end of file
+    assert insertGoals(goal)[0] == True
+#  Pruebas para la capa de datos (db.py)
+
+def test_read_collection_uses_cache_until_file_changes():
+    """Prueba que las lecturas repetidas salen de la caché y que una escritura la refresca."""
+    setup_test_database()
+    cache_clear()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 100.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+
+    before = cache_stats()
+    rows = read_collection(db.INCOMES_FILE)
+    assert len(rows) == 1
+    assert cache_stats()["hits"] == before["hits"] + 1
+    assert cache_stats()["misses"] == before["misses"]
+
+    with open(db.INCOMES_FILE, "w") as f:
+        json.dump([], f)
+    assert read_collection(db.INCOMES_FILE) == []
+
+def test_journal_mode_appends_inserts_and_compacts():
+    """Prueba que con el journal activo los inserts van al .jsonl y la compactación los vuelca al .json."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    db.JOURNAL_MODE = True
+    try:
+        insertExpenses({"amount": 10.0, "category": "Otros", "date": "01/07/2024", "user": "testuser"})
+        insertExpenses({"amount": 20.0, "category": "Otros", "date": "02/07/2024", "user": "testuser"})
+
+        with open(db.EXPENSES_FILE) as f:
+            assert json.load(f) == []
+        assert [row["id"] for row in read_collection(db.EXPENSES_FILE)] == ["1", "2"]
+
+        assert compact_collection("expenses") == True
+        assert not os.path.exists(db._journal_path(db.EXPENSES_FILE))
+        with open(db.EXPENSES_FILE) as f:
+            assert len(json.load(f)) == 2
+    finally:
+        db.JOURNAL_MODE = False
+        compact_collection("expenses")
+
+def test_next_id_uses_counter_and_recovers_when_missing():
+    """Prueba que los ids siguen el contador persistido y que sin counters.json no se reusan ids borrados."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    income = {"amount": 100.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"}
+    assert insertIncome(income)[1]["id"] == "1"
+    assert insertIncome(income)[1]["id"] == "2"
+
+    # El contador se guarda con la escritura de la colección (en su .sum), no en counters.json
+    assert db._load_checksums(db.INCOMES_FILE)["last_id"] == 2
+    assert not os.path.exists(db.COUNTERS_FILE)
+
+    # Sin counters.json (un corte antes de terminar) el id borrado más alto no se vuelve a asignar
+    incomes_delete("2")
+    db._counters.clear()
+    assert insertIncome(income)[1]["id"] == "3"
+    db.TOMBSTONE_DELETES = True
+    try:
+        incomes_delete("3")
+        db._counters.clear()
+        assert insertIncome(income)[1]["id"] == "4"
+    finally:
+        db.TOMBSTONE_DELETES = False
+
+    db._save_counters()
+    with open(db.COUNTERS_FILE) as f:
+        assert json.load(f)["incomes.json"]["last_id"] == 4
+
+def test_incomes_by_user_follows_inserts_and_updates():
+    """Prueba que el índice por usuario se mantiene al insertar y al cambiar el usuario de un ingreso."""
+    setup_test_database()
+    register_user("ana", "pass123", "pass123", 30, "F")
+    register_user("beto", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "ana"})
+    insertIncome({"amount": 20.0, "category": "Salario", "date": "15/07/2024", "user": "beto"})
+    assert [row["id"] for row in incomes_by_user("ana")] == ["1"]
+
+    insertIncome({"amount": 30.0, "category": "Regalo", "date": "16/07/2024", "user": "ana"})
+    assert [row["id"] for row in incomes_by_user("ana")] == ["1", "3"]
+
+    incomes_update({"id": "1", "amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "beto"})
+    assert [row["id"] for row in incomes_by_user("ana")] == ["3"]
+    assert [row["id"] for row in incomes_by_user("beto")] == ["1", "2"]
+
+    # Actualizar un id que no existe no cambia nada y lo informa
+    assert incomes_update({"id": "999", "amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "ana"}) == \
+        (False, "no existe ingreso con id 999")
+    assert db.expenses_update({"id": "999", "amount": 10.0, "category": "Otros", "date": "15/07/2024", "user": "ana"})[0] == False
+
+def test_get_by_id_after_delete():
+    """Prueba la búsqueda por id y que un registro borrado deja de encontrarse."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+    insertIncome({"amount": 20.0, "category": "Regalo", "date": "16/07/2024", "user": "testuser"})
+
+    assert get_by_id("incomes", "2")["amount"] == 20.0
+    assert incomes_delete("1")[0] == True
+    assert get_by_id("incomes", "1") is None
+    assert get_by_id("incomes", 2)["category"] == "Regalo"
+    assert get_by_id("coleccion", "1") is None
+
+def test_sqlite_backend_keeps_db_api():
+    """Prueba que con el backend sqlite la API de db.py se comporta igual, partiendo de una migración."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+
+    assert db.migrate_json_to_sqlite()["incomes"] == 1
+    assert db.set_storage_backend("sqlite") == True
+    try:
+        assert insertIncome({"amount": 20.0, "category": "Regalo", "date": "16/07/2024", "user": "testuser"})[1]["id"] == "2"
+        assert [row["amount"] for row in incomes_by_user("testuser")] == [10.0, 20.0]
+        assert incomes_update({"id": "2", "amount": 25.0, "category": "Regalo", "date": "16/07/2024", "user": "testuser"})[0] == True
+        assert get_by_id("incomes", "2")["amount"] == 25.0
+        assert db.incomes_month_totals("testuser", 7, 2024) == {"Salario": 10.0, "Regalo": 25.0}
+        assert db.incomes_between("testuser", "16/07/2024", "31/07/2024") == 25.0
+        assert db.incomes_month_totals("testuser", 8, 2024) == {}
+        assert db._replace_row(db.INCOMES_FILE, "abc", {"id": "abc"}) == False
+        assert incomes_delete("1")[0] == True
+        assert [row["id"] for row in incomes_by_user("testuser")] == ["2"]
+        assert login("testuser", "pass123") == True
+        # Borrar la fila con el id más alto no hace que su id se vuelva a asignar.
+        assert incomes_delete("2")[0] == True
+        assert insertIncome({"amount": 5.0, "category": "Regalo", "date": "17/07/2024", "user": "testuser"})[1]["id"] == "3"
+    finally:
+        db.set_storage_backend("json")
+
+def test_failed_write_keeps_previous_file():
+    """Prueba que si una escritura falla a mitad de camino el archivo anterior queda intacto."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+
+    with pytest.raises(TypeError):
+        db._write_collection(db.INCOMES_FILE, [{"id": "1", "amount": object()}])
+
+    with open(db.INCOMES_FILE) as f:
+        assert len(json.load(f)) == 1
+    assert not os.path.exists(db.INCOMES_FILE + ".tmp")
+    assert len(read_collection(db.INCOMES_FILE)) == 1
+
+def test_corrupted_collection_recovers_last_good():
+    """Prueba que un archivo que no coincide con su checksum se recupera desde el último snapshot bueno."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+    insertIncome({"amount": 20.0, "category": "Salario", "date": "16/07/2024", "user": "testuser"})
+    assert db.verify_collections()["incomes.json"] == "ok"
+
+    with open(db.INCOMES_FILE, "w") as f:
+        f.write('[{"id": "1", "amou')
+    report = ensure_db_files()
+    assert report["incomes.json"] == "recuperado"
+    assert [row["amount"] for row in read_collection(db.INCOMES_FILE)] == [10.0]
+    assert os.path.exists(db.INCOMES_FILE + ".corrupt")
+
+    # También al leer: un archivo que no se puede parsear se recupera en el momento
+    with open(db.INCOMES_FILE, "w") as f:
+        f.write("basura")
+    assert [row["amount"] for row in read_collection(db.INCOMES_FILE)] == [10.0]
+    os.remove(db.INCOMES_FILE + ".corrupt")
+
+    # Sin snapshot bueno la colección no se lee como vacía ni se pisa con la próxima escritura
+    os.remove(db._last_good_path(db.INCOMES_FILE))
+    with open(db.INCOMES_FILE, "w") as f:
+        f.write("basura")
+    with pytest.raises(db.CollectionIntegrityError):
+        read_collection(db.INCOMES_FILE)
+    with pytest.raises(db.CollectionIntegrityError):
+        insertIncome({"amount": 5.0, "category": "Salario", "date": "17/07/2024", "user": "testuser"})
+    assert ensure_db_files()["incomes.json"] == "dañado"
+    with open(db.INCOMES_FILE) as f:
+        assert f.read() == "basura"
+
+def test_hand_edited_collection_is_accepted():
+    """Prueba que un archivo editado por fuera que sigue siendo JSON válido se lee, pero no se escribe hasta aceptarlo."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+    insertIncome({"amount": 20.0, "category": "Salario", "date": "16/07/2024", "user": "testuser"})
+    rows = read_collection(db.INCOMES_FILE)
+    rows[0]["amount"] = 1.0
+    with open(db.INCOMES_FILE, "w") as f:
+        json.dump(rows, f)
+    assert ensure_db_files()["incomes.json"] == "modificado"
+    assert [row["amount"] for row in read_collection(db.INCOMES_FILE)] == [1.0, 20.0]
+    assert db.verify_collections()["incomes.json"] == "modificado"
+    with pytest.raises(db.CollectionIntegrityError):
+        insertIncome({"amount": 5.0, "category": "Salario", "date": "17/07/2024", "user": "testuser"})
+
+    assert db.accept_collection_changes("expenses.json") == False
+    assert db.accept_collection_changes("incomes.json") == True
+    assert db.verify_collections()["incomes.json"] == "ok"
+    assert insertIncome({"amount": 5.0, "category": "Salario", "date": "17/07/2024", "user": "testuser"})[1]["id"] == "3"
+
+    # Un tombstone dañado en el journal no se pierde en silencio
+    db.TOMBSTONE_DELETES = True
+    try:
+        assert db.incomes_delete("3")[0] == True
+    finally:
+        db.TOMBSTONE_DELETES = False
+    journal = db._journal_path(db.INCOMES_FILE)
+    with open(journal) as f:
+        line = f.read()
+    with open(journal, "w") as f:
+        f.write(line.replace('"3"', '"2"'))
+    assert db.verify_collections()["incomes.jsonl"] == "dañado"
+    with open(journal + ".corrupt") as f:
+        assert f.read() == line.replace('"3"', '"2"')
+    os.remove(journal + ".corrupt")
+
+def test_group_commit_coalesces_writes():
+    """Prueba que con group commit las escrituras quedan pendientes hasta el flush, pero se ven al leer."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    db.GROUP_COMMIT_MS = 60000
+    try:
+        insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+        insertIncome({"amount": 20.0, "category": "Salario", "date": "16/07/2024", "user": "testuser"})
+        with open(db.INCOMES_FILE) as f:
+            assert json.load(f) == []
+        assert len(incomes_by_user("testuser")) == 2
+
+        db.flush_pending_writes()
+        with open(db.INCOMES_FILE) as f:
+            assert len(json.load(f)) == 2
+    finally:
+        db.GROUP_COMMIT_MS = 0
+        db.flush_pending_writes()
+
+def test_group_commit_flush_does_not_lose_writes():
+    """Prueba que el flush del group commit en otro hilo no pisa inserts hechos mientras escribe."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    with open(db.INCOMES_FILE, "w") as f:
+        json.dump([{"id": str(i + 1), "amount": 1.0, "category": "Salario", "date": "01/07/2024", "user": "testuser"}
+                   for i in range(1000)], f)
+    original_limit = db.CACHE_MAX_BYTES
+    db.CACHE_MAX_BYTES = 1
+    db.GROUP_COMMIT_MS = 2
+    try:
+        for _ in range(200):
+            assert insertIncome({"amount": 2.0, "category": "Salario", "date": "02/07/2024", "user": "testuser"})[0] == True
+    finally:
+        db.GROUP_COMMIT_MS = 0
+        db.CACHE_MAX_BYTES = original_limit
+        db.flush_pending_writes()
+    with open(db.INCOMES_FILE) as f:
+        assert len(json.load(f)) == 1200
+
+def test_incomes_insert_many_reports_per_record():
+    """Prueba la carga masiva: ids contiguos para los válidos y motivo para los inválidos."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    results = db.incomes_insert_many([
+        {"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"},
+        {"amount": -5.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"},
+        {"amount": 30.0, "category": "Regalo", "date": "16/07/2024", "user": "testuser"},
+    ])
+
+    assert [ok for ok, _ in results] == [True, False, True]
+    assert [results[0][1]["id"], results[2][1]["id"]] == ["1", "2"]
+    assert results[1][1] == "amount debe ser mayor a 0"
+    assert len(incomes_by_user("testuser")) == 2
+
+def test_transaction_commits_once_and_rolls_back_on_error():
+    """Prueba que la transacción escribe todo junto al final y que una excepción descarta los cambios."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    income = {"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"}
+
+    with db.transaction():
+        insertIncome(income)
+        insertIncome(income)
+        assert len(incomes_by_user("testuser")) == 2
+        with open(db.INCOMES_FILE) as f:
+            assert json.load(f) == []
+    assert len(read_collection(db.INCOMES_FILE)) == 2
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            insertIncome(income)
+            incomes_delete("1")
+            raise RuntimeError("falla a mitad de la transacción")
+    assert [row["id"] for row in read_collection(db.INCOMES_FILE)] == ["1", "2"]
+    assert insertIncome(income)[1]["id"] == "3"
+
+def test_transaction_copies_each_collection_once():
+    """Prueba que dentro de una transacción las escrituras modifican la misma copia en staging y no la caché."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    income = {"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"}
+    insertIncome(income)
+    cached = db._cached_rows(db.INCOMES_FILE)
+
+    with db.transaction():
+        insertIncome(income)
+        staged = db._cached_rows(db.INCOMES_FILE)
+        assert staged is not cached
+        assert incomes_update({"id": "2", "amount": 20.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})[0] == True
+        assert db.incomes_update_where({"amount": -1.0}, user="testuser")[0] == False
+        assert incomes_delete("1")[0] == True
+        assert db._cached_rows(db.INCOMES_FILE) is staged
+        assert [row["amount"] for row in staged] == [20.0]
+        assert db.get_by_id("incomes", "2")["amount"] == 20.0
+        assert [row["id"] for row in cached] == ["1"]
+    assert [(row["id"], row["amount"]) for row in read_collection(db.INCOMES_FILE)] == [("2", 20.0)]
+
+def test_validators_accept_user_name_set():
+    """Prueba que los validadores aceptan tanto la lista de usuarios como un set de nombres."""
+    from validations import validate_income
+    income = {"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"}
+    assert validate_income(income, ["Salario"], [{"name": "testuser"}]) == (True, None)
+    assert validate_income(income, ["Salario"], {"testuser"}) == (True, None)
+    assert validate_income(income, ["Salario"], {"otro"})[0] == False
+
+def test_user_name_set_follows_new_users():
+    """Prueba que un usuario recién registrado ya puede cargar movimientos."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    expense = {"amount": 10.0, "category": "Otros", "date": "15/07/2024", "user": "nuevo"}
+    assert insertExpenses(expense)[0] == False
+    register_user("nuevo", "pass123", "pass123", 30, "F")
+    assert insertExpenses(expense)[0] == True
+
+def test_movements_ledger_aggregates_like_rows():
+    """Prueba que el ledger columnar suma lo mismo que recorrer los egresos del usuario."""
+    import ledger
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertExpenses({"amount": 10.0, "category": "Otros", "date": "15/07/2024", "user": "testuser"})
+    insertExpenses({"amount": 5.5, "category": "Vivienda", "date": "20/07/2024", "user": "testuser"})
+    insertExpenses({"amount": 7.0, "category": "Otros", "date": "01/08/2024", "user": "testuser"})
+
+    expenses = db.movements_ledger("expenses")
+    assert ledger.ledger_size(expenses) == 3
+    assert ledger.sum_amounts(expenses, "testuser") == 22.5
+    assert ledger.sum_amounts(expenses, "testuser", 7, 2024) == 15.5
+    assert ledger.sum_by_category(expenses, "testuser", 7, 2024) == {"Otros": 10.0, "Vivienda": 5.5}
+    assert ledger.sum_amounts(expenses, "nadie") == 0.0
+
+    insertExpenses({"amount": 1.0, "category": "Otros", "date": "02/08/2024", "user": "testuser"})
+    assert ledger.ledger_size(db.movements_ledger("expenses")) == 4
+
+def test_movements_ledger_follows_writes():
+    """Prueba que las escrituras actualizan el ledger en memoria en lugar de reconstruirlo."""
+    import ledger
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    for i in range(5):
+        insertExpenses({"amount": 1.5 * (i + 1), "category": "Otros", "date": f"0{i + 1}/07/2024", "user": "testuser"})
+    expenses = db.movements_ledger("expenses")
+    assert db.movements_ledger_ready("expenses")
+
+    insertExpenses({"amount": 9.0, "category": "Vivienda", "date": "10/08/2024", "user": "testuser"})
+    db.expenses_update({"id": "2", "amount": 4.25, "category": "Salud", "date": "02/09/2024", "user": "testuser"})
+    db.expenses_delete("4")
+    assert db.movements_ledger("expenses") is expenses
+    fresh = ledger.build_ledger(db.read_collection(db.EXPENSES_FILE), db.expense_categories)
+    for column in ("id", "amount", "date", "month"):
+        assert list(expenses[column]) == list(fresh[column])
+    names = lambda built: [built["categories"][code] for code in built["category"]]
+    assert names(expenses) == names(fresh)
+
+    with db.transaction():
+        insertExpenses({"amount": 3.0, "category": "Otros", "date": "11/08/2024", "user": "testuser"})
+        assert not db.movements_ledger_ready("expenses")
+    assert ledger.ledger_size(db.movements_ledger("expenses")) == 6
+
+def test_ledger_delta_finds_rows_by_id_index():
+    """Prueba que los deltas del ledger buscan las filas con el índice por id y dejan lo mismo que reconstruirlo."""
+    import ledger
+    rows = [{"id": str(i + 1), "amount": float(i), "category": "Otros", "date": "01/07/2024", "user": "u"} for i in range(10)]
+    built = ledger.build_ledger(rows, db.expense_categories)
+
+    def apply(removed, added):
+        assert ledger.apply_ledger_delta(built, removed, added)
+        for row in removed:
+            if not added:
+                rows.remove(row)
+        for old_row, row in zip(removed, added):
+            rows[rows.index(old_row)] = row
+        if not removed:
+            rows.extend(added)
+
+    apply([rows[2]], [])
+    apply([rows[0]], [])
+    apply([], [{"id": "11", "amount": 11.0, "category": "Vivienda", "date": "02/07/2024", "user": "v"}])
+    apply([rows[5]], [dict(rows[5], amount=99.0)])
+    apply([rows[3]], [dict(rows[3], id="12")])
+    apply([rows[-1]], [])
+    assert "positions" in built and built["removed"] == [0, 2, 10]
+    fresh = ledger.build_ledger(rows, db.expense_categories)
+    for column in ledger.COLUMNS:
+        assert list(built[column]) == list(fresh[column])
+    assert ledger.apply_ledger_delta(built, [{"id": "3", "amount": 2.0, "date": "01/07/2024"}], []) == False
+
+def test_binary_ledger_round_trip():
+    """Prueba que exportar a binario e importar de nuevo deja los mismos egresos."""
+    import ledger
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    register_user("otro", "pass123", "pass123", 30, "F")
+    insertExpenses({"amount": 10.125, "category": "Otros", "date": "15/07/2024", "user": "testuser"})
+    insertExpenses({"amount": 5.5, "category": "Vivienda", "date": "20/07/2024", "user": "otro"})
+    original = read_collection(db.EXPENSES_FILE)
+
+    assert db.export_binary_ledger("expenses") == 2
+    binary = ledger.open_binary_ledger(db.binary_ledger_path("expenses"))
+    assert ledger.binary_rows_by_user(binary, "otro") == [original[1]]
+    assert ledger.binary_sum_amounts(binary) == 15.625
+    ledger.close_binary_ledger(binary)
+
+    with open(db.EXPENSES_FILE, "w") as f:
+        json.dump([], f)
+    assert insertExpenses({"amount": 1.0, "category": "Otros", "date": "21/07/2024", "user": "otro"})[1]["id"] == "3"
+    assert db.import_binary_ledger("expenses") == 2
+    assert read_collection(db.EXPENSES_FILE) == original
+    # El contador de ids se recalcula sobre la colección importada: no se repiten ni los importados
+    # ni el que se asignó antes de importar
+    assert insertExpenses({"amount": 1.0, "category": "Otros", "date": "21/07/2024", "user": "otro"})[1]["id"] == "4"
+    os.remove(db.binary_ledger_path("expenses"))
+
+def test_iter_collection_streams_large_collections():
+    """Prueba que una colección más grande que la caché se recorre en streaming, con el journal aplicado."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    register_user("otro", "pass123", "pass123", 30, "F")
+    for i in range(20):
+        user = "testuser" if i % 2 == 0 else "otro"
+        insertIncome({"amount": float(i + 1), "category": "Salario", "date": "01/07/2024", "user": user})
+    db.JOURNAL_MODE = True
+    original_limit, original_chunk = db.CACHE_MAX_BYTES, db.STREAM_CHUNK_SIZE
+    try:
+        incomes_update({"id": "1", "amount": 100.0, "category": "Salario", "date": "01/07/2024", "user": "testuser"})
+        insertIncome({"amount": 50.0, "category": "Salario", "date": "02/07/2024", "user": "otro"})
+        expected = read_collection(db.INCOMES_FILE)
+
+        db.CACHE_MAX_BYTES = 64
+        db.STREAM_CHUNK_SIZE = 7
+        cache_clear()
+        assert db._streaming(db.INCOMES_FILE)
+        assert list(db.iter_collection("incomes")) == expected
+        assert list(db.iter_collection("incomes", lambda row: row["amount"] > 15)) == [
+            row for row in expected if row["amount"] > 15
+        ]
+        assert incomes_by_user("otro") == [row for row in expected if row["user"] == "otro"]
+    finally:
+        db.CACHE_MAX_BYTES, db.STREAM_CHUNK_SIZE = original_limit, original_chunk
+        db.JOURNAL_MODE = False
+        compact_collection("incomes")
+
+def test_partitioned_layout_writes_only_its_month():
+    """Prueba la migración al layout por mes: cada insert escribe su partición y las consultas mensuales leen solo esa."""
+    import shutil
+    from service import total_expenses_for_month
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertExpenses({"amount": 10.0, "category": "Otros", "date": "15/06/2024", "user": "testuser"})
+    insertExpenses({"amount": 20.0, "category": "Otros", "date": "01/07/2024", "user": "testuser"})
+    partition_dir = db._partition_dir(db.EXPENSES_FILE)
+    try:
+        assert db.migrate_to_partitions() == {"incomes": 0, "expenses": 2}
+        assert not os.path.exists(db.EXPENSES_FILE)
+        assert sorted(name for name in os.listdir(partition_dir) if name.endswith(".json")) == ["2024-06.json", "2024-07.json"]
+
+        june = os.path.join(partition_dir, "2024-06.json")
+        june_stamp = db._file_stamp(june)
+        insertExpenses({"amount": 5.0, "category": "Otros", "date": "20/07/2024", "user": "testuser"})
+        assert db._file_stamp(june) == june_stamp
+        assert [row["id"] for row in read_collection(db.EXPENSES_FILE)] == ["1", "2", "3"]
+        assert total_expenses_for_month("testuser", 7, 2024) == 25.0
+
+        # Cambiar la fecha mueve la fila de partición
+        db.expenses_update({"id": "3", "amount": 5.0, "category": "Otros", "date": "20/06/2024", "user": "testuser"})
+        assert total_expenses_for_month("testuser", 6, 2024) == 15.0
+        assert db.expenses_delete("1")[0] == True
+        assert [row["id"] for row in db.expenses_iter_by_user_month("testuser", 6, 2024)] == ["3"]
+        assert get_by_id("expenses", "2")["amount"] == 20.0
+    finally:
+        rows = read_collection(db.EXPENSES_FILE)
+        shutil.rmtree(partition_dir, ignore_errors=True)
+        shutil.rmtree(db._partition_dir(db.INCOMES_FILE), ignore_errors=True)
+        ensure_db_files()
+        with open(db.EXPENSES_FILE, "w") as f:
+            json.dump(rows, f)
+
+def test_delete_appends_tombstone_until_compaction():
+    """Prueba que borrar agrega un tombstone al journal sin reescribir el archivo y que la compactación lo aplica."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+    insertIncome({"amount": 20.0, "category": "Regalo", "date": "16/07/2024", "user": "testuser"})
+    snapshot_stamp = db._file_stamp(db.INCOMES_FILE)
+
+    db.TOMBSTONE_DELETES = True
+    try:
+        assert incomes_delete("1")[0] == True
+        assert db._file_stamp(db.INCOMES_FILE) == snapshot_stamp
+        assert [row["id"] for row in incomes_by_user("testuser")] == ["2"]
+        cache_clear()
+        assert [row["id"] for row in read_collection(db.INCOMES_FILE)] == ["2"]
+        assert list(db._iter_json_collection(db.INCOMES_FILE)) == read_collection(db.INCOMES_FILE)
+
+        assert compact_collection("incomes") == True
+        assert not os.path.exists(db._journal_path(db.INCOMES_FILE))
+        with open(db.INCOMES_FILE) as f:
+            assert [row["id"] for row in json.load(f)] == ["2"]
+        assert insertIncome({"amount": 5.0, "category": "Otros", "date": "17/07/2024", "user": "testuser"})[1]["id"] == "3"
+
+        # Si después se apaga el modo, el primer ensure_db_files vuelca los tombstones que hayan quedado
+        assert incomes_delete("2")[0] == True
+    finally:
+        db.TOMBSTONE_DELETES = False
+    assert os.path.exists(db._journal_path(db.INCOMES_FILE))
+    ensure_db_files()
+    assert not os.path.exists(db._journal_path(db.INCOMES_FILE))
+    with open(db.INCOMES_FILE) as f:
+        assert [row["id"] for row in json.load(f)] == ["3"]
+
+def test_delete_and_update_where_apply_in_one_pass():
+    """Prueba los borrados y updates por filtro: cantidad afectada, rango de fechas inclusivo y validación."""
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    register_user("otro", "pass123", "pass123", 30, "F")
+    for date, user in (("30/06/2024", "testuser"), ("01/07/2024", "testuser"), ("31/07/2024", "testuser"), ("15/07/2024", "otro")):
+        insertExpenses({"amount": 10.0, "category": "Otros", "date": date, "user": user})
+
+    assert db.expenses_update_where({"amount": -1}, user="testuser")[0] == False
+    # Solo amount, category y date: ni el id, ni el dueño, ni campos que no son del esquema
+    for changes in ({"id": "9"}, {"user": "otro"}, {"date_ordinal": 1}, {"amount": 5.0, "nota": "x"}):
+        assert db.expenses_update_where(changes, user="testuser")[0] == False
+    assert [row["user"] for row in read_collection(db.EXPENSES_FILE)].count("otro") == 1
+    assert db.expenses_update_where({"category": "Vivienda"}, start_date="01/07/2024", end_date="31/07/2024") == (True, 3)
+    assert [row["category"] for row in read_collection(db.EXPENSES_FILE)] == ["Otros", "Vivienda", "Vivienda", "Vivienda"]
+
+    assert db.expenses_delete_where()[0] == False
+    assert db.expenses_delete_where(user="testuser", start_date="01/07/2024", end_date="31/07/2024") == (True, 2)
+    assert [row["id"] for row in read_collection(db.EXPENSES_FILE)] == ["1", "4"]
+    assert db.expenses_delete_where(category="Supermercado") == (True, 0)
+
+def test_date_ordinal_is_stored_and_backfilled():
+    """Prueba que los movimientos guardan date_ordinal y que el backfill completa las filas viejas."""
+    from datetime import date
+    from service import total_incomes_for_month
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 10.0, "category": "Salario", "date": "15/07/2024", "user": "testuser"})
+    assert read_collection(db.INCOMES_FILE)[0]["date_ordinal"] == date(2024, 7, 15).toordinal()
+
+    legacy = {"id": "2", "amount": 5.0, "category": "Regalo", "date": "31/07/2024", "user": "testuser"}
+    rows = read_collection(db.INCOMES_FILE) + [legacy]
+    with open(db.INCOMES_FILE, "w") as f:
+        json.dump(rows, f)
+    assert total_incomes_for_month("testuser", 7, 2024) == 15.0
+
+    assert db.backfill_date_ordinals() == {"incomes": 1, "expenses": 0}
+    assert get_by_id("incomes", "2")["date_ordinal"] == date(2024, 7, 31).toordinal()
+    assert db.backfill_date_ordinals() == {"incomes": 0, "expenses": 0}
+
+def test_startup_is_lazy(tmp_path):
+    """Prueba que el programa llega a la primera pregunta sin cargar db.py, y que db.py con json no carga sqlite ni el ledger."""
+    import sys
+    import subprocess
+    lazy = "('db', 'service', 'ledger', 'db_sqlite', 'sqlite3', 'numpy_backend')"
+    code = (
+        "import sys, index\n"
+        "try:\n"
+        "    index.main()\n"
+        "except EOFError:\n"
+        "    pass\n"
+        f"print(sorted(m for m in {lazy} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, stdin=subprocess.DEVNULL,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert "¿Ya posee una cuenta?" in output
+    assert output.strip().endswith("Seleccione una opción: []")
+
+    code = (
+        f"import sys, db; db.set_db_dir({str(tmp_path)!r}); db.ensure_db_files(); db.read_collection(db.INCOMES_FILE)\n"
+        f"print(sorted(m for m in {lazy} if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert output.strip() == "['db']"
+
+def test_import_csv_writes_valid_rows_and_rejects(tmp_path, monkeypatch):
+    """Prueba que el importador guarda las líneas válidas según el signo y copia las rechazadas aparte."""
+    import csv
+    import importer
+    from importer import import_csv
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    csv_path = tmp_path / "extracto.csv"
+    csv_path.write_text(
+        "fecha,monto,categoria,descripcion\n"
+        "15/07/2024,-120.5,Supermercado,Coto\n"
+        "2024-07-16,3000,Salario,Sueldo\n"
+        "31/02/2024,-10,Otros,fecha mala\n"
+        "17/07/2024,\"-1,5\",,sin categoria\n",
+        encoding="utf-8"
+    )
+
+    ok, report = import_csv(str(csv_path), "testuser", workers=1, chunk_size=2)
+    assert ok == True
+    assert (report["incomes"], report["expenses"], report["rejected"]) == (1, 2, 1)
+    assert [row["amount"] for row in db.expenses_by_user("testuser")] == [120.5, 1.5]
+    assert incomes_by_user("testuser")[0]["date"] == "16/07/2024"
+    with open(report["rejects_path"], newline="", encoding="utf-8") as f:
+        rejected = list(csv.reader(f))
+    assert rejected[1][:3] == ["4", "Fecha inválida (usar dd/mm/yyyy)", "31/02/2024"]
+
+    assert import_csv(str(csv_path), "nadie")[0] == False
+
+    # Con json un extracto más grande que JSON_IMPORT_MAX_BYTES se rechaza sin tocar las colecciones
+    monkeypatch.setattr(importer, "JSON_IMPORT_MAX_BYTES", 10)
+    ok, msg = import_csv(str(csv_path), "testuser", workers=1)
+    assert ok == False and "sqlite" in msg
+    assert len(db.expenses_by_user("testuser")) == 2
+
+def test_aggregate_movements_matches_separate_totals():
+    """Prueba que la pasada única de aggregate_movements da los mismos números que las funciones por separado."""
+    import service
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 100.0, "category": "Salario", "date": "10/06/2024", "user": "testuser"})
+    insertIncome({"amount": 50.0, "category": "Regalo", "date": "10/07/2024", "user": "testuser"})
+    insertExpenses({"amount": 30.0, "category": "Vivienda", "date": "01/07/2024", "user": "testuser"})
+    insertExpenses({"amount": 10.0, "category": "Otros", "date": "31/07/2024", "user": "testuser"})
+    insertExpenses({"amount": 5.0, "category": "Otros", "date": "01/01/2023", "user": "testuser"})
+
+    totals = service.aggregate_movements("testuser", [(7, 2024), (6, 2024)])
+    assert totals["total_in_all"] == service.total_incomes_all_time("testuser") == 150.0
+    assert totals["total_out_all"] == service.total_expenses_all_time("testuser") == 45.0
+    assert totals["incomes"][(7, 2024)] - totals["expenses"][(7, 2024)] == service.calculate_monthly_savings("testuser", 7, 2024)
+    assert totals["incomes"][(6, 2024)] == service.total_incomes_for_month("testuser", 6, 2024) == 100.0
+    assert totals["categories"][(7, 2024)] == {"Vivienda": 30.0, "Otros": 10.0}
+
+def test_monthly_rollup_follows_writes():
+    """Prueba que el rollup mensual se mantiene con cada escritura y coincide con reconstruirlo desde los movimientos."""
+    import service
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertExpenses({"amount": 10.0, "category": "Otros", "date": "15/06/2024", "user": "testuser"})
+    insertExpenses({"amount": 20.0, "category": "Vivienda", "date": "01/07/2024", "user": "testuser"})
+    assert db.expenses_month_totals("testuser", 7, 2024) == {"Vivienda": 20.0}
+
+    # Un update resta la fila vieja y suma la nueva
+    db.expenses_update({"id": "1", "amount": 5.0, "category": "Otros", "date": "20/07/2024", "user": "testuser"})
+    assert db.expenses_month_totals("testuser", 7, 2024) == {"Vivienda": 20.0, "Otros": 5.0}
+    assert db.expenses_month_totals("testuser", 6, 2024) == {}
+    assert db.expenses_delete("2")[0] == True
+    assert service.average_expense_by_category("testuser", 7, 2024) == {"Otros": 100.0}
+    assert db.rebuild_rollup()["expenses"] == 0
+
+    # Si la colección cambia por fuera de db.py el rollup se reconstruye
+    rows = read_collection(db.EXPENSES_FILE)
+    rows[0]["amount"] = 7.0
+    with open(db.EXPENSES_FILE, "w") as f:
+        json.dump(rows, f)
+    assert service.total_expenses_for_month("testuser", 7, 2024) == 7.0
+
+def test_net_between_uses_daily_index():
+    """Prueba que el balance neto por rango de fechas sigue los inserts, updates y deletes."""
+    import service
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    insertIncome({"amount": 100.0, "category": "Salario", "date": "01/06/2024", "user": "testuser"})
+    insertIncome({"amount": 50.0, "category": "Salario", "date": "10/06/2024", "user": "testuser"})
+    insertExpenses({"amount": 30.0, "category": "Otros", "date": "05/06/2024", "user": "testuser"})
+    insertExpenses({"amount": 20.0, "category": "Otros", "date": "10/06/2024", "user": "testuser"})
+    assert service.net_between("testuser", "01/06/2024", "30/06/2024") == 100.0
+    assert service.net_between("testuser", "02/06/2024", "09/06/2024") == -30.0
+    assert service.net_between("testuser", "10/06/2024", "10/06/2024") == 30.0
+    assert service.net_between("testuser") == 100.0
+    assert service.net_between("testuser", "11/06/2024", "01/06/2024") == 0.0
+    assert service.net_between("testuser", "31/02/2024") is None
+
+    db.expenses_update({"id": "1", "amount": 30.0, "category": "Otros", "date": "20/06/2024", "user": "testuser"})
+    assert service.net_between("testuser", "01/06/2024", "15/06/2024") == 130.0
+    assert db.incomes_delete("2")[0] == True
+    assert service.net_between("testuser", "01/06/2024", "15/06/2024") == 80.0
+    assert db.rebuild_rollup() == {"incomes": 0, "expenses": 0}
+
+def test_dashboard_memo_follows_write_versions():
+    """Prueba que las métricas se reusan mientras no cambian las colecciones y se recalculan si cambian."""
+    import service
+    from datetime import datetime
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    today = datetime.today().strftime("%d/%m/%Y")
+    insertIncome({"amount": 100.0, "category": "Salario", "date": today, "user": "testuser"})
+    first = service.build_dashboard_metrics("testuser")
+    hits = service.memo_stats()["hits"]
+    assert service.build_dashboard_metrics("testuser") is first
+    assert service.memo_stats()["hits"] > hits
+
+    # Una escritura con db.py sube la versión de la colección
+    insertExpenses({"amount": 40.0, "category": "Otros", "date": today, "user": "testuser"})
+    assert service.build_dashboard_metrics("testuser")["savings_current"] == 60.0
+
+    # Un rollback también invalida lo calculado con las filas de la transacción
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            insertExpenses({"amount": 10.0, "category": "Otros", "date": today, "user": "testuser"})
+            assert service.build_dashboard_metrics("testuser")["total_out"] == 50.0
+            raise RuntimeError("rollback")
+    assert service.build_dashboard_metrics("testuser")["total_out"] == 40.0
+
+    # Los cambios hechos por fuera de db.py se detectan por el stamp del archivo
+    with open(db.EXPENSES_FILE, "w") as f:
+        json.dump([], f)
+    assert service.build_dashboard_metrics("testuser")["total_out"] == 0.0
+
+def test_numpy_aggregation_matches_python(monkeypatch):
+    """Prueba que aggregate_movements con NumPy devuelve lo mismo que las funciones en Python puro."""
+    import service
+    import numpy_backend
+    setup_test_database()
+    register_user("testuser", "pass123", "pass123", 30, "M")
+    register_user("otheruser", "pass123", "pass123", 30, "F")
+    for i in range(60):
+        day = f"{(i % 28) + 1:02d}/{(i % 3) + 5:02d}/2024"
+        insertIncome({"amount": 10.1 * (i + 1), "category": "Salario", "date": day, "user": "testuser"})
+        insertExpenses({"amount": 0.7 * (i + 3), "category": db.expense_categories[i % 4], "date": day,
+                        "user": "testuser" if i % 5 else "otheruser"})
+    periods = [(5, 2024), (6, 2024), (8, 2024), (5, 2024)]
+    expected = service._aggregate_movements_python("testuser", periods)
+
+    monkeypatch.setattr(service, "NUMPY_MIN_ROWS", 0)
+    service.invalidate()
+    assert service.aggregate_movements("testuser", periods) == expected
+
+    pytest.importorskip("numpy")
+    result = numpy_backend.aggregate_movements(
+        db.movements_ledger("incomes"), db.movements_ledger("expenses"), "testuser", periods
+    )
+    assert result == expected
+    assert list(result["categories"][(6, 2024)]) == list(expected["categories"][(6, 2024)])
+    assert numpy_backend.aggregate_movements(
+        db.movements_ledger("incomes"), db.movements_ledger("expenses"), "nobody", periods
+    ) == service._aggregate_movements_python("nobody", periods)
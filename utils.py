@@ -6,7 +6,7 @@
 """
 
 from validations import is_valid_date
-import getpass
+# getpass se importa recién en input_password: no hace falta para mostrar la primera pregunta
 
 # --- Constantes de Colores ANSI ---
 COLORS = {
@@ -193,6 +193,7 @@ def input_password(message="Ingrese contraseña: ", min_length=6):#funcion para
     Valida que el valor ingresado no sea una cadena vacia y que tenga el largo minimo definido, pide reintentar hasta que se ingrese correctamente.
     Retorna el valor ingresado por el usuario de tipo str
     """
+    import getpass
     pwd = getpass.getpass(message).strip()
 
     if not pwd:
@@ -66,6 +66,17 @@ def is_valid_goal_date(date_str, max_years=50):
     return fecha <= max_date
 
 
+def _user_exists(username, users):
+    """
+    Recibe un username y users, que puede ser la lista de usuarios (dicts con "name")
+    o un conjunto ya armado con los nombres (set, frozenset o dict con los nombres como claves).
+    Con un conjunto la búsqueda no depende de la cantidad de usuarios.
+    Devuelve True si el usuario existe, False en caso contrario.
+    """
+    if isinstance(users, (set, frozenset, dict)):
+        return isinstance(username, str) and username in users
+    return any(user.get("name") == username for user in users)
+
 def validate_expense(expense, expense_categories, users):
     """
     Recibe expense de tipo dict.
@@ -74,6 +85,7 @@ def validate_expense(expense, expense_categories, users):
     - category válida
     - date en formato dd/mm/yyyy
     - user existente en users.json
+    users puede ser la lista de usuarios o un set con sus nombres.
     Devuelve (True, None) si es válido, o (False, "motivo") si no lo es.
     """
     if not isinstance(expense, dict):
@@ -93,7 +105,7 @@ def validate_expense(expense, expense_categories, users):
     if not is_valid_date(expense.get("date")):
         return (False, "Fecha inválida (usar dd/mm/yyyy)")
 
-    if not any(user.get("name") == expense.get("user") for user in users):
+    if not _user_exists(expense.get("user"), users):
         return (False, "El usuario que intenta realizar la operación no existe")
 
     return (True, None)
@@ -106,6 +118,7 @@ def validate_income(income, income_categories, users):
     - category válida
     - date en formato dd/mm/yyyy
     - user existente en users.json
+    users puede ser la lista de usuarios o un set con sus nombres.
     Devuelve (True, None) si es válido, o (False, "motivo") si no lo es.
     """
     if not isinstance(income, dict):
@@ -125,7 +138,7 @@ def validate_income(income, income_categories, users):
     if not is_past_or_today(income.get("date")):
         return (False, "Fecha inválida (usar dd/mm/yyyy y no puede ser futura)")
 
-    if not any(user.get("name") == income.get("user") for user in users):
+    if not _user_exists(income.get("user"), users):
         return (False, "El usuario que intenta realizar la operación no existe")
 
     return (True, None)
@@ -180,6 +193,7 @@ def validate_goal(goal, goal_categories, goals_status, users):
     saved_amount: de tipo float (Monto total que decide guardar el usuario)
     end_date: "dd/mm/yyyy" (fecha final, debe ser mayor a la fecha de inicio)
     status: string debe estar en la lista goals_status
+    users puede ser la lista de usuarios o un set con sus nombres.
     '''
     if not isinstance(goal, dict):
         return (False, "formato inválido")
@@ -216,7 +230,7 @@ def validate_goal(goal, goal_categories, goals_status, users):
     if goal.get("status") not in goals_status:
         return (False, "Estado inválido")
 
-    if not any(user.get("name") == goal.get("user") for user in users):
+    if not _user_exists(goal.get("user"), users):
         return (False, "El usuario que intenta realizar la operación no existe")
     
     return (True, None)